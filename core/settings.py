@@ -39,6 +39,16 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
+# Number of payroll entries processed by each worker in a payroll job
+PAYROLL_SHARD_SIZE = int(os.getenv("PAYROLL_SHARD_SIZE", "500"))
+
+# Payslips: output directory and number of rendering processes (default: CPU count)
+PAYSLIP_ROOT = os.getenv("PAYSLIP_ROOT", os.path.join(BASE_DIR, "payslips"))
+PAYSLIP_WORKERS = int(os.getenv("PAYSLIP_WORKERS", "0")) or None
+
+# Raise instead of logging a warning when a view exceeds its query budget (tests)
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() == "true"
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -101,6 +111,13 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", "redis://127.0.0.1:6379/1"),
+    }
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -1,4 +1,4 @@
-from django.db.models import Q
+from django.db.models import Q, QuerySet
 from rest_framework import serializers
 
 from helpers.utils import get_month_day_name
@@ -11,6 +11,30 @@ class ActivitySerializer(BaseModelSerializer):
     desc_action_flag = serializers.SerializerMethodField()
     verbose_name = serializers.SerializerMethodField()
 
+    FIELD_COLUMNS = {
+        "desc_action_flag": ("action_flag",),
+        "verbose_name": ("content_type",),
+    }
+
+    @classmethod
+    def prefetch(
+        cls, activities: QuerySet[ActivityLog], fields: list[str] = None
+    ) -> QuerySet[ActivityLog]:
+        """
+        Join the user and content type of the requested `fields`, all by default
+        """
+        relations = [
+            name
+            for name, wanted in (
+                ("username", ("username",)),
+                ("content_type", ("verbose_name",)),
+            )
+            if cls.wants(fields, *wanted)
+        ]
+        if relations:
+            return activities.select_related(*relations)
+        return activities
+
     def get_verbose_name(self, instance: ActivityLog):
         model_class = instance.content_type.model_class()
         return model_class._meta.verbose_name_plural
@@ -98,10 +122,10 @@ class SalaryByDepartmentSerializer(BaseSerializer):
     fill = serializers.CharField(source="department_color")
     department = serializers.CharField(source="department__name")
     uv = serializers.DecimalField(
-        source="total_salary", decimal_places=2, max_digits=10
+        source="total_salary", decimal_places=2, max_digits=16
     )
     pv = serializers.DecimalField(
-        source="average_salary", decimal_places=2, max_digits=10
+        source="average_salary", decimal_places=2, max_digits=16
     )
     percentage = serializers.DecimalField(
         source="percent", decimal_places=2, max_digits=10
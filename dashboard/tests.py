@@ -1,3 +1,52 @@
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.settings import PATH_BASE
+from helpers.cache import ReferenceCache
+from payroll.seeding import DataSeeder
+from users.models import User
+
+
+class RecentActivitiesTest(TestCase):
+    CONDITION = [
+        {"field": "action_flag", "operator": ">", "condition": 0, "dataType": "int"}
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        ReferenceCache.clear()
+        cls.admin = User.objects.create(
+            user_id=1,
+            name="Admin",
+            last_name="CompuPay",
+            email="admin@compupay.test",
+            username="admin",
+            is_staff=True,
+            salary=Decimal("75000.00"),
+        )
+        DataSeeder(cls.admin, seed=14).seed(30)
+
+    def setUp(self):
+        ReferenceCache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def count_queries(self, page_size: int) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                f"/{PATH_BASE}dashboard/get_recent_activities"
+                f"?page=1&page_size={page_size}",
+                {"condition": self.CONDITION},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()["data"]), page_size)
+        return len(queries)
 
-# Create your tests here.
+    def test_queries_do_not_grow_with_the_page(self):
+        self.count_queries(5)
+        self.assertEqual(self.count_queries(5), self.count_queries(40))
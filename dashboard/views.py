@@ -1,15 +1,7 @@
 import random
 from datetime import timedelta, datetime
 from django.utils.timezone import now
-from django.db.models import (
-    Count,
-    Sum,
-    Avg,
-    F,
-    Q,
-    ExpressionWrapper,
-    DecimalField,
-)
+from django.db.models import Count, Sum, Q
 from django.db.models.functions import ExtractDay, TruncMonth, ExtractMonth
 from rest_framework.request import Request
 from rest_framework.response import Response
@@ -28,6 +20,7 @@ from helpers.utils import (
     dict_key_to_lower,
 )
 from helpers.constants import colors
+from payroll.currency import CurrencyConverter
 from payroll.models import PayrollPaymentDetail
 from tasks.models import Task
 from users.models import ActivityLog, Department, User
@@ -41,10 +34,12 @@ class DashboardViewSet(BaseProtectedViewSet):
     @viewException
     def get_recent_activities(self, request: Request):
         """
+        `FIELDS` is an optional list with the fields to return.\n
         `METHOD` POST
         """
 
         condition = request.data.get("condition", None)
+        fields = request.data.get("fields", None)
         if not condition:
             raise PayloadValidationError("condition is requiered")
 
@@ -56,9 +51,12 @@ class DashboardViewSet(BaseProtectedViewSet):
             activities = activities.exclude(**ex)
 
         paginator = PaginationSerializer(request=request)
-        page = paginator.paginate_queryset(activities, request)
+        activities = ActivitySerializer.prefetch(activities, fields)
+        page = paginator.paginate_queryset(
+            ActivitySerializer.only(activities, fields), request
+        )
 
-        serializer = ActivitySerializer(page, many=True)
+        serializer = ActivitySerializer(page, many=True, fields=fields)
 
         return paginator.get_paginated_response(serializer.data)
 
@@ -180,28 +178,11 @@ class DashboardViewSet(BaseProtectedViewSet):
     @viewException
     def salary_by_department(self, _request: Request):
         """
-        This endpoint is used to get a salary distribution by department
+        This endpoint is used to get a salary distribution by department,
+        with the salaries converted to the base currency
         """
 
-        employees = User.get_employees()
-
-        total_salary_all_departments = employees.aggregate(total_salary=Sum("salary"))[
-            "total_salary"
-        ]
-
-        employees_by_department = (
-            employees.values("department__name")
-            .annotate(
-                department_color=F("department__color"),
-                total_salary=Sum("salary"),
-                average_salary=Avg("salary"),
-                percent=ExpressionWrapper(
-                    Sum("salary") * 100.0 / total_salary_all_departments,
-                    output_field=DecimalField(),
-                ),
-            )
-            .order_by("department__name")
-        )
+        employees_by_department = UserStatistics.salary_by_department()
 
         serializer = SalaryByDepartmentSerializer(employees_by_department, many=True)
 
@@ -210,11 +191,15 @@ class DashboardViewSet(BaseProtectedViewSet):
     @viewException
     def get_payroll_payment_detail(self, _request: Request):
         payroll_details = (
-            PayrollPaymentDetail.objects.annotate(
-                month=TruncMonth("payroll__period_end")
+            CurrencyConverter.annotate(
+                PayrollPaymentDetail.objects.all(),
+                "concept_amount",
+                "payroll_entry__user__currency",
+                "payroll__period_end",
             )
+            .annotate(month=TruncMonth("payroll__period_end"))
             .values("month", "concept__name")
-            .annotate(total_amount=Sum("concept_amount"))
+            .annotate(total_amount=Sum("base_amount"))
             .order_by("month")
         )
 
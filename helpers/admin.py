@@ -5,6 +5,7 @@ from django.utils import timezone
 from django.utils.html import format_html
 from django.contrib.admin.sites import AdminSite
 
+from helpers.sequences import IdAllocator
 from users.models import STATE_CHOICES
 
 
@@ -26,7 +27,8 @@ class BaseModelAdmin(admin.ModelAdmin):
         if not change:
             obj.created_by = request.user
             obj.created_at = timezone.now()
-            obj.pk = self.model.objects.count() + 1
+            if IdAllocator.supports(self.model):
+                obj.pk = IdAllocator.next_id(self.model)
 
         else:  # Si es una instancia existente
             obj.updated_by = request.user
@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Any, Callable
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class ReferenceCache:
+    """
+    Process-local cache for small reference tables.\n
+    Every loaded value is memoized in the process until the shared version
+    counter (stored in the default cache backend) changes. Any process can
+    invalidate all the others by calling `invalidate`, usually from a
+    `post_save`/`post_delete` signal.\n
+    The shared version is checked at most once every `CHECK_INTERVAL` seconds,
+    so a change made by another process is visible after that time at most.
+    """
+
+    VERSION_KEY = "reference:version"
+    CHECK_INTERVAL = 5
+
+    _lock = threading.Lock()
+    _values: dict[str, Any] = {}
+    _version: int = None
+    _checked_at: float = 0
+
+    @classmethod
+    def get_version(cls) -> int:
+        version = cache.get(cls.VERSION_KEY)
+        if version is None:
+            # Un valor nuevo evita confundirlo con una versión anterior a un desalojo
+            cache.add(cls.VERSION_KEY, time.time_ns(), None)
+            version = cache.get(cls.VERSION_KEY)
+        return version
+
+    @classmethod
+    def check_version(cls):
+        now = time.monotonic()
+        if now - cls._checked_at < cls.CHECK_INTERVAL:
+            return
+
+        version = cls.get_version()
+        with cls._lock:
+            if version != cls._version:
+                cls._values = {}
+                cls._version = version
+            cls._checked_at = now
+
+    @classmethod
+    def get(cls, name: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return the value stored under `name`, loading it with `loader` the
+        first time it's used after an invalidation
+        """
+        cls.check_version()
+        values = cls._values
+        if name not in values:
+            values[name] = loader()
+        return values[name]
+
+    @classmethod
+    def clear(cls):
+        """
+        Drop the values of this process only
+        """
+        with cls._lock:
+            cls._values = {}
+            cls._checked_at = 0
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Drop the values of every process by bumping the shared version
+        """
+        cls.clear()
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            cache.set(cls.VERSION_KEY, time.time_ns(), None)
+
+    @classmethod
+    def invalidate_on_commit(cls, **_kwargs):
+        """
+        Signal receiver: invalidate once the current transaction is committed
+        """
+        cls.clear()
+        transaction.on_commit(cls.invalidate)
+
+
+class MenuCache(ReferenceCache):
+    """
+    `ReferenceCache` of the sidebar menu.\n
+    It has its own values and shared version, so a change to a menu, role or
+    permission doesn't drop the payroll reference data and vice versa.
+    """
+
+    VERSION_KEY = "menu:version"
+
+    _lock = threading.Lock()
+    _values: dict[str, Any] = {}
+    _version: int = None
+    _checked_at: float = 0
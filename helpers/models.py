@@ -7,7 +7,6 @@ from django.utils import timezone
 from rest_framework.request import Request
 from rest_framework.exceptions import APIException
 
-
 STATE_CHOICES = (
     ("A", "Activo"),
     ("I", "Inactivo"),
@@ -112,3 +111,22 @@ class BaseModels(models.Model):
 
     class Meta:
         abstract = True
+
+
+class Sequence(models.Model):
+    """
+    Last id handed out for a model by `IdAllocator` on databases without
+    sequences\n
+    `TABLE_NAME`: SEQUENCES
+    """
+
+    name = models.CharField(max_length=100, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.name} - {self.last_id}"
+
+    class Meta:
+        db_table = "SEQUENCES"
+        verbose_name = "Secuencia"
+        verbose_name_plural = "Secuencias"
@@ -0,0 +1,109 @@
+import logging
+import re
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Las listas de parámetros `IN (%s, %s, ...)` cuentan como una sola forma
+PARAMS_LIST = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a view runs more queries than its budget and
+    `QUERY_BUDGET_STRICT` is enabled
+    """
+
+
+class QueryBudget:
+    """
+    Count the SQL queries run inside the block and compare them with `budget`.\n
+    When the budget is exceeded a warning is logged with the statements that
+    were repeated, which usually point to an N+1 hidden in a serializer. With
+    `strict` (by default the `QUERY_BUDGET_STRICT` setting, meant for tests)
+    `QueryBudgetExceeded` is raised instead.
+    """
+
+    REPORTED_SHAPES = 5
+    SHAPE_LENGTH = 500
+
+    def __init__(self, budget: int, name: str = "", strict: bool = None):
+        self.budget = budget
+        self.name = name
+        self.strict = (
+            getattr(settings, "QUERY_BUDGET_STRICT", False)
+            if strict is None
+            else strict
+        )
+        self.queries: list[str] = []
+        self._wrapper = None
+
+    @staticmethod
+    def get_shape(sql: str) -> str:
+        return PARAMS_LIST.sub("(...)", sql)
+
+    def get_repeated(self) -> list[tuple[str, int]]:
+        shapes = Counter(self.get_shape(sql) for sql in self.queries)
+        return [
+            (shape, count)
+            for shape, count in shapes.most_common(self.REPORTED_SHAPES)
+            if count > 1
+        ]
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.queries = []
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.check()
+
+    def check(self):
+        count = len(self.queries)
+        if count <= self.budget:
+            return
+
+        repeated = "\n".join(
+            f"  {times}x {shape[: self.SHAPE_LENGTH]}"
+            for shape, times in self.get_repeated()
+        )
+        message = (
+            f"{self.name or 'Query budget'}: {count} queries, "
+            f"the budget is {self.budget}"
+        )
+        if repeated:
+            message = f"{message}. Repeated queries:\n{repeated}"
+
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def query_budget(budget: int):
+    """
+    Declare the maximum number of queries of a view action.\n
+    Put it above `@viewException` so the error of the strict mode reaches the
+    test instead of becoming a response.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with QueryBudget(budget, name=func.__qualname__):
+                return func(*args, **kwargs)
+
+        wrapper.query_budget = budget
+        return wrapper
+
+    return decorator
@@ -0,0 +1,115 @@
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Max
+
+from helpers.models import Sequence
+
+INTEGER_FIELDS = (
+    "AutoField",
+    "BigAutoField",
+    "SmallAutoField",
+    "IntegerField",
+    "BigIntegerField",
+    "PositiveIntegerField",
+)
+
+
+class IdAllocator:
+    """
+    Hands out primary keys without counting the table.\n
+    On PostgreSQL the ids come from the serial sequence of the primary key, which
+    is moved past the ids already inserted the first time it's used in the process.
+    A whole range is reserved with a single `nextval` over `generate_series`.\n
+    On other databases the last id of every model is kept in `Sequence` and
+    incremented with an `UPDATE`, which locks the row until the transaction ends.
+    """
+
+    _sequences: dict[str, str | None] = {}
+
+    @staticmethod
+    def get_name(model: type[models.Model]) -> str:
+        # pylint: disable=protected-access
+        return model._meta.label
+
+    @staticmethod
+    def supports(model: type[models.Model]) -> bool:
+        # pylint: disable=protected-access
+        return model._meta.pk.get_internal_type() in INTEGER_FIELDS
+
+    @classmethod
+    def get_sequence(cls, model: type[models.Model]) -> str | None:
+        """
+        Return the PostgreSQL sequence of the primary key of `model`, synced
+        with the ids already inserted, or `None` if it doesn't have one.
+        """
+        name = cls.get_name(model)
+        if name in cls._sequences:
+            return cls._sequences[name]
+
+        # pylint: disable=protected-access
+        table = model._meta.db_table
+        column = model._meta.pk.column
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_get_serial_sequence(%s, %s)", [quote(table), column]
+            )
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                # Los ids insertados a mano no avanzan la secuencia
+                cursor.execute(
+                    f"SELECT setval(%s, m) FROM (SELECT MAX({quote(column)}) AS m "
+                    f"FROM {quote(table)}) t, {sequence} s "
+                    "WHERE m IS NOT NULL AND (NOT s.is_called OR m > s.last_value)",
+                    [sequence],
+                )
+
+        cls._sequences[name] = sequence
+        return sequence
+
+    @classmethod
+    def allocate_from_table(cls, model: type[models.Model], count: int) -> list[int]:
+        name = cls.get_name(model)
+        with transaction.atomic():
+            updated = Sequence.objects.filter(name=name).update(
+                last_id=F("last_id") + count
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        # pylint: disable=protected-access
+                        last_id = model.objects.aggregate(
+                            last_id=Max(model._meta.pk.attname)
+                        )["last_id"]
+                        Sequence.objects.create(name=name, last_id=last_id or 0)
+                except IntegrityError:
+                    pass
+                Sequence.objects.filter(name=name).update(last_id=F("last_id") + count)
+
+            last_id = Sequence.objects.get(name=name).last_id
+
+        return list(range(last_id - count + 1, last_id + 1))
+
+    @classmethod
+    def allocate(cls, model: type[models.Model], count: int = 1) -> list[int]:
+        """
+        Reserve `count` new ids for `model` in a single round trip
+        """
+        if count <= 0:
+            return []
+
+        sequence = None
+        if connection.vendor == "postgresql":
+            sequence = cls.get_sequence(model)
+
+        if not sequence:
+            return cls.allocate_from_table(model, count)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)", [sequence, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def next_id(cls, model: type[models.Model]) -> int:
+        return cls.allocate(model)[0]
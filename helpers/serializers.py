@@ -1,19 +1,109 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
 from rest_framework import serializers
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination, InvalidPage
 from rest_framework.exceptions import NotFound, APIException, ValidationError
 
+from helpers.exceptions import PayloadValidationError
+
 
 class BaseModelSerializer(serializers.ModelSerializer):
     """
     This is the base serializer for all the serializers in the project.
-    It includes a method to convert the keys of the dictionary to uppercase.
+    It includes a method to convert the keys of the dictionary to uppercase.\n
+    `fields` is an optional list with the names of the fields to return (in
+    any case). The rest are removed from the serializer, so their
+    `SerializerMethodField` never run, and an unknown name is rejected. The
+    `EXPLICIT_FIELDS` are only returned when they are requested. `only`
+    narrows a queryset to the columns those fields read: the model fields are
+    found by their `source` and the calculated ones have to declare their
+    columns in `FIELD_COLUMNS`.
     """
 
+    # Columnas del modelo que lee cada campo calculado
+    FIELD_COLUMNS: dict[str, tuple[str, ...]] = {}
+    # Campos que solo se devuelven cuando se piden por su nombre
+    EXPLICIT_FIELDS: tuple[str, ...] = ()
+
     def __init__(self, instance=None, data=None, fields=None, **kwargs):
+        self.sparse_fields = self.get_sparse_fields(fields)
         super().__init__(instance, data, **kwargs)
-        if fields:
-            self.Meta.fields = fields
+
+    @staticmethod
+    def get_sparse_fields(fields: list[str] | str | None) -> set[str] | None:
+        """
+        Requested fields in lower case, `None` when all of them are wanted
+        """
+        if not fields or fields == "__all__":
+            return None
+        if not isinstance(fields, (list, tuple, set)) or not all(
+            isinstance(field, str) for field in fields
+        ):
+            raise PayloadValidationError("Invalid format for field 'FIELDS'")
+        return {field.lower() for field in fields}
+
+    @classmethod
+    def wants(cls, fields: list[str] | None, *names: str) -> bool:
+        """
+        Whether any of `names` is among the requested `fields`
+        """
+        sparse = cls.get_sparse_fields(fields)
+        return sparse is None or not sparse.isdisjoint(names)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse_fields is None:
+            return {
+                name: field
+                for name, field in fields.items()
+                if name not in self.EXPLICIT_FIELDS
+            }
+
+        unknown = self.sparse_fields - {name.lower() for name in fields}
+        if unknown:
+            raise PayloadValidationError(
+                f"Unknown fields in 'FIELDS': {', '.join(sorted(unknown))}"
+            )
+        return {
+            name: field
+            for name, field in fields.items()
+            if name.lower() in self.sparse_fields
+        }
+
+    @classmethod
+    def only(cls, queryset: QuerySet, fields: list[str] | None) -> QuerySet:
+        """
+        Defer the columns that none of the requested `fields` read. The
+        queryset is returned as it is when all the fields are wanted or a
+        calculated field doesn't declare its columns.
+        """
+        if cls.get_sparse_fields(fields) is None:
+            return queryset
+
+        opts = queryset.model._meta
+        columns = {opts.pk.name}
+        # Las relaciones de `select_related` no pueden quedar diferidas
+        if isinstance(queryset.query.select_related, dict):
+            columns.update(queryset.query.select_related)
+        elif queryset.query.select_related:
+            return queryset
+
+        for name, field in cls(fields=fields).fields.items():
+            if name in cls.FIELD_COLUMNS:
+                columns.update(cls.FIELD_COLUMNS[name])
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                return queryset
+
+            try:
+                model_field = opts.get_field(field.source.split(".")[0])
+            except FieldDoesNotExist:
+                return queryset
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+
+        return queryset.only(*columns)
 
     def to_representation(self, instance):
         """
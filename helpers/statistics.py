@@ -8,13 +8,14 @@ from django.db.models import (
     DecimalField,
     ExpressionWrapper,
     Count,
+    Value,
 )
 from django.db.models.functions import TruncMonth
 from django.contrib.auth import get_user_model
 
+from payroll.currency import CurrencyConverter
 from users.models import UserManager
 
-
 User = get_user_model()
 
 
@@ -133,28 +134,27 @@ class UserStatistics:
     @staticmethod
     def salary_by_department():
         """
-        This endpoint is used to get a salary distribution by department
+        This endpoint is used to get a salary distribution by department.
+        The salaries are converted to the base currency in SQL
         """
 
-        employees: UserManager = User.get_employees()
-        employees = employees.annotate(
-            department_color=F("department__color"),
-            dept_name=F("department__name"),
+        employees: UserManager = CurrencyConverter.annotate(
+            User.get_employees(), "salary", "currency", name="base_salary"
         )
 
-        total_salary_all_departments = employees.aggregate(total_salary=Sum("salary"))[
-            "total_salary"
-        ]
+        total_salary_all_departments = employees.aggregate(
+            total_salary=Sum("base_salary")
+        )["total_salary"]
 
         employees_by_department = (
             employees.values("department__name")
             .annotate(
                 department_color=F("department__color"),
-                total_salary=Sum("salary"),
-                average_salary=Avg("salary"),
+                total_salary=Sum("base_salary"),
+                average_salary=Avg("base_salary"),
                 percent=ExpressionWrapper(
-                    Sum("salary") * 100.0 / total_salary_all_departments,
-                    output_field=DecimalField(),
+                    Sum("base_salary") * 100 / Value(total_salary_all_departments or 1),
+                    output_field=DecimalField(max_digits=16, decimal_places=2),
                 ),
             )
             .order_by("department__name")
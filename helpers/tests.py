@@ -1,3 +1,126 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from helpers.cache import MenuCache, ReferenceCache
+from helpers.exceptions import viewException
+from helpers.query_budget import QueryBudget, QueryBudgetExceeded, query_budget
+from users.models import User
+
+
+def run_queries(count: int):
+    for user_id in range(count):
+        User.objects.filter(user_id=user_id).exists()
+
+
+class QueryBudgetTest(TestCase):
+    def test_queries_within_budget_pass(self):
+        with QueryBudget(3, strict=True) as budget:
+            run_queries(3)
+
+        self.assertEqual(len(budget.queries), 3)
+
+    def test_strict_mode_raises_with_the_repeated_queries(self):
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            with QueryBudget(2, name="list_users", strict=True):
+                run_queries(3)
+
+        message = str(raised.exception)
+        self.assertTrue(message.startswith("list_users: 3 queries, the budget is 2"))
+        self.assertIn("3x SELECT", message)
+
+    def test_in_lists_are_reported_as_one_shape(self):
+        budget = QueryBudget(0)
+        budget.queries = [
+            'SELECT 1 FROM "USERS" WHERE "USER_ID" IN (%s, %s)',
+            'SELECT 1 FROM "USERS" WHERE "USER_ID" IN (%s, %s, %s)',
+        ]
+
+        self.assertEqual(
+            budget.get_repeated(),
+            [('SELECT 1 FROM "USERS" WHERE "USER_ID" IN (...)', 2)],
+        )
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_mode_is_read_from_the_settings(self):
+        @query_budget(1)
+        def view():
+            run_queries(2)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            view()
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_exceeded_budget_is_logged_when_not_strict(self):
+        @query_budget(1)
+        def view():
+            run_queries(2)
+            return "ok"
+
+        with self.assertLogs("helpers.query_budget", level="WARNING") as logs:
+            self.assertEqual(view(), "ok")
+
+        self.assertIn("2 queries, the budget is 1", logs.output[0])
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_error_is_not_turned_into_a_response(self):
+        @query_budget(0)
+        @viewException
+        def view():
+            run_queries(1)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            view()
+
+    def test_errors_of_the_view_are_not_hidden(self):
+        @query_budget(0)
+        def view():
+            run_queries(1)
+            raise ValueError("error de la vista")
+
+        with self.assertRaisesMessage(ValueError, "error de la vista"):
+            view()
+
+
+class ReferenceCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        ReferenceCache.clear()
+        MenuCache.clear()
+
+    def test_values_are_loaded_once(self):
+        calls = []
+
+        def load():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(ReferenceCache.get("value", load), 1)
+        self.assertEqual(ReferenceCache.get("value", load), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_invalidate_reloads_the_values(self):
+        ReferenceCache.get("value", lambda: "old")
+        ReferenceCache.invalidate()
+
+        self.assertEqual(ReferenceCache.get("value", lambda: "new"), "new")
+
+    def test_other_process_change_is_seen_after_the_check(self):
+        ReferenceCache.get("value", lambda: "old")
+        # Otro proceso cambia la versión compartida
+        cache.incr(ReferenceCache.VERSION_KEY)
+        self.assertEqual(ReferenceCache.get("value", lambda: "new"), "old")
+
+        ReferenceCache._checked_at = 0
+        self.assertEqual(ReferenceCache.get("value", lambda: "new"), "new")
+
+    def test_menu_cache_is_kept_apart(self):
+        ReferenceCache.get("value", lambda: "reference")
+        MenuCache.get("value", lambda: "menu")
+
+        ReferenceCache.invalidate()
+        self.assertEqual(MenuCache.get("value", lambda: "new"), "menu")
+        self.assertEqual(ReferenceCache.get("value", lambda: "new"), "new")
+
+        MenuCache.invalidate()
+        self.assertEqual(MenuCache.get("value", lambda: "newer"), "newer")
+        self.assertEqual(ReferenceCache.get("value", lambda: "newer"), "new")
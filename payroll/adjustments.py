@@ -0,0 +1,174 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation, localcontext
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from helpers.sequences import IdAllocator
+from payroll.models import Adjustment, Concept, Payroll, PayrollEntry
+from users.models import User
+
+
+class AdjustmentImport:
+    """
+    Bulk import of bonuses and discounts into a payroll.\n
+    Every row has `USERNAME`, `TYPE` (`B` or `D`), `AMOUNT`, `DESCRIPTION` and
+    optionally `CONCEPT` (name or id). The usernames are resolved to the entries
+    of the payroll and the concepts are loaded in one query each, so validating
+    a file costs the same number of queries whatever its size.\n
+    Entries already paid are rejected, their adjustments would never be
+    processed. Nothing is written when a row has errors. Otherwise the
+    adjustments are inserted with `bulk_create` in one transaction, and
+    `AdjustmentQuerySet.bulk_create` recalculates the totals of the entries
+    they belong to.
+    """
+
+    BATCH_SIZE = 1000
+    REQUIRED_FIELDS = ("username", "type", "amount", "description")
+    MAX_AMOUNT = Decimal("99999999.99")
+
+    def __init__(self, payroll: Payroll, created_by: User):
+        self.payroll = payroll
+        self.created_by = created_by
+        self.adjustments: list[Adjustment] = []
+        self.errors: list[dict] = []
+
+    @staticmethod
+    def read_csv(file) -> list[dict]:
+        content = file.read()
+        if isinstance(content, bytes):
+            content = content.decode("utf-8-sig")
+        return list(csv.DictReader(io.StringIO(content)))
+
+    @staticmethod
+    def parse_amount(value) -> Decimal | None:
+        # Contexto propio: `payroll.models` reduce la precisión global de `decimal`
+        with localcontext(prec=28):
+            try:
+                amount = Decimal(str(value).strip())
+            except (InvalidOperation, ValueError):
+                return None
+            # No se redondean montos con más de dos decimales
+            if not amount.is_finite() or amount != amount.quantize(Decimal("0.01")):
+                return None
+            return amount.quantize(Decimal("0.01"))
+
+    def get_entries(self) -> dict[str, tuple[int, bool]]:
+        """
+        Map the username of every active entry of the payroll to its id and
+        whether it was already paid
+        """
+        return {
+            username: (payroll_entry_id, status)
+            for username, payroll_entry_id, status in PayrollEntry.objects.filter(
+                Q(payroll_id=self.payroll.payroll_id) & Q(state=PayrollEntry.ACTIVE)
+            ).values_list("user_id", "payroll_entry_id", "status")
+        }
+
+    @staticmethod
+    def get_concepts(values: Iterable[str]) -> dict[str, Concept]:
+        """
+        Load the concepts referenced by name or id in a single query
+        """
+        values = set(values)
+        ids = [int(value) for value in values if value.isdigit()]
+        names = [value for value in values if not value.isdigit()]
+
+        concepts: dict[str, Concept] = {}
+        for concept in Concept.objects.filter(
+            Q(concept_id__in=ids) | Q(name__in=names)
+        ).order_by("concept_id"):
+            concepts[str(concept.concept_id)] = concept
+            # Si hay nombres repetidos se usa el concepto más reciente
+            concepts[concept.name] = concept
+        return concepts
+
+    def validate(self, rows: list[dict]) -> list[dict]:
+        """
+        Validate every row and build the adjustments. Returns the errors found,
+        one item per row with the row number and its messages.
+        """
+        rows = [
+            {key.lower(): value for key, value in row.items() if key} for row in rows
+        ]
+        entries = self.get_entries()
+        concepts = self.get_concepts(
+            str(row["concept"]).strip() for row in rows if row.get("concept")
+        )
+        types = dict(Adjustment.ADJUSTMENT_TYPE)
+
+        self.adjustments = []
+        self.errors = []
+        for number, row in enumerate(rows, start=1):
+            messages = [
+                f"{field.upper()} es requerido"
+                for field in self.REQUIRED_FIELDS
+                if row.get(field) in (None, "")
+            ]
+
+            username = str(row.get("username") or "").strip().lstrip("@")
+            entry_id, paid = entries.get(username, (None, False))
+            if username and not entry_id:
+                messages.append(
+                    f"La entrada de nomina para el usuario '@{username}' no fue encontrada"
+                )
+            if paid:
+                messages.append(
+                    f"La entrada de nomina del usuario '@{username}' ya fue pagada"
+                )
+
+            _type = str(row.get("type") or "").strip().upper()
+            if _type and _type not in types:
+                messages.append(f"TYPE debe ser uno de: {', '.join(types)}")
+
+            amount = None
+            if row.get("amount") not in (None, ""):
+                amount = self.parse_amount(row["amount"])
+                if amount is None or amount <= 0 or amount > self.MAX_AMOUNT:
+                    messages.append(f"AMOUNT '{row['amount']}' no es un monto válido")
+
+            description = str(row.get("description") or "").strip()
+            if len(description) > 250:
+                messages.append("DESCRIPTION no puede tener más de 250 caracteres")
+
+            concept = None
+            if row.get("concept"):
+                concept = concepts.get(str(row["concept"]).strip())
+                if not concept:
+                    messages.append(f"Concepto '{row['concept']}' no encontrado")
+
+            if messages:
+                self.errors.append({"ROW": number, "ERRORS": messages})
+                continue
+
+            self.adjustments.append(
+                Adjustment(
+                    payroll_entry_id=entry_id,
+                    type=_type,
+                    amount=amount,
+                    description=description,
+                    concept=concept,
+                    state=Adjustment.ACTIVE,
+                    created_by=self.created_by,
+                    created_at=timezone.now(),
+                )
+            )
+
+        return self.errors
+
+    @transaction.atomic
+    def save(self) -> list[Adjustment]:
+        """
+        Insert the validated adjustments, which refreshes the totals of their
+        entries
+        """
+        ids = IdAllocator.allocate(Adjustment, len(self.adjustments))
+        for adjustment_id, adjustment in zip(ids, self.adjustments):
+            adjustment.adjustment_id = adjustment_id
+
+        # `bulk_create` recalcula los totales de las entradas
+        Adjustment.objects.bulk_create(self.adjustments, batch_size=self.BATCH_SIZE)
+        return self.adjustments
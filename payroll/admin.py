@@ -1,11 +1,17 @@
 from django.contrib import admin
 
-from helpers.admin import BaseModelAdmin
+from django.utils import timezone
+
+from helpers.admin import BaseModelAdmin, BaseModelInline
 from payroll.forms import PayrollForm
 from payroll.models import (
     Concept,
     DeductionXuser,
     Deductions,
+    EmployeeYearToDate,
+    ExchangeRate,
+    IsrBracket,
+    IsrScale,
     Payroll,
     PayrollEntry,
     Adjustment,
@@ -52,6 +58,7 @@ class DeductionXuserAdmin(BaseModelAdmin):
         "user",
         "deduction",
     )
+    list_select_related = ("user", "deduction")
     search_fields = ("user", "deduction")
 
 
@@ -73,6 +80,7 @@ class PayrollPaymentDetailAdmin(BaseModelAdmin):
         "period",
         "concept_amount",
         "gross_salary",
+        "period_salary",
         "comment",
     )
 
@@ -81,6 +89,42 @@ class PayrollSettingsAdmin(BaseModelAdmin):
     list_display = ("periods", "autopay", "deduction_period")
 
 
+class IsrBracketInline(BaseModelInline):
+    model = IsrBracket
+    extra = 1
+
+
+class IsrScaleAdmin(BaseModelAdmin):
+    list_display = ("isr_scale_id", "name", "effective_from", "version")
+    list_filter = ("effective_from",)
+
+    inlines = [IsrBracketInline]
+
+    def save_formset(self, request, form, formset, change):
+        brackets = formset.save(commit=False)
+        for bracket in brackets:
+            if not bracket.pk:
+                bracket.created_by = request.user
+                bracket.created_at = timezone.now()
+            else:
+                bracket.updated_by = request.user
+            bracket.save()
+        for bracket in formset.deleted_objects:
+            bracket.delete()
+        formset.save_m2m()
+
+
+class EmployeeYearToDateAdmin(BaseModelAdmin):
+    list_display = ("user", "year", "payments", "gross_salary", "net_salary")
+    list_filter = ("year",)
+    search_fields = ("user__username",)
+
+
+class ExchangeRateAdmin(BaseModelAdmin):
+    list_display = ("exchange_rate_id", "currency", "rate", "effective_from")
+    list_filter = ("currency", "effective_from")
+
+
 admin.site.register(Payroll, PayrollAdmin)
 admin.site.register(PayrollEntry, PayrollEntryAdmin)
 admin.site.register(Deductions, DeductionsAdmin)
@@ -89,3 +133,6 @@ admin.site.register(Adjustment, AdjustmentAdmin)
 admin.site.register(Concept, ConceptsAdmin)
 admin.site.register(PayrollPaymentDetail, PayrollPaymentDetailAdmin)
 admin.site.register(PayrollSettings, PayrollSettingsAdmin)
+admin.site.register(IsrScale, IsrScaleAdmin)
+admin.site.register(ExchangeRate, ExchangeRateAdmin)
+admin.site.register(EmployeeYearToDate, EmployeeYearToDateAdmin)
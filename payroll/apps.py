@@ -2,5 +2,10 @@ from django.apps import AppConfig
 
 
 class PayrollConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'payroll'
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "payroll"
+
+    def ready(self):
+        # Registra las señales del modelo
+        # pylint: disable=import-outside-toplevel
+        import payroll.signals  # noqa: F401
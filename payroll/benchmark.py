@@ -0,0 +1,282 @@
+import platform
+import time
+from decimal import DefaultContext, localcontext
+from datetime import timedelta
+from typing import Callable
+
+from django.db import connection, transaction
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.settings import PATH_BASE
+from helpers.cache import ReferenceCache
+from payroll.models import Payroll
+from payroll.seeding import DataSeeder
+from users.models import User
+
+
+class PayrollBenchmark:
+    """
+    Time the payroll flow and the main endpoints over synthetic data.\n
+    For every size a fresh set of employees is seeded with `DataSeeder` inside a
+    transaction that is rolled back at the end, so the database is left as it
+    was. Every step records its wall time, number of SQL queries and the status
+    of the response.\n
+    The endpoints are called through their views with `APIRequestFactory`, so
+    the measure includes the serializers and the rendering of the response.
+    A run whose payroll can't be created raises `ValueError` instead of
+    reporting the timings of the steps it skipped.
+    """
+
+    SIZES = (1_000, 10_000, 100_000)
+    PAGE = "?page=1&page_size=50"
+
+    def __init__(self, user: User, seed: int = 1, partial: int = 100):
+        self.user = user
+        self.seed = seed
+        self.partial = partial
+        self.factory = APIRequestFactory()
+
+    def measure(self, name: str, func: Callable[[], int | None]) -> dict:
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - start
+
+        return {
+            "name": name,
+            "seconds": round(seconds, 4),
+            "queries": queries,
+            "status": result if isinstance(result, int) else None,
+        }
+
+    def call(self, method: str, path: str, data: dict = None) -> int:
+        """
+        Call the view of `path` as `user` and return the status of the response
+        """
+        url = f"/{PATH_BASE}{path}"
+        request = getattr(self.factory, method)(url, data, format="json")
+        force_authenticate(request, user=self.user)
+
+        match = resolve(url.split("?")[0])
+        # Un error de base de datos no debe invalidar el resto de las pruebas
+        savepoint = transaction.savepoint()
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, "render"):
+            response.render()
+
+        if response.status_code >= 400:
+            transaction.savepoint_rollback(savepoint)
+        else:
+            transaction.savepoint_commit(savepoint)
+        return response.status_code
+
+    @staticmethod
+    def condition(field: str, value, data_type: str = "str") -> list[dict]:
+        return [
+            {"field": field, "operator": "=", "condition": value, "dataType": data_type}
+        ]
+
+    def get_steps(self, payroll: Payroll, usernames: list[str]) -> list[tuple]:
+        payroll_condition = self.condition("payroll_id", payroll.payroll_id, "int")
+        today = timezone.now().date()
+        return [
+            (
+                "payroll.get_payroll_entries",
+                "post",
+                f"payroll/get_payroll_entries/{self.PAGE}",
+                {"condition": payroll_condition},
+            ),
+            (
+                "payroll.get_adjustments",
+                "post",
+                f"payroll/get_adjustments/{self.PAGE}",
+                {
+                    "condition": self.condition(
+                        "payroll_entry__payroll_id", payroll.payroll_id, "int"
+                    )
+                },
+            ),
+            (
+                "payroll.preview_payroll",
+                "post",
+                "payroll/preview_payroll/",
+                {"condition": {"payroll_id": payroll.payroll_id}},
+            ),
+            (
+                "users.list_users",
+                "post",
+                f"users/list_users{self.PAGE}",
+                {"condition": self.condition("state", User.ACTIVE)},
+            ),
+            (
+                "tasks.get_tasks_list",
+                "post",
+                f"tasks/get_tasks_list{self.PAGE}",
+                {"condition": self.condition("state", "A")},
+            ),
+            (
+                "payroll.process_partial_payroll",
+                "post",
+                "payroll/process_partial_payroll/",
+                {
+                    "condition": {
+                        "USERS": usernames[: self.partial],
+                        "PAYROLL_ID": payroll.payroll_id,
+                    }
+                },
+            ),
+            (
+                "payroll.process_payroll",
+                "post",
+                "payroll/process_payroll/",
+                {"condition": {"payroll_id": payroll.payroll_id}},
+            ),
+            (
+                "payroll.get_payroll_history",
+                "post",
+                f"payroll/get_payroll_history{self.PAGE}",
+                {"condition": payroll_condition},
+            ),
+            (
+                "dashboard.get_recent_activities",
+                "post",
+                f"dashboard/get_recent_activities{self.PAGE}",
+                {"condition": self.condition("action_flag", 2, "int")},
+            ),
+            (
+                "dashboard.get_employees_by_department",
+                "get",
+                "dashboard/get_employees_by_department/",
+                None,
+            ),
+            (
+                "dashboard.task_performance",
+                "post",
+                "dashboard/task_performance/",
+                {
+                    "condition": {
+                        "date_range": [
+                            str(today - timedelta(days=30)),
+                            str(today + timedelta(days=1)),
+                        ]
+                    }
+                },
+            ),
+            (
+                "dashboard.get_user_statistic",
+                "get",
+                "dashboard/get_user_statistic/",
+                None,
+            ),
+            (
+                "dashboard.salary_by_department",
+                "get",
+                "dashboard/salary_by_department/",
+                None,
+            ),
+            (
+                "dashboard.get_payroll_payment_detail",
+                "get",
+                "dashboard/get_payroll_payment_detail/",
+                None,
+            ),
+        ]
+
+    def run_size(self, employees: int) -> list[dict]:
+        """
+        Seed `employees` employees, run every step and roll everything back
+        """
+        results = []
+        seeder = DataSeeder(self.user, self.seed)
+        seeded = {}
+        today = timezone.now().date()
+
+        def seed():
+            seeded.update(seeder.seed(employees))
+
+        def create_payroll():
+            return self.call(
+                "post",
+                "payroll/create_payroll/",
+                {
+                    "PERIOD_START": str(today.replace(day=1)),
+                    "PERIOD_END": str(today),
+                    "STATE": "A",
+                    "EMPLOYEES": "__all__",
+                },
+            )
+
+        try:
+            with transaction.atomic():
+                results.append(self.measure("seed", seed))
+                step = self.measure("payroll.create_payroll", create_payroll)
+                results.append(step)
+
+                payroll = (
+                    Payroll.objects.filter(status=Payroll.PENDING)
+                    .order_by("-payroll_id")
+                    .first()
+                )
+                # Sin nómina los tiempos del resto de los pasos no son comparables
+                if step["status"] >= 400 or not payroll:
+                    raise ValueError(
+                        f"No se pudo crear la nómina para {employees} empleados "
+                        f"(estado {step['status']})"
+                    )
+
+                results.append(
+                    self.measure(
+                        "seed_adjustments",
+                        lambda: seeder.seed_adjustments(payroll, seeded["reference"]),
+                    )
+                )
+                usernames = [user.username for user in seeded["users"]]
+                for name, method, path, data in self.get_steps(payroll, usernames):
+                    results.append(
+                        self.measure(
+                            name,
+                            # pylint: disable=cell-var-from-loop
+                            lambda: self.call(method, path, data),
+                        )
+                    )
+
+                transaction.set_rollback(True)
+        finally:
+            # Los valores cargados dentro de la transacción ya no existen
+            ReferenceCache.clear()
+
+        return results
+
+    def run(self, sizes: list[int] = None) -> dict:
+        """
+        Run the benchmark for every size and return the report
+        """
+        if Payroll.objects.filter(status=Payroll.PENDING).exists():
+            raise ValueError(
+                "Hay una nómina pendiente, el benchmark necesita crear una nueva"
+            )
+
+        # Las vistas corren en hilos con el contexto por defecto de `decimal`,
+        # no con la precisión reducida que `payroll.models` deja en este hilo
+        with localcontext(DefaultContext):
+            results = [
+                {"employees": size, "steps": self.run_size(size)}
+                for size in sizes or self.SIZES
+            ]
+
+        return {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "seed": self.seed,
+            "sizes": results,
+        }
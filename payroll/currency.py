@@ -0,0 +1,184 @@
+import datetime
+from typing import Iterable
+
+import numpy as np
+from django.db.models import (
+    Case,
+    DecimalField,
+    Expression,
+    F,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Round
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from payroll.calculator import CONTEXT, DeductionCalculator
+from payroll.models import ExchangeRate
+
+
+class MissingExchangeRate(APIException):
+    """
+    Raised when there are amounts in a currency without a rate in effect,
+    instead of leaving them out of the totals
+    """
+
+    status_code = 409
+    default_code = "MissingExchangeRate"
+
+    def __init__(self, currencies: Iterable[str]):
+        self.currencies = sorted(set(currencies))
+        super().__init__(
+            f"No hay una tasa de cambio vigente para: {', '.join(self.currencies)}"
+        )
+
+
+class CurrencyConverter:
+    """
+    Convert amounts to the base currency (`RD`) with the `ExchangeRate` in
+    effect on a date.\n
+    `to_base` builds an expression that converts every row of a queryset in
+    SQL, so a whole queryset is converted and added up by the database.
+    `convert_cents` does the same over the arrays of `DeductionCalculator` in a
+    single vectorized pass.\n
+    `annotate` and `convert_cents` raise `MissingExchangeRate` when there are
+    amounts in a currency without a rate in effect. `to_base` alone converts
+    them to `NULL`, so whoever uses it directly has to call `check` first.
+    """
+
+    BASE_CURRENCY = ExchangeRate.BASE_CURRENCY
+    OUTPUT_FIELD = DecimalField(max_digits=16, decimal_places=2)
+    RATE_FIELD = DecimalField(max_digits=14, decimal_places=6)
+    # Las tasas tienen seis decimales
+    RATE_SCALE = 1_000_000
+
+    @classmethod
+    def get_rate(
+        cls, currency: str | Expression, date: datetime.date | Expression
+    ) -> Subquery:
+        """
+        Subquery with the rate of `currency` in effect on `date`. Both can be
+        values or expressions such as `OuterRef("user__currency")`.
+        """
+        if isinstance(currency, str):
+            currency = Value(currency)
+        if isinstance(date, datetime.date):
+            date = Value(date)
+
+        return Subquery(
+            ExchangeRate.objects.filter(
+                Q(state=ExchangeRate.ACTIVE)
+                & Q(currency=currency)
+                & Q(effective_from__lte=date)
+            )
+            .order_by("-effective_from", "-exchange_rate_id")
+            .values("rate")[:1],
+            output_field=cls.RATE_FIELD,
+        )
+
+    @classmethod
+    def to_base(
+        cls,
+        amount: str,
+        currency: str,
+        date: str | datetime.date = None,
+    ) -> Case:
+        """
+        Expression with `amount` in the base currency, rounded to cents.\n
+        `amount` and `currency` are field lookups of the queryset. `date` is
+        either a field lookup, and then every row is joined with the rate of its
+        own date, or a fixed date (today by default), and then the rates in
+        effect are written in the query as literals.
+        """
+        date = date or timezone.localdate()
+        whens = [When(**{currency: cls.BASE_CURRENCY}, then=F(amount))]
+        default = None
+
+        if isinstance(date, str):
+            default = Round(
+                F(amount) * cls.get_rate(OuterRef(currency), OuterRef(date)), 2
+            )
+        else:
+            whens += [
+                When(
+                    **{currency: code},
+                    then=Round(F(amount) * Value(rate, output_field=cls.RATE_FIELD), 2),
+                )
+                for code, rate in ExchangeRate.get_rates(date).items()
+                if code != cls.BASE_CURRENCY
+            ]
+
+        return Case(*whens, default=default, output_field=cls.OUTPUT_FIELD)
+
+    @classmethod
+    def check(
+        cls,
+        queryset: QuerySet,
+        currency: str,
+        date: str | datetime.date = None,
+    ):
+        """
+        Raise `MissingExchangeRate` when a row of `queryset` is in a currency
+        without a rate in effect, with the same arguments as `to_base`. It
+        costs one query.
+        """
+        if isinstance(date, str):
+            missing = queryset.annotate(
+                exchange_rate=cls.get_rate(OuterRef(currency), OuterRef(date))
+            ).filter(exchange_rate__isnull=True)
+        else:
+            missing = queryset.exclude(
+                **{f"{currency}__in": ExchangeRate.get_rates(date)}
+            )
+
+        currencies = list(
+            missing.exclude(**{currency: cls.BASE_CURRENCY})
+            .order_by()
+            .values_list(currency, flat=True)
+            .distinct()
+        )
+        if currencies:
+            raise MissingExchangeRate(currencies)
+
+    @classmethod
+    def annotate(
+        cls,
+        queryset: QuerySet,
+        amount: str,
+        currency: str,
+        date: str | datetime.date = None,
+        name: str = "base_amount",
+    ) -> QuerySet:
+        cls.check(queryset, currency, date)
+        return queryset.annotate(**{name: cls.to_base(amount, currency, date)})
+
+    @classmethod
+    def convert_cents(
+        cls,
+        cents: np.ndarray,
+        currencies: Iterable[str],
+        date: datetime.date = None,
+    ) -> np.ndarray:
+        """
+        Convert an array of amounts in cents to the base currency. Raise
+        `MissingExchangeRate` when a currency has no rate in effect.
+        """
+        rates = ExchangeRate.get_rates(date)
+        currencies = list(currencies)
+        missing = set(currencies) - set(rates)
+        if missing:
+            raise MissingExchangeRate(missing)
+
+        scaled = np.array(
+            [
+                int(rates[currency].scaleb(6, context=CONTEXT))
+                for currency in currencies
+            ],
+            dtype=np.int64,
+        )
+        return DeductionCalculator.round_div(cents * scaled, cls.RATE_SCALE)
@@ -0,0 +1,169 @@
+import csv
+from typing import Iterator
+
+from django.db.models import DecimalField, OuterRef, Q, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from payroll.calculator import CONTEXT, DeductionCalculator
+from payroll.models import Concept, Payroll, PayrollEntry, PayrollPaymentDetail
+
+
+class Echo:
+    """
+    File-like object that returns what is written, used to stream `csv.writer`
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class DisbursementFile:
+    """
+    Bank disbursement file of a processed payroll.\n
+    The net salary of every paid entry is the `SALARIO` detail written by the
+    payroll engine, summed in SQL with a correlated subquery so rows come out in
+    entry order without grouping the whole payroll first. Rows are read with
+    `iterator(chunk_size)` and written one by one, so memory doesn't grow with
+    the size of the payroll.\n
+    `csv` writes a header row and one row per employee. `txt` writes fixed-width
+    `D` records followed by a `T` trailer with the number of records and the
+    total amount in cents.\n
+    A bank transfer can't be negative, so the file must not be exported while
+    `get_negative` returns any entry.
+    """
+
+    FORMATS = {"csv": "text/csv", "txt": "text/plain"}
+    CHUNK_SIZE = 2000
+    HEADERS = (
+        "TIPO_DOCUMENTO",
+        "DOCUMENTO",
+        "NOMBRE",
+        "MONEDA",
+        "MONTO",
+        "REFERENCIA",
+    )
+
+    def __init__(self, payroll: Payroll, file_format: str = "csv"):
+        self.payroll = payroll
+        self.file_format = file_format
+
+    @property
+    def content_type(self) -> str:
+        return self.FORMATS[self.file_format]
+
+    @property
+    def filename(self) -> str:
+        return f"nomina_{self.payroll.payroll_id}.{self.file_format}"
+
+    @property
+    def reference(self) -> str:
+        return f"NOMINA{self.payroll.payroll_id}"
+
+    def get_entries(self) -> QuerySet[PayrollEntry]:
+        """
+        Paid entries of the payroll with their `net_salary`
+        """
+        salary_concept = Concept.get_by_name("SALARIO")
+        net_salary = (
+            PayrollPaymentDetail.objects.filter(
+                Q(payroll_entry_id=OuterRef("payroll_entry_id"))
+                & Q(concept_id=salary_concept.concept_id)
+                & Q(state=PayrollPaymentDetail.ACTIVE)
+            )
+            .order_by()
+            .values("payroll_entry_id")
+            .annotate(total=Sum("concept_amount"))
+            .values("total")
+        )
+
+        return PayrollEntry.objects.filter(
+            Q(payroll_id=self.payroll.payroll_id) & Q(status=True)
+        ).annotate(
+            net_salary=Coalesce(
+                Subquery(net_salary),
+                0,
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+    def get_negative(self) -> list[str]:
+        """
+        Username of the paid entries with a negative net salary
+        """
+        return list(
+            self.get_entries()
+            .filter(net_salary__lt=0)
+            .order_by("payroll_entry_id")
+            .values_list("user_id", flat=True)
+        )
+
+    def get_rows(self) -> Iterator[tuple]:
+        return (
+            self.get_entries()
+            .order_by("payroll_entry_id")
+            .values_list(
+                "user__document_type",
+                "user__identity_document",
+                "user__name",
+                "user__last_name",
+                "user__currency",
+                "net_salary",
+            )
+            .iterator(chunk_size=self.CHUNK_SIZE)
+        )
+
+    @staticmethod
+    def to_cents(amount) -> int:
+        return int(CONTEXT.multiply(amount, 100).to_integral_value(context=CONTEXT))
+
+    def get_records(self) -> Iterator[tuple[str, str, str, str, int]]:
+        """
+        Yield document type, document, full name, currency and net salary in
+        cents of every paid entry
+        """
+        for row in self.get_rows():
+            document_type, document, name, last_name, currency, amount = row
+            yield (
+                document_type,
+                document,
+                f"{name} {last_name}",
+                currency,
+                self.to_cents(amount),
+            )
+
+    def stream_csv(self) -> Iterator[str]:
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.HEADERS)
+        for document_type, document, full_name, currency, cents in self.get_records():
+            yield writer.writerow(
+                (
+                    document_type,
+                    document,
+                    full_name,
+                    currency,
+                    DeductionCalculator.from_cents(cents),
+                    self.reference,
+                )
+            )
+
+    def stream_txt(self) -> Iterator[str]:
+        count = 0
+        total = 0
+        for document_type, document, full_name, currency, cents in self.get_records():
+            count += 1
+            total += cents
+            yield (
+                "D"
+                f"{document_type:<1.1}"
+                f"{document:<20.20}"
+                f"{full_name:<60.60}"
+                f"{currency:<3.3}"
+                f"{cents:015d}"
+                f"{self.reference:<20.20}\r\n"
+            )
+        yield f"T{count:010d}{total:018d}\r\n"
+
+    def stream(self) -> Iterator[str]:
+        if self.file_format == "txt":
+            return self.stream_txt()
+        return self.stream_csv()
@@ -0,0 +1,410 @@
+import hashlib
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, QuerySet, Sum
+
+from payroll.calculator import DeductionCalculator
+from payroll.currency import CurrencyConverter
+from payroll.models import (
+    Adjustment,
+    Concept,
+    Deductions,
+    DeductionXuser,
+    EmployeeYearToDate,
+    ExchangeRate,
+    IsrScale,
+    Payroll,
+    PayrollEntry,
+    PayrollPaymentDetail,
+    PayrollSettings,
+)
+from payroll.serializers import PayrollPreviewSerializer
+from users.models import User
+
+
+class PayrollEngine:
+    """
+    Set-based payroll engine.\n
+    Loads the entries of a payroll together with their users, active deductions
+    and adjustments in a fixed number of queries, computes every amount in memory
+    and writes the `PayrollPaymentDetail` rows with `bulk_create`.\n
+    AFP, SFS, ISR and net salary are calculated for the whole payroll at once
+    with `DeductionCalculator`.
+    """
+
+    BATCH_SIZE = 1000
+    PREVIEW_TIMEOUT = 60 * 60
+    TOTAL_FIELDS = ("salary", "bonus", "discount", "afp", "sfs", "isr", "net_salary")
+
+    def __init__(
+        self,
+        payroll: Payroll,
+        users_id: list[int] = None,
+        entries_id: list[int] = None,
+    ):
+        self.payroll = payroll
+        self.users_id = users_id
+        self.entries_id = entries_id
+        self.settings: PayrollSettings = None
+        self.isr_scale: IsrScale = None
+        self.entries: list[PayrollEntry] = []
+        self.deductions: dict[str, list[DeductionXuser]] = {}
+        self.adjustments: dict[int, list[Adjustment]] = {}
+
+    def get_entries(self) -> QuerySet[PayrollEntry]:
+        entries = PayrollEntry.objects.filter(payroll_id=self.payroll.payroll_id)
+        if self.users_id:
+            entries = entries.filter(user__user_id__in=self.users_id)
+        if self.entries_id is not None:
+            entries = entries.filter(payroll_entry_id__in=self.entries_id)
+        return entries
+
+    def claim_entries(self) -> QuerySet[PayrollEntry]:
+        """
+        Unpaid entries locked with `SKIP LOCKED`: the rows already claimed by
+        another transaction are left out instead of waiting for it, so several
+        workers can process disjoint slices of the same payroll.
+        """
+        return (
+            self.get_entries()
+            .filter(status=False)
+            .select_for_update(skip_locked=True, of=("self",))
+        )
+
+    def load(self, claim: bool = False) -> list[PayrollEntry]:
+        """
+        Load the entries, deductions and adjustments of the payroll. With
+        `claim` only the unpaid entries are loaded and they stay locked until
+        the transaction ends.
+        """
+        self.settings = Payroll.get_config()
+        self.isr_scale = IsrScale.get_current(self.payroll.period_end)
+        entries = self.claim_entries() if claim else self.get_entries()
+        self.entries = list(entries.select_related("user"))
+
+        self.deductions = DeductionCalculator.get_user_deductions(
+            entry.user.username for entry in self.entries
+        )
+
+        self.adjustments = {}
+        adjustments = (
+            Adjustment.objects.filter(
+                payroll_entry_id__in=[entry.payroll_entry_id for entry in self.entries]
+            )
+            .select_related("concept")
+            .order_by("adjustment_id")
+        )
+        for adjustment in adjustments:
+            self.adjustments.setdefault(adjustment.payroll_entry_id, []).append(
+                adjustment
+            )
+
+        return self.entries
+
+    @staticmethod
+    def sum_adjustments(adjustments: list[Adjustment]) -> int:
+        return int(
+            DeductionCalculator.to_cents(
+                adjustment.amount for adjustment in adjustments
+            ).sum()
+        )
+
+    def compute(self, claim: bool = False) -> list[dict]:
+        """
+        Compute the payroll in memory without writing anything.
+        """
+        self.load(claim)
+        if not self.entries:
+            return []
+
+        users = [entry.user for entry in self.entries]
+        salaries = DeductionCalculator.to_cents(user.salary for user in users)
+        rates = DeductionCalculator.get_rates(users, self.deductions)
+
+        bonuses = []
+        discounts = []
+        amounts_by_type: list[dict[str, int]] = []
+        for entry in self.entries:
+            adjustments = self.adjustments.get(entry.payroll_entry_id, [])
+            amounts = {
+                _type: self.sum_adjustments(
+                    [
+                        adjustment
+                        for adjustment in adjustments
+                        if adjustment.type == _type
+                    ]
+                )
+                for _type, _ in Adjustment.ADJUSTMENT_TYPE
+            }
+            amounts_by_type.append(amounts)
+            bonuses.append(
+                self.sum_adjustments(
+                    [
+                        adjustment
+                        for adjustment in adjustments
+                        if adjustment.type == "B"
+                        and adjustment.state == Adjustment.ACTIVE
+                    ]
+                )
+            )
+            discounts.append(amounts["D"])
+
+        isr_table = DeductionCalculator.get_isr_table(self.isr_scale)
+        result = DeductionCalculator.calculate(
+            salaries,
+            rates["AFP"],
+            rates["SFS"],
+            rates["ISR"],
+            periods=self.settings.periods,
+            bonuses=bonuses,
+            discounts=discounts,
+            isr_table=isr_table,
+        )
+        deduction_amounts = {
+            name: DeductionCalculator.percentage_of(salaries, rates[name])
+            for name in DeductionCalculator.DEDUCTIONS
+        }
+        if isr_table is not None:
+            deduction_amounts["ISR"] = result["isr"]
+        is_deduction_period = self.settings.periods == self.payroll.period
+
+        results = []
+        for index, entry in enumerate(self.entries):
+            deductions = []
+            if is_deduction_period:
+                for deduction_user in self.deductions.get(entry.user.username, []):
+                    name = deduction_user.deduction.name
+                    amount = (
+                        deduction_amounts[name][index]
+                        if name in deduction_amounts
+                        else 0
+                    )
+                    deductions.append(
+                        {
+                            "deduction": deduction_user.deduction,
+                            "amount": DeductionCalculator.from_cents(amount),
+                        }
+                    )
+
+            results.append(
+                {
+                    "entry": entry,
+                    "gross_salary": entry.user.salary,
+                    "bonus": DeductionCalculator.from_cents(bonuses[index]),
+                    "discount": DeductionCalculator.from_cents(discounts[index]),
+                    **{
+                        key: DeductionCalculator.from_cents(values[index])
+                        for key, values in result.items()
+                    },
+                    "deductions": deductions,
+                    "adjustments": [
+                        {
+                            "adjustment": adjustment,
+                            "amount": DeductionCalculator.from_cents(
+                                amounts_by_type[index][adjustment.type]
+                            ),
+                        }
+                        for adjustment in self.adjustments.get(
+                            entry.payroll_entry_id, []
+                        )
+                        if adjustment.state == Adjustment.ACTIVE
+                    ],
+                }
+            )
+
+        return results
+
+    def get_fingerprint(self) -> str:
+        """
+        Hash of everything the calculation depends on. Settings, deductions,
+        ISR scale and exchange rates come from `ReferenceCache`; the entries,
+        their deduction assignments and adjustments are summed up with one
+        aggregate query each, so the key costs the same on any payroll size.
+        """
+        entries = self.get_entries()
+        settings = Payroll.get_config()
+        scale = IsrScale.get_current(self.payroll.period_end)
+        digest = hashlib.sha256()
+        digest.update(
+            repr((self.payroll.period, settings and settings.periods)).encode()
+        )
+        if scale:
+            digest.update(repr((scale.isr_scale_id, scale.get_table())).encode())
+        rates = ExchangeRate.get_rates(self.payroll.period_end)
+        digest.update(repr(sorted(rates.items())).encode())
+        digest.update(
+            repr(
+                sorted(
+                    (deduction_id, deduction.percentage, deduction.state)
+                    for deduction_id, deduction in Deductions.get_all().items()
+                )
+            ).encode()
+        )
+
+        aggregates = [
+            # Los totales de la entrada ya reflejan sus ajustes activos
+            entries.aggregate(
+                count=Count("payroll_entry_id"),
+                last_id=Max("payroll_entry_id"),
+                salaries=Sum("user__salary"),
+                weighted_salaries=Sum(F("user__salary") * F("payroll_entry_id")),
+                bonus=Sum("total_bonus"),
+                discount=Sum("total_discount"),
+                users_updated_at=Max("user__updated_at"),
+            ),
+            DeductionXuser.objects.filter(
+                user_id__in=entries.values("user_id")
+            ).aggregate(
+                count=Count("id"),
+                active=Count("id", filter=Q(state=DeductionXuser.ACTIVE)),
+                last_id=Max("id"),
+                deductions=Sum("deduction_id"),
+                updated_at=Max("updated_at"),
+            ),
+            Adjustment.objects.filter(payroll_entry__in=entries).aggregate(
+                count=Count("adjustment_id"),
+                last_id=Max("adjustment_id"),
+                active=Count("adjustment_id", filter=Q(state=Adjustment.ACTIVE)),
+                amount=Sum("amount"),
+                updated_at=Max("updated_at"),
+            ),
+        ]
+        for values in aggregates:
+            digest.update(repr(sorted(values.items())).encode())
+
+        return digest.hexdigest()
+
+    def preview(self) -> dict:
+        """
+        Compute the payroll without writing anything. The result is cached by
+        payroll and fingerprint, so it's only recomputed when something changes.
+        """
+        key = f"payroll:preview:{self.payroll.payroll_id}:{self.get_fingerprint()}"
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+        results = self.compute()
+        # Los totales se suman en la moneda base
+        currencies = [result["entry"].user.currency for result in results]
+        totals = {
+            field.upper(): str(
+                DeductionCalculator.from_cents(
+                    CurrencyConverter.convert_cents(
+                        DeductionCalculator.to_cents(
+                            result[field] for result in results
+                        ),
+                        currencies,
+                        self.payroll.period_end,
+                    ).sum()
+                )
+            )
+            for field in self.TOTAL_FIELDS
+        }
+        totals["EMPLOYEES"] = len(results)
+        totals["CURRENCY"] = CurrencyConverter.BASE_CURRENCY
+
+        data = {
+            "entries": PayrollPreviewSerializer(results, many=True).data,
+            "totals": totals,
+        }
+        cache.set(key, data, self.PREVIEW_TIMEOUT)
+        return data
+
+    def build_details(
+        self, results: list[dict], created_by: User
+    ) -> list[PayrollPaymentDetail]:
+        salary_concept = Concept.get_by_name("SALARIO")
+        details: list[PayrollPaymentDetail] = []
+
+        for result in results:
+            entry: PayrollEntry = result["entry"]
+            common = {
+                "payroll": self.payroll,
+                "payroll_entry": entry,
+                "period": self.payroll.period,
+                "state": PayrollPaymentDetail.ACTIVE,
+                "created_by": created_by,
+                "gross_salary": result["gross_salary"],
+                # Salario bruto del período, el mismo que acumula el año a la fecha
+                "period_salary": result["salary"],
+            }
+
+            for deduction in result["deductions"]:
+                details.append(
+                    PayrollPaymentDetail(
+                        concept=deduction["deduction"].concept,
+                        concept_amount=deduction["amount"],
+                        comment=f"Descuento mensual por concepto de {deduction['deduction'].name}",
+                        **common,
+                    )
+                )
+
+            for item in result["adjustments"]:
+                adjustment: Adjustment = item["adjustment"]
+                details.append(
+                    PayrollPaymentDetail(
+                        concept=adjustment.concept,
+                        concept_amount=item["amount"],
+                        comment=adjustment.description,
+                        operator="+" if adjustment.type == "B" else "-",
+                        **common,
+                    )
+                )
+
+            details.append(
+                PayrollPaymentDetail(
+                    concept=salary_concept,
+                    concept_amount=result["net_salary"],
+                    operator="+",
+                    **common,
+                )
+            )
+
+        return details
+
+    @transaction.atomic
+    def run(self, created_by: User) -> list[dict]:
+        """
+        Process the payroll: write the payment details, mark the processed
+        adjustments as completed and the entries as paid.\n
+        Only the unpaid entries that no other transaction is processing are
+        claimed, so an entry is never paid twice.
+        """
+        results = self.compute(claim=True)
+        if not results:
+            return results
+
+        details = self.build_details(results, created_by)
+        PayrollPaymentDetail.objects.bulk_create(details, batch_size=self.BATCH_SIZE)
+
+        entry_ids = [result["entry"].payroll_entry_id for result in results]
+        Adjustment.objects.filter(
+            Q(payroll_entry_id__in=entry_ids) & Q(state=Adjustment.ACTIVE)
+        ).update(state=Adjustment.COMPLETED)
+        # Los bonos completados ya no cuentan en el total de la entrada
+        PayrollEntry.objects.filter(
+            Q(payroll_entry_id__in=entry_ids) & Q(status=False)
+        ).update(status=True, total_bonus=0)
+        self.update_year_to_date(results, created_by)
+
+        return results
+
+    def update_year_to_date(self, results: list[dict], created_by: User):
+        """
+        Add the amounts paid in this run to the year-to-date of every employee
+        """
+        amounts = {}
+        for result in results:
+            paid = {
+                "gross_salary": result["salary"],
+                "net_salary": result["net_salary"],
+                "bonus": result["bonus"],
+                "discount": result["discount"],
+            }
+            # Solo los descuentos de ley que se escribieron en el detalle
+            for deduction in result["deductions"]:
+                paid[deduction["deduction"].name.lower()] = deduction["amount"]
+            amounts[result["entry"].user.username] = paid
+
+        EmployeeYearToDate.accumulate(self.payroll.period_end.year, amounts, created_by)
@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.benchmark import PayrollBenchmark
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the payroll flow and the main endpoints over synthetic data and "
+        "write the report to a JSON file. Nothing is left in the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=list(PayrollBenchmark.SIZES),
+            help="Number of employees of every run",
+        )
+        parser.add_argument(
+            "--output", type=str, default="benchmark.json", help="JSON report"
+        )
+        parser.add_argument("--username", type=str, help="User that makes the requests")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed")
+        parser.add_argument(
+            "--partial",
+            type=int,
+            default=100,
+            help="Employees paid with process_partial_payroll",
+        )
+
+    def handle(self, *args, **kwargs):
+        users = User.objects.filter(is_superuser=True)
+        if kwargs["username"]:
+            users = User.objects.filter(username=kwargs["username"])
+        user = users.order_by("user_id").first()
+        if not user:
+            raise CommandError("No se encontró el usuario que hace las peticiones")
+
+        benchmark = PayrollBenchmark(user, kwargs["seed"], kwargs["partial"])
+        try:
+            report = benchmark.run(kwargs["sizes"])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        with open(kwargs["output"], "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+        for size in report["sizes"]:
+            self.stdout.write(f"{size['employees']} employees")
+            for step in size["steps"]:
+                self.stdout.write(
+                    f"  {step['name']:<40} {step['seconds']:>10.3f}s "
+                    f"{step['queries']:>7} queries  {step['status'] or ''}"
+                )
+        self.stdout.write(self.style.SUCCESS(f"Report written to {kwargs['output']}"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from payroll.models import Payroll, PayrollSummary
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Build the summary of the finalized payrolls that don't have one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", type=str, help="User that builds the summaries")
+        parser.add_argument(
+            "--all", action="store_true", help="Rebuild the existing summaries too"
+        )
+
+    def handle(self, *args, **kwargs):
+        user = User.objects.get(username=kwargs["username"])
+        payrolls = Payroll.objects.filter(status=Payroll.DONE)
+        if not kwargs["all"]:
+            payrolls = payrolls.filter(payrollsummary_payroll__isnull=True)
+
+        count = 0
+        for payroll in payrolls.order_by("payroll_id"):
+            PayrollSummary.build(payroll, user)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built {count} payroll summaries"))
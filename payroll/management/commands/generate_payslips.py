@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.models import Payroll
+from payroll.payslips import PayslipGenerator
+
+
+class Command(BaseCommand):
+    help = "Render the payslips of a payroll to a zip archive or a directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("payroll_id", type=int)
+        parser.add_argument(
+            "--output",
+            help="Zip archive (.zip) or directory. Defaults to PAYSLIP_ROOT",
+        )
+        parser.add_argument("--workers", type=int, help="Number of rendering processes")
+
+    def handle(self, *args, **kwargs):
+        payroll = Payroll.objects.filter(payroll_id=kwargs["payroll_id"]).first()
+        if not payroll:
+            raise CommandError(f"Payroll {kwargs['payroll_id']} does not exist")
+
+        result = PayslipGenerator(
+            payroll, output=kwargs["output"], workers=kwargs["workers"]
+        ).generate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {result['payslips']} payslips in {result['output']}"
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from payroll.models import EmployeeYearToDate
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild the year-to-date amounts of the employees from the payment details"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", type=str, help="User that rebuilds the rows")
+        parser.add_argument(
+            "--year", type=int, help="Rebuild only this year instead of every year"
+        )
+
+    def handle(self, *args, **kwargs):
+        user = User.objects.get(username=kwargs["username"])
+        count = EmployeeYearToDate.rebuild(user, kwargs["year"])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} year-to-date rows"))
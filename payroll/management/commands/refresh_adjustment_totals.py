@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from payroll.models import PayrollEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the bonus and discount totals of the payroll entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--payroll", type=int, help="Only rebuild the entries of this payroll"
+        )
+
+    def handle(self, *args, **kwargs):
+        entries = PayrollEntry.objects.all()
+        if kwargs["payroll"]:
+            entries = entries.filter(payroll_id=kwargs["payroll"])
+
+        updated = PayrollEntry.refresh_adjustment_totals(entries)
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} payroll entries"))
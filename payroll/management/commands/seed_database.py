@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payroll.seeding import DataSeeder
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Seed the database with synthetic employees for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("employees", type=int, help="Number of employees")
+        parser.add_argument(
+            "--username", type=str, help="User that creates the records"
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Random seed")
+
+    def handle(self, *args, **kwargs):
+        users = User.objects.filter(is_superuser=True)
+        if kwargs["username"]:
+            users = User.objects.filter(username=kwargs["username"])
+        user = users.order_by("user_id").first()
+        if not user:
+            raise CommandError("No se encontró el usuario que crea los registros")
+
+        result = DataSeeder(user, kwargs["seed"]).seed(kwargs["employees"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(result['users'])} employees, {result['tasks']} tasks "
+                f"and {result['activities']} activities"
+            )
+        )
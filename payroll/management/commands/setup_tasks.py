@@ -16,7 +16,7 @@ def setup_periodic_tasks():
     PeriodicTask.objects.update_or_create(
         crontab=schedule,
         name="Process Payroll",
-        task="payroll.tasks.process_payroll",
+        task="payroll.tasks.autopay_payroll",
         defaults={"start_time": datetime.now()},
     )
 
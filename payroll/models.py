@@ -1,9 +1,12 @@
+import calendar
 import locale
 import datetime
+from bisect import bisect_right
 from datetime import timedelta
-from decimal import Decimal, getcontext
+from decimal import ROUND_HALF_UP, Decimal, getcontext, localcontext
 from django.db import IntegrityError, models, transaction
-from django.db.models import Q, Max
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, ExtractYear
 from django.forms import ValidationError
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -11,12 +14,13 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework.request import Request
 from rest_framework.exceptions import APIException
 
+from helpers.cache import ReferenceCache
 from helpers.exceptions import PayloadValidationError
-from helpers.models import BaseModels
+from helpers.models import BaseModels, ModelManager
+from helpers.sequences import IdAllocator
 from helpers.utils import ordinal
 from users.models import User
 
-
 locale.setlocale(locale.LC_TIME, "Spanish_Spain.1252")
 
 getcontext().prec = 2
@@ -55,14 +59,54 @@ class Payroll(BaseModels):
         # pylint: disable=no-member
         return f'{self.period_end.strftime("%A %d de %B")}'
 
+    @transaction.atomic
+    def finalize(self, user: User) -> "PayrollSummary":
+        """
+        Mark the payroll as `DONE` and write its summary
+        """
+        Payroll.objects.filter(payroll_id=self.payroll_id).update(
+            status=Payroll.DONE, updated_by=user, updated_at=timezone.now()
+        )
+        self.status = Payroll.DONE
+        return PayrollSummary.build(self, user)
+
+    @transaction.atomic
+    def finalize_if_complete(self, user: User) -> bool:
+        """
+        Finalize the payroll when none of its active entries is left unpaid.
+        The payroll row is locked, so when several partial runs end at the
+        same time only one of them writes the summary.
+        """
+        payroll = (
+            Payroll.objects.select_for_update()
+            .filter(Q(payroll_id=self.payroll_id) & Q(status=Payroll.PENDING))
+            .first()
+        )
+        if not payroll:
+            return False
+
+        if PayrollEntry.objects.filter(
+            Q(payroll_id=self.payroll_id)
+            & Q(state=PayrollEntry.ACTIVE)
+            & Q(status=False)
+        ).exists():
+            return False
+
+        self.finalize(user)
+        return True
+
     @classmethod
     def get_config(cls) -> "PayrollSettings":
-        return PayrollSettings.objects.filter(Q(state=PayrollSettings.ACTIVE)).first()
+        return ReferenceCache.get(
+            "payroll_settings",
+            lambda: PayrollSettings.objects.filter(
+                Q(state=PayrollSettings.ACTIVE)
+            ).first(),
+        )
 
     @transaction.atomic
     def create_payroll(self, request, **kwargs) -> "Payroll":
-        payroll_count = Payroll.objects.all().count()
-        kwargs["payroll_id"] = payroll_count + 1
+        kwargs["payroll_id"] = IdAllocator.next_id(Payroll)
         employee = kwargs.pop("employees", "__all__")
 
         current_date = datetime.datetime.now()
@@ -103,10 +147,43 @@ class Payroll(BaseModels):
             )
         PayrollEntry.create_entries(payroll, employees, request.user)
 
+    def get_periods(self) -> int:
+        """
+        Periods per month the payroll was created with, taken from the length
+        of its period (see `get_next_period`) instead of the current settings
+        """
+        # pylint: disable=no-member
+        days = (self.period_end - self.period_start).days + 1
+        if days >= 28:
+            return 1
+        if days >= 13:
+            return 2
+        return 4
+
+    @staticmethod
+    def get_next_period(config: "PayrollSettings", period_start) -> datetime.date:
+        """
+        Return the last day of the period that starts on `period_start`
+        according to the number of periods per month of `config`
+        """
+        last_day = calendar.monthrange(period_start.year, period_start.month)[1]
+        month_end = period_start.replace(day=last_day)
+
+        if config.periods == 4:
+            # El cuarto período llega hasta el fin de mes, sin un quinto período
+            if period_start.day > 21:
+                return month_end
+            return period_start + timedelta(days=6)
+        if config.periods == 2 and period_start.day <= 15:
+            return period_start.replace(day=15)
+        return month_end
+
     @classmethod
-    def autostart_payroll(cls, user: User):
+    def autostart_payroll(
+        cls, user: User, config: "PayrollSettings" = None
+    ) -> "Payroll":
         try:
-            config = (
+            config = config or (
                 PayrollSettings.objects.filter(
                     Q(state=PayrollSettings.ACTIVE) & Q(autopay=True)
                 )
@@ -126,25 +203,35 @@ class Payroll(BaseModels):
             if last_payroll:
                 period_start = last_payroll.period_end + timedelta(days=1)
             else:
-                period_start = timezone.now().date()
-
-            # Calculando la fecha final
-            if config.duration_days == 30:
-                period_end = period_start + timedelta(days=29)
-            else:
-                period_end = period_start + timedelta(days=config.duration_days - 1)
+                period_start = timezone.now().date().replace(day=1)
+
+            # Calculando la fecha final según los períodos del mes
+            period_end = cls.get_next_period(config, period_start)
+            period = (
+                Payroll.objects.filter(
+                    Q(period_start__year=period_start.year)
+                    & Q(period_start__month=period_start.month)
+                ).count()
+                + 1
+            )
 
             payroll = Payroll.objects.create(
-                payroll_id=Payroll.objects.all().count() + 1,
+                payroll_id=IdAllocator.next_id(Payroll),
                 period_start=period_start,
                 period_end=period_end,
+                period=period,
                 created_by=user,
                 state="A",
                 status=Payroll.PENDING,
             )
 
             # add all active employees to the new payroll
-            employees = User.objects.filter(Q(state="A") & Q(is_staff=True))
+            employees = User.objects.filter(
+                Q(is_active=True)
+                & Q(is_staff=True)
+                & Q(state=User.ACTIVE)
+                & Q(salary__gt=0)
+            )
             PayrollEntry.create_entries(payroll, employees, user)
 
             return payroll
@@ -152,78 +239,14 @@ class Payroll(BaseModels):
         except Exception as e:
             raise APIException(str(e)) from e
 
-    @transaction.atomic
     def process_payroll(
         self, request: Request, users_id: list[int] = None
     ) -> "Payroll":
-        settings = self.get_config()
-        payroll_entries = PayrollEntry.objects.filter(payroll_id=self.payroll_id)
-        if users_id:
-            payroll_entries = payroll_entries.filter(user__user_id__in=users_id)
-
-        for entry in payroll_entries:
-            if settings.periods == self.period:
-                deduction_user = DeductionXuser.get_user_deductions(entry.user)
-
-                if deduction_user:
-                    for deduction in deduction_user:
-                        detail = PayrollPaymentDetail(
-                            payroll=entry.payroll,
-                            payroll_entry=entry,
-                            concept=deduction.deduction.concept,
-                            period=self.period,
-                            concept_amount=DeductionXuser.get_deduction_amount(
-                                entry.user, deduction.deduction.name
-                            ),
-                            state=PayrollPaymentDetail.ACTIVE,
-                            created_by=request.user,
-                            gross_salary=entry.user.salary,
-                            comment=f"Descuento mensual por concepto de {deduction.deduction.name}",
-                        )
-                        detail.save()
-
-            adjustments = Adjustment.get_by_entry(entry)
-            if adjustments:
-                for adjustment in adjustments:
-                    operator = "+" if adjustment.type == "B" else "-"
-                    detail = PayrollPaymentDetail(
-                        payroll=entry.payroll,
-                        payroll_entry=entry,
-                        concept=adjustment.concept,
-                        period=self.period,
-                        concept_amount=Adjustment.get_amount(entry, adjustment.type),
-                        state=PayrollPaymentDetail.ACTIVE,
-                        created_by=request.user,
-                        gross_salary=entry.user.salary,
-                        comment=adjustment.description,
-                        operator=operator,
-                    )
-                    detail.save()
-                    Adjustment.objects.update(state=Adjustment.COMPLETED)
-
-            discount = Adjustment.calc_deduction(entry)
-            bonus = Adjustment.calc_bonus(entry)
-            afp = DeductionXuser.get_afp(entry.user)
-            sfs = DeductionXuser.get_sfs(entry.user)
-            isr = DeductionXuser.get_isr(entry.user)
-
-            salary = entry.user.salary / settings.periods
-            net_salary = (salary + bonus) - discount - afp - sfs - isr
-
-            detail = PayrollPaymentDetail(
-                payroll=entry.payroll,
-                payroll_entry=entry,
-                concept=Concept.objects.get(name="SALARIO"),
-                period=self.period,
-                concept_amount=net_salary,
-                state=PayrollPaymentDetail.ACTIVE,
-                created_by=request.user,
-                gross_salary=entry.user.salary,
-                operator="+",
-            )
-            detail.save()
+        # pylint: disable=import-outside-toplevel
+        from payroll.engine import PayrollEngine
 
-            payroll_entries.update(status=True)
+        PayrollEngine(self, users_id).run(request.user)
+        return self
 
     def save(self, *args, **kwargs):
         self.clean()  # Llama a clean antes de guardar
@@ -250,6 +273,18 @@ class Concept(BaseModels):
     def __str__(self) -> str:
         return f"{self.name}"
 
+    @classmethod
+    def get_by_name(cls, name: str) -> "Concept":
+        concepts: dict[str, Concept] = ReferenceCache.get(
+            "concepts",
+            lambda: {
+                concept.name: concept for concept in cls.objects.order_by("-concept_id")
+            },
+        )
+        if name not in concepts:
+            raise cls.DoesNotExist(f"Concept {name} does not exist")
+        return concepts[name]
+
     class Meta:
         db_table = "CONCEPTS"
         verbose_name = "Concepto"
@@ -316,6 +351,9 @@ class PayrollEntry(BaseModels):
         to_field="username",
     )
     status = models.BooleanField(default=False)
+    # Totales de los ajustes, mantenidos por `Adjustment.save` y `Adjustment.delete`
+    total_bonus = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     REQUIRED_FIELDS = ["payroll_id", "employees", "state"]
     ALLOWED_FIELDS = REQUIRED_FIELDS + ["status"]
@@ -323,18 +361,47 @@ class PayrollEntry(BaseModels):
     def __str__(self):
         return f"@{self.user.username}"
 
+    @classmethod
+    def refresh_adjustment_totals(cls, entries: models.QuerySet = None) -> int:
+        """
+        Recalculate `total_bonus` and `total_discount` from the adjustments
+        with a single UPDATE. Returns the number of entries updated.
+        """
+        entries = cls.objects.all() if entries is None else entries
+
+        def total(condition: Q) -> Coalesce:
+            amounts = (
+                Adjustment.objects.filter(
+                    Q(payroll_entry_id=OuterRef("payroll_entry_id")) & condition
+                )
+                .order_by()
+                .values("payroll_entry_id")
+                .annotate(total=Sum("amount"))
+                .values("total")
+            )
+            return Coalesce(
+                Subquery(amounts),
+                Decimal("0.00"),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+
+        return entries.update(
+            total_bonus=total(Adjustment.BONUS_TOTAL),
+            total_discount=total(Adjustment.DISCOUNT_TOTAL),
+        )
+
     @classmethod
     def create_entries(
         cls, payroll: Payroll, employees: list[User], currentuser: User
     ) -> list["PayrollEntry"]:
         try:
+            employees = list(employees)
+            ids = IdAllocator.allocate(cls, len(employees))
             enries: list[PayrollEntry] = []
-            counter = cls.objects.all().count()
-            for employee in employees:
-                counter += 1
+            for entry_id, employee in zip(ids, employees):
                 enries.append(
                     PayrollEntry(
-                        payroll_entry_id=counter,
+                        payroll_entry_id=entry_id,
                         payroll=payroll,
                         user=employee,
                         state="A",
@@ -365,10 +432,69 @@ class PayrollEntry(BaseModels):
         ]
 
 
+class AdjustmentQuerySet(models.QuerySet):
+    """
+    Bulk writes of adjustments skip `Adjustment.save` and `Adjustment.delete`,
+    so they refresh the `total_bonus` and `total_discount` of the entries they
+    touch with `PayrollEntry.refresh_adjustment_totals`
+    """
+
+    @staticmethod
+    def refresh_totals(entries: set[int] | models.QuerySet):
+        if entries:
+            PayrollEntry.refresh_adjustment_totals(
+                PayrollEntry.objects.filter(payroll_entry_id__in=entries)
+            )
+
+    @transaction.atomic
+    def update(self, **kwargs) -> int:
+        rows = list(self.order_by().values_list("adjustment_id", "payroll_entry_id"))
+        result = super().update(**kwargs)
+        self.refresh_totals({payroll_entry_id for _id, payroll_entry_id in rows})
+        # Las entradas a las que se movieron los ajustes
+        if "payroll_entry" in kwargs or "payroll_entry_id" in kwargs:
+            self.refresh_totals(
+                Adjustment.objects.filter(
+                    adjustment_id__in=[
+                        adjustment_id for adjustment_id, _entry_id in rows
+                    ]
+                ).values("payroll_entry_id")
+            )
+        return result
+
+    @transaction.atomic
+    def delete(self) -> tuple[int, dict[str, int]]:
+        entries = set(self.order_by().values_list("payroll_entry_id", flat=True))
+        result = super().delete()
+        self.refresh_totals(entries)
+        return result
+
+    @transaction.atomic
+    def bulk_create(self, objs, *args, **kwargs) -> list["Adjustment"]:
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self.refresh_totals({obj.payroll_entry_id for obj in objs})
+        return objs
+
+    @transaction.atomic
+    def bulk_update(self, objs, fields, *args, **kwargs) -> int:
+        objs = list(objs)
+        entries = {obj.payroll_entry_id for obj in objs}
+        entries.update(
+            Adjustment.objects.filter(
+                adjustment_id__in=[obj.adjustment_id for obj in objs]
+            ).values_list("payroll_entry_id", flat=True)
+        )
+        result = super().bulk_update(objs, fields, *args, **kwargs)
+        self.refresh_totals(entries)
+        return result
+
+
 class Adjustment(BaseModels):
     """
     Adjustment model\n
-    `TABLE_NAME`: ADJUSTMENT
+    `TABLE_NAME`: ADJUSTMENT\n
+    `save` and `delete` update the totals of the entry by the difference, the
+    bulk writes of `AdjustmentQuerySet` recalculate them.
     """
 
     COMPLETED = "S"
@@ -401,10 +527,92 @@ class Adjustment(BaseModels):
         blank=True,
         null=True,
     )
+    # Nómina pasada que corrige un ajuste retroactivo
+    source_payroll = models.ForeignKey(
+        Payroll,
+        on_delete=models.SET_NULL,
+        related_name="%(class)s_source_payroll",
+        db_column="source_payroll_id",
+        to_field="payroll_id",
+        blank=True,
+        null=True,
+    )
+
+    # Ajustes que suman en `PayrollEntry.total_bonus` y `total_discount`,
+    # los mismos que cuentan `calc_bonus` y `calc_deduction`
+    BONUS_TOTAL = Q(type="B") & Q(state="A")
+    DISCOUNT_TOTAL = Q(type="D")
+
+    objects = ModelManager.from_queryset(AdjustmentQuerySet)()
 
     def __str__(self):
         return f"Ajuste de {self.payroll_entry.user.username}"
 
+    @staticmethod
+    def get_totals(_type: str, state: str, amount: Decimal) -> tuple[Decimal, Decimal]:
+        """
+        Return what an adjustment adds to the bonus and discount totals
+        """
+        if _type == "B" and state == Adjustment.ACTIVE:
+            return amount, Decimal("0.00")
+        if _type == "D":
+            return Decimal("0.00"), amount
+        return Decimal("0.00"), Decimal("0.00")
+
+    @staticmethod
+    def add_to_totals(payroll_entry_id: int, bonus: Decimal, discount: Decimal):
+        if not bonus and not discount:
+            return
+
+        # Con `output_field` explícito el valor no depende del contexto global
+        # de `decimal`, que en este módulo tiene precisión 2
+        def amount(value: Decimal) -> Value:
+            return Value(
+                value, output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            )
+
+        PayrollEntry.objects.filter(payroll_entry_id=payroll_entry_id).update(
+            total_bonus=F("total_bonus") + amount(bonus),
+            total_discount=F("total_discount") + amount(discount),
+        )
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        previous = None
+        if not self._state.adding:
+            previous = (
+                Adjustment.objects.select_for_update()
+                .filter(adjustment_id=self.adjustment_id)
+                .values("payroll_entry_id", "type", "state", "amount")
+                .first()
+            )
+
+        super().save(*args, **kwargs)
+
+        if previous:
+            bonus, discount = self.get_totals(
+                previous["type"], previous["state"], previous["amount"]
+            )
+            self.add_to_totals(
+                previous["payroll_entry_id"],
+                bonus.copy_negate(),
+                discount.copy_negate(),
+            )
+
+        self.add_to_totals(
+            self.payroll_entry_id,
+            *self.get_totals(self.type, self.state, Decimal(self.amount)),
+        )
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        bonus, discount = self.get_totals(self.type, self.state, Decimal(self.amount))
+        result = super().delete(*args, **kwargs)
+        self.add_to_totals(
+            self.payroll_entry_id, bonus.copy_negate(), discount.copy_negate()
+        )
+        return result
+
     @classmethod
     def calc_bonus(cls, entry: PayrollEntry) -> Decimal:
         bonus = Adjustment.objects.filter(
@@ -441,8 +649,7 @@ class Adjustment(BaseModels):
         )
 
     def create_adjustment(self, request, **kwargs):
-        adjustment_count = Adjustment.objects.all().count()
-        kwargs["adjustment_id"] = adjustment_count + 1
+        kwargs["adjustment_id"] = IdAllocator.next_id(Adjustment)
         return super().create(request, **kwargs)
 
     class Meta:
@@ -480,9 +687,37 @@ class Deductions(BaseModels):
     def __str__(self):
         return f"{self.name} - {self.percentage}"
 
+    @classmethod
+    def get_all(cls) -> dict[int, "Deductions"]:
+        """
+        Every deduction by `deduction_id`, kept in `ReferenceCache`
+        """
+        return ReferenceCache.get(
+            "deductions",
+            lambda: {
+                deduction.deduction_id: deduction for deduction in cls.objects.all()
+            },
+        )
+
+    @classmethod
+    def get_by_id(cls, deduction_id: int) -> "Deductions":
+        deductions = cls.get_all()
+        if deduction_id not in deductions:
+            raise cls.DoesNotExist(f"Deduction {deduction_id} does not exist")
+        return deductions[deduction_id]
+
+    @classmethod
+    def get_active(cls, deduction_id: int, name: str) -> "Deductions | None":
+        """
+        Return the deduction if it's named `name` and it's active
+        """
+        deduction = cls.get_by_id(deduction_id)
+        if deduction.name != name or deduction.state != cls.ACTIVE:
+            return None
+        return deduction
+
     def create_deduction(self, request, **kwargs):
-        deduction_count = self.objects.all().count()
-        kwargs["deduction_id"] = deduction_count + 1
+        kwargs["deduction_id"] = IdAllocator.next_id(Deductions)
         super().create(request, **kwargs)
 
     class Meta:
@@ -498,6 +733,210 @@ class Deductions(BaseModels):
         ]
 
 
+class IsrScale(BaseModels):
+    """
+    Progressive ISR scale\n
+    A scale is a versioned set of annual brackets that applies from `effective_from`.
+    The newest active version in effect is the one used to calculate the ISR\n
+    `TABLE_NAME`: ISR_SCALE
+    """
+
+    isr_scale_id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    effective_from = models.DateField()
+    version = models.IntegerField(default=1)
+
+    def __str__(self) -> str:
+        return f"{self.name} v{self.version} ({self.effective_from})"
+
+    @classmethod
+    def get_current(cls, date: datetime.date = None) -> "IsrScale":
+        """
+        Return the scale in effect on `date` (today by default)
+        """
+        date = date or timezone.localdate()
+        scales: list[IsrScale] = ReferenceCache.get("isr_scales", cls.load_scales)
+        return next((scale for scale in scales if scale.effective_from <= date), None)
+
+    @classmethod
+    def load_scales(cls) -> list["IsrScale"]:
+        scales = list(
+            cls.objects.filter(state=cls.ACTIVE).order_by("-effective_from", "-version")
+        )
+        for scale in scales:
+            scale.get_brackets()
+        return scales
+
+    def get_brackets(self) -> list["IsrBracket"]:
+        if not hasattr(self, "_brackets"):
+            # pylint: disable=no-member
+            self._brackets = list(
+                self.isrbracket_scale.filter(state=IsrBracket.ACTIVE).order_by(
+                    "lower_limit"
+                )
+            )
+        return self._brackets
+
+    def get_table(self) -> dict[str, list[Decimal]]:
+        """
+        Return the lower limits, fixed amounts and percentages of the brackets
+        """
+        brackets = self.get_brackets()
+        return {
+            "limits": [bracket.lower_limit for bracket in brackets],
+            "fixed_amounts": [bracket.fixed_amount for bracket in brackets],
+            "percentages": [bracket.percentage for bracket in brackets],
+        }
+
+    def refresh_fixed_amounts(self):
+        """
+        Recalculate the accumulated tax at the start of every bracket
+        """
+        if hasattr(self, "_brackets"):
+            del self._brackets
+
+        brackets = self.get_brackets()
+        fixed_amount = Decimal("0.00")
+        with localcontext(prec=28, rounding=ROUND_HALF_UP):
+            for index, bracket in enumerate(brackets):
+                if index:
+                    previous = brackets[index - 1]
+                    fixed_amount += (
+                        (bracket.lower_limit - previous.lower_limit)
+                        * previous.percentage
+                        / 100
+                    ).quantize(Decimal("0.01"))
+                bracket.fixed_amount = fixed_amount
+
+        IsrBracket.objects.bulk_update(brackets, ["fixed_amount"])
+
+    def get_annual_tax(self, income: Decimal) -> Decimal:
+        """
+        Annual ISR of `income`: the fixed amount of its bracket plus the
+        percentage of the excess over the lower limit
+        """
+        table = self.get_table()
+        index = bisect_right(table["limits"], income) - 1
+        if index < 0:
+            return Decimal("0.00")
+
+        with localcontext(prec=28, rounding=ROUND_HALF_UP):
+            return table["fixed_amounts"][index] + (
+                (income - table["limits"][index]) * table["percentages"][index] / 100
+            )
+
+    class Meta:
+        db_table = "ISR_SCALE"
+        verbose_name = "Escala ISR"
+        verbose_name_plural = "Escalas ISR"
+        ordering = ["-effective_from", "-version"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["effective_from", "version"], name="unique_isr_scale"
+            )
+        ]
+
+
+class IsrBracket(BaseModels):
+    """
+    ISR bracket\n
+    `lower_limit` is the annual income where the bracket starts and `fixed_amount`
+    the tax accumulated by the previous brackets, calculated when the scale changes\n
+    `TABLE_NAME`: ISR_BRACKET
+    """
+
+    isr_bracket_id = models.AutoField(primary_key=True)
+    scale = models.ForeignKey(
+        IsrScale,
+        on_delete=models.CASCADE,
+        related_name="%(class)s_scale",
+        db_column="isr_scale_id",
+        to_field="isr_scale_id",
+    )
+    lower_limit = models.DecimalField(max_digits=12, decimal_places=2)
+    percentage = models.DecimalField(max_digits=5, decimal_places=2)
+    fixed_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False
+    )
+
+    def __str__(self) -> str:
+        return f"{self.scale} - {self.lower_limit} ({self.percentage}%)"
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.scale.refresh_fixed_amounts()
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        scale = self.scale
+        result = super().delete(*args, **kwargs)
+        scale.refresh_fixed_amounts()
+        return result
+
+    class Meta:
+        db_table = "ISR_BRACKET"
+        verbose_name = "Tramo ISR"
+        verbose_name_plural = "Tramos ISR"
+        ordering = ["scale", "lower_limit"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scale", "lower_limit"], name="unique_isr_bracket"
+            )
+        ]
+
+
+class ExchangeRate(BaseModels):
+    """
+    Value of one unit of `currency` in the base currency (`RD`) from
+    `effective_from` on. The rate in effect on a date is the newest active one
+    that starts on or before it\n
+    `TABLE_NAME`: EXCHANGE_RATE
+    """
+
+    BASE_CURRENCY = "RD"
+    CURRENCY_CHOICES = (("USD", "USD"), ("EUR", "EUR"))
+
+    exchange_rate_id = models.AutoField(primary_key=True)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    rate = models.DecimalField(max_digits=14, decimal_places=6)
+    effective_from = models.DateField()
+
+    def __str__(self) -> str:
+        return f"{self.currency} {self.rate} ({self.effective_from})"
+
+    @classmethod
+    def load_rates(cls) -> list["ExchangeRate"]:
+        return list(
+            cls.objects.filter(state=cls.ACTIVE).order_by(
+                "-effective_from", "-exchange_rate_id"
+            )
+        )
+
+    @classmethod
+    def get_rates(cls, date: datetime.date = None) -> dict[str, Decimal]:
+        """
+        Return the rate of every currency in effect on `date` (today by default)
+        """
+        date = date or timezone.localdate()
+        rates = {cls.BASE_CURRENCY: Decimal(1)}
+        for rate in ReferenceCache.get("exchange_rates", cls.load_rates):
+            if rate.effective_from <= date:
+                rates.setdefault(rate.currency, rate.rate)
+        return rates
+
+    class Meta:
+        db_table = "EXCHANGE_RATE"
+        verbose_name = "Tasa de cambio"
+        verbose_name_plural = "Tasas de cambio"
+        ordering = ["currency", "-effective_from"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["currency", "effective_from"], name="unique_exchange_rate"
+            )
+        ]
+
+
 class DeductionXuser(BaseModels):
     """
     Deduction X User model\n
@@ -535,15 +974,14 @@ class DeductionXuser(BaseModels):
     @classmethod
     def add_deductions_to_user(cls, deductions: list["Deductions"], user: User):
         user_deductions = []
-        max_id = DeductionXuser.objects.all().aggregate(Max("id"))["id__max"]
-        for deduction in deductions:
-            max_id += 1
+        ids = IdAllocator.allocate(DeductionXuser, len(deductions))
+        for deduction_user_id, deduction in zip(ids, deductions):
             user_deductions.append(
                 DeductionXuser(
-                    id=max_id,
+                    id=deduction_user_id,
                     state=Deductions.ACTIVE,
                     user=user,
-                    deduction=Deductions.objects.get(deduction_id=deduction),
+                    deduction=Deductions.get_by_id(deduction),
                     created_by=user.created_by,
                     created_at=datetime.datetime.now(),
                 )
@@ -551,8 +989,7 @@ class DeductionXuser(BaseModels):
         DeductionXuser.objects.bulk_create(user_deductions)
 
     def create_deduction_user(self, request, **kwargs):
-        deduction_user_count = self.objects.all().count()
-        kwargs["id"] = deduction_user_count + 1
+        kwargs["id"] = IdAllocator.next_id(DeductionXuser)
         super().create(request, **kwargs)
 
     @classmethod
@@ -568,11 +1005,9 @@ class DeductionXuser(BaseModels):
     def get_afp(cls, user: User) -> Decimal:
         user_deduction = DeductionXuser.get_user_deductions(user, "AFP")
         if user_deduction:
-            deduction = Deductions.objects.filter(
-                Q(name="AFP")
-                & Q(state=Deductions.ACTIVE)
-                & Q(deduction_id=user_deduction.deduction.deduction_id)
-            ).first()
+            deduction = Deductions.get_active(user_deduction.deduction_id, "AFP")
+            if not deduction:
+                return Decimal("0.0")
             percentage = deduction.percentage
             return (user.salary * percentage) / 100
         return Decimal("0.0")
@@ -581,25 +1016,25 @@ class DeductionXuser(BaseModels):
     def get_sfs(cls, user: User) -> Decimal:
         user_deduction = DeductionXuser.get_user_deductions(user, "SFS")
         if user_deduction:
-            deduction = Deductions.objects.filter(
-                Q(name="SFS")
-                & Q(state=Deductions.ACTIVE)
-                & Q(deduction_id=user_deduction.deduction.deduction_id)
-            ).first()
+            deduction = Deductions.get_active(user_deduction.deduction_id, "SFS")
+            if not deduction:
+                return Decimal("0.0")
             percentage = deduction.percentage
             return (user.salary * percentage) / 100
         return Decimal("0.0")
 
     @classmethod
-    def get_isr(cls, user: User) -> Decimal:
+    def get_isr(cls, user: User, date: datetime.date = None) -> Decimal:
+        """
+        Monthly ISR of the user with the scale in effect on `date` (today by
+        default), usually the end of the payroll
+        """
         # Obtén la deducción ISR desde la base de datos
         user_deduction = DeductionXuser.get_user_deductions(user, "ISR")
         if user_deduction:
-            deduction = Deductions.objects.filter(
-                Q(name="ISR")
-                & Q(state=Deductions.ACTIVE)
-                & Q(deduction_id=user_deduction.deduction.deduction_id)
-            ).first()
+            deduction = Deductions.get_active(user_deduction.deduction_id, "ISR")
+            if not deduction:
+                return Decimal("0.0")
 
             # Porcentaje específico del usuario
             percentage = deduction.percentage / 100
@@ -615,6 +1050,14 @@ class DeductionXuser(BaseModels):
             # Calcula el salario neto anual
             annual_net_salary = salary * 12
 
+            # Con una escala vigente se aplican los tramos progresivos
+            scale = IsrScale.get_current(date)
+            if scale and scale.get_brackets():
+                with localcontext(prec=28, rounding=ROUND_HALF_UP):
+                    return (scale.get_annual_tax(annual_net_salary) / 12).quantize(
+                        Decimal("0.01")
+                    )
+
             # Aplica el porcentaje correspondiente para calcular el ISR mensual
             isr = (annual_net_salary * percentage) / 12
 
@@ -625,11 +1068,9 @@ class DeductionXuser(BaseModels):
     def get_deduction_amount(cls, user: User, name: str):
         user_deduction = DeductionXuser.get_user_deductions(user, name)
         if user_deduction:
-            deduction = Deductions.objects.filter(
-                Q(name=name)
-                & Q(state=Deductions.ACTIVE)
-                & Q(deduction_id=user_deduction.deduction.deduction_id)
-            ).first()
+            deduction = Deductions.get_active(user_deduction.deduction_id, name)
+            if not deduction:
+                return 0.0
             percentage = deduction.percentage
             return (user.salary * percentage) / 100
         return 0.0
@@ -679,6 +1120,10 @@ class PayrollPaymentDetail(BaseModels):
     period = models.IntegerField(null=False, blank=False)
     concept_amount = models.DecimalField(decimal_places=2, max_digits=10)
     gross_salary = models.DecimalField(decimal_places=2, max_digits=10)
+    # Salario bruto del período (mensual / períodos), el que acumula el año a la fecha
+    period_salary = models.DecimalField(
+        decimal_places=2, max_digits=10, null=True, blank=True
+    )
     comment = models.TextField(null=True, blank=True)
     operator = models.CharField(max_length=1, default="-", choices=OPERATOR_CHOISES)
 
@@ -695,7 +1140,319 @@ class PayrollPaymentDetail(BaseModels):
 
     get_meployee_name.short_description = "Nombre empelado"
 
+    @classmethod
+    def fill_period_salary(cls, batch_size: int = 1000) -> int:
+        """
+        Fill `period_salary` in the details written before it existed, dividing
+        their monthly `gross_salary` by the periods of their payroll
+        """
+        details = (
+            cls.objects.filter(period_salary__isnull=True)
+            .select_related("payroll")
+            .only("id", "gross_salary", "payroll__period_start", "payroll__period_end")
+            .order_by("id")
+        )
+        count = 0
+        batch = []
+        with localcontext(prec=28, rounding=ROUND_HALF_UP):
+            for detail in details.iterator(chunk_size=batch_size):
+                detail.period_salary = (
+                    detail.gross_salary / detail.payroll.get_periods()
+                ).quantize(Decimal("0.01"))
+                batch.append(detail)
+                if len(batch) == batch_size:
+                    count += cls.objects.bulk_update(batch, ["period_salary"])
+                    batch = []
+            if batch:
+                count += cls.objects.bulk_update(batch, ["period_salary"])
+
+        return count
+
     class Meta:
         db_table = "PAYROLL_PAYMENT_DETAIL"
         verbose_name = "Detalle de pago"
         verbose_name_plural = "Detalles de Pagos de nómina"
+
+
+class PayrollSummary(BaseModels):
+    """
+    Totals of a finalized payroll, written once by `Payroll.finalize` so the
+    history doesn't have to add up the payment details again\n
+    `concept_totals` holds the amount, operator and number of entries of every
+    concept\n
+    `TABLE_NAME` PAYROLL_SUMMARY
+    """
+
+    payroll = models.OneToOneField(
+        Payroll,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="%(class)s_payroll",
+        db_column="payroll_id",
+        to_field="payroll_id",
+    )
+    headcount = models.IntegerField(default=0)
+    gross_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_earnings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_deductions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    concept_totals = models.JSONField(default=list)
+
+    def __str__(self) -> str:
+        return f"Resumen {self.payroll_id}"
+
+    @classmethod
+    def build(cls, payroll: Payroll, user: User) -> "PayrollSummary":
+        """
+        Add up the payment details of `payroll` in SQL and store the result.
+        The amounts are converted to the base currency with the rates in effect
+        at the end of the period
+        """
+        # pylint: disable=import-outside-toplevel
+        from payroll.currency import CurrencyConverter
+
+        salary_concept = Concept.get_by_name("SALARIO")
+        details = PayrollPaymentDetail.objects.filter(
+            Q(payroll_id=payroll.payroll_id) & Q(state=PayrollPaymentDetail.ACTIVE)
+        )
+        CurrencyConverter.check(
+            details, "payroll_entry__user__currency", payroll.period_end
+        )
+        details = details.annotate(
+            base_amount=CurrencyConverter.to_base(
+                "concept_amount", "payroll_entry__user__currency", payroll.period_end
+            ),
+            base_gross_salary=CurrencyConverter.to_base(
+                "gross_salary", "payroll_entry__user__currency", payroll.period_end
+            ),
+        )
+        is_salary = Q(concept_id=salary_concept.concept_id)
+
+        totals = details.aggregate(
+            headcount=Count("payroll_entry_id", distinct=True),
+            gross_salary=Sum("base_gross_salary", filter=is_salary),
+            total_earnings=Sum("base_amount", filter=Q(operator="+") & ~is_salary),
+            total_deductions=Sum("base_amount", filter=Q(operator="-")),
+            net_salary=Sum("base_amount", filter=is_salary),
+        )
+        concepts = (
+            details.order_by()
+            .values("concept__name", "operator")
+            .annotate(
+                amount=Sum("base_amount"),
+                entries=Count("payroll_entry_id", distinct=True),
+            )
+        )
+
+        values = {
+            **{key: value or 0 for key, value in totals.items()},
+            "concept_totals": [
+                {
+                    "concept": concept["concept__name"],
+                    "operator": concept["operator"],
+                    "amount": f"{concept['amount']:.2f}",
+                    "entries": concept["entries"],
+                }
+                for concept in concepts.order_by("concept__name", "operator")
+            ],
+        }
+        summary, _created = cls.objects.update_or_create(
+            payroll=payroll,
+            defaults={**values, "updated_by": user, "updated_at": timezone.now()},
+            create_defaults={**values, "created_by": user},
+        )
+        return summary
+
+    class Meta:
+        db_table = "PAYROLL_SUMMARY"
+        verbose_name = "Resumen de nómina"
+        verbose_name_plural = "Resúmenes de nómina"
+        ordering = ["-payroll"]
+
+
+class EmployeeYearToDate(BaseModels):
+    """
+    Amounts paid to an employee in a year, accumulated by `PayrollEngine.run`
+    with one bulk upsert per run, so the annual figures are read from a single
+    row instead of adding up every payment detail of the year.\n
+    `TABLE_NAME` EMPLOYEE_YEAR_TO_DATE
+    """
+
+    AMOUNT_FIELDS = (
+        "gross_salary",
+        "net_salary",
+        "afp",
+        "sfs",
+        "isr",
+        "bonus",
+        "discount",
+    )
+    BATCH_SIZE = 1000
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="%(class)s_user",
+        db_column="user",
+        to_field="username",
+    )
+    year = models.IntegerField()
+    payments = models.IntegerField(default=0)
+    gross_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_salary = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    afp = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sfs = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    isr = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bonus = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.year}"
+
+    @classmethod
+    def get(cls, username: str, year: int) -> "EmployeeYearToDate | None":
+        return cls.objects.filter(Q(user_id=username) & Q(year=year)).first()
+
+    @classmethod
+    def upsert(cls, rows: list["EmployeeYearToDate"]):
+        cls.objects.bulk_create(
+            rows,
+            batch_size=cls.BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["user", "year"],
+            update_fields=[
+                *cls.AMOUNT_FIELDS,
+                "payments",
+                "updated_at",
+                "updated_by",
+            ],
+        )
+
+    @classmethod
+    @transaction.atomic
+    def accumulate(cls, year: int, amounts: dict[str, dict[str, Decimal]], user: User):
+        """
+        Add the amounts paid in one run, by username, to the rows of `year`.
+        The existing rows are locked while they are updated
+        """
+        if not amounts:
+            return
+
+        existing = {
+            row.user_id: row
+            for row in cls.objects.select_for_update()
+            .filter(Q(year=year) & Q(user_id__in=list(amounts)))
+            .order_by("user_id")
+        }
+        now = timezone.now()
+        rows = []
+        # Contexto propio: la precisión global de `decimal` en este módulo es 2
+        with localcontext(prec=28):
+            for username, values in amounts.items():
+                row = existing.get(username) or cls(
+                    user_id=username, year=year, created_by=user, created_at=now
+                )
+                for field in cls.AMOUNT_FIELDS:
+                    setattr(
+                        row, field, Decimal(getattr(row, field)) + values.get(field, 0)
+                    )
+                row.payments += 1
+                row.updated_by = user
+                row.updated_at = now
+                rows.append(row)
+
+        cls.upsert(rows)
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, user: User, year: int = None) -> int:
+        """
+        Rebuild the rows of `year` (every year by default) from the payment
+        details and the adjustments, adding them up in SQL. The gross salary is
+        the `period_salary` of the `SALARIO` detail, filled first for the details
+        written before it existed
+        """
+        PayrollPaymentDetail.fill_period_salary()
+        details = PayrollPaymentDetail.objects.filter(state=PayrollPaymentDetail.ACTIVE)
+        adjustments = Adjustment.objects.filter(
+            (Q(type="B") & Q(state=Adjustment.COMPLETED)) | Q(type="D"),
+            payroll_entry__status=True,
+        )
+        if year:
+            details = details.filter(payroll__period_end__year=year)
+            adjustments = adjustments.filter(
+                payroll_entry__payroll__period_end__year=year
+            )
+
+        salary = Q(concept_id=Concept.get_by_name("SALARIO").concept_id)
+        deductions = dict(
+            Deductions.objects.filter(name__in=["AFP", "SFS", "ISR"]).values_list(
+                "name", "concept_id"
+            )
+        )
+
+        def concept_sum(name: str) -> Sum:
+            return Sum("concept_amount", filter=Q(concept_id=deductions.get(name)))
+
+        now = timezone.now()
+        rows: dict[tuple[str, int], EmployeeYearToDate] = {}
+        for values in (
+            details.order_by()
+            .values(
+                username=F("payroll_entry__user_id"),
+                period_year=ExtractYear("payroll__period_end"),
+            )
+            .annotate(
+                payments=Count("payroll_entry_id", distinct=True),
+                gross_salary=Sum("period_salary", filter=salary),
+                net_salary=Sum("concept_amount", filter=salary),
+                afp=concept_sum("AFP"),
+                sfs=concept_sum("SFS"),
+                isr=concept_sum("ISR"),
+            )
+        ):
+            username = values.pop("username")
+            period_year = values.pop("period_year")
+            rows[(username, period_year)] = cls(
+                user_id=username,
+                year=period_year,
+                created_by=user,
+                created_at=now,
+                updated_by=user,
+                updated_at=now,
+                **{key: value or 0 for key, value in values.items()},
+            )
+
+        for values in (
+            adjustments.order_by()
+            .values(
+                username=F("payroll_entry__user_id"),
+                period_year=ExtractYear("payroll_entry__payroll__period_end"),
+            )
+            .annotate(
+                bonus=Sum("amount", filter=Q(type="B")),
+                discount=Sum("amount", filter=Q(type="D")),
+            )
+        ):
+            row = rows.get((values["username"], values["period_year"]))
+            if row:
+                row.bonus = values["bonus"] or 0
+                row.discount = values["discount"] or 0
+
+        existing = cls.objects.all()
+        if year:
+            existing = existing.filter(year=year)
+        existing.delete()
+        cls.upsert(list(rows.values()))
+        return len(rows)
+
+    class Meta:
+        db_table = "EMPLOYEE_YEAR_TO_DATE"
+        verbose_name = "Acumulado anual de empleado"
+        verbose_name_plural = "Acumulados anuales de empleados"
+        ordering = ["-year", "user"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "year"], name="unique_employee_year_to_date"
+            )
+        ]
@@ -0,0 +1,182 @@
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import Prefetch, Q
+from django.template.loader import render_to_string
+
+from payroll.models import Payroll, PayrollEntry, PayrollPaymentDetail
+
+
+def init_worker():
+    """
+    Initializer of the pool processes, needed when they are spawned instead
+    of forked
+    """
+    django.setup()
+
+
+def render_chunk(payroll_id: int, entries_id: list[int]) -> list[tuple[str, str]]:
+    """
+    Render the payslips of a chunk of entries. The entries are loaded with their
+    users and payment details in one query plus one prefetch query.
+    """
+    payroll = Payroll.objects.get(payroll_id=payroll_id)
+    entries = (
+        PayrollEntry.objects.filter(payroll_entry_id__in=entries_id)
+        .select_related("user", "user__department")
+        .prefetch_related(
+            Prefetch(
+                "payrollpaymentdetail_payroll_entry",
+                queryset=PayrollPaymentDetail.objects.filter(
+                    state=PayrollPaymentDetail.ACTIVE
+                )
+                .select_related("concept")
+                .order_by("id"),
+                to_attr="details",
+            )
+        )
+        .order_by("payroll_entry_id")
+    )
+
+    return [
+        (
+            PayslipGenerator.get_filename(entry),
+            render_to_string(
+                PayslipGenerator.TEMPLATE_NAME,
+                PayslipGenerator.get_context(payroll, entry),
+            ),
+        )
+        for entry in entries
+    ]
+
+
+class PayslipGenerator:
+    """
+    Render an HTML payslip for every paid entry of a payroll.\n
+    The entries are split in chunks and every chunk is rendered by a process of
+    a `ProcessPoolExecutor`, which loads it with a single prefetch query. The
+    payslips are written to a zip archive when `output` ends with `.zip` and to a
+    directory otherwise.\n
+    Celery workers are daemonic processes and can't start a pool, so the API
+    fans the chunks out as a chord of `render_payslips_chunk` tasks and only
+    uses `write` here (see `start_payslips_job`).
+    """
+
+    TEMPLATE_NAME = "payroll/payslip.html"
+    CHUNK_SIZE = 250
+
+    def __init__(self, payroll: Payroll, output: str = None, workers: int = None):
+        self.payroll = payroll
+        self.output = Path(output or self.get_default_output(payroll))
+        self.workers = workers or getattr(settings, "PAYSLIP_WORKERS", None)
+
+    @staticmethod
+    def get_default_output(payroll: Payroll) -> Path:
+        return Path(settings.PAYSLIP_ROOT) / f"nomina_{payroll.payroll_id}.zip"
+
+    @staticmethod
+    def get_filename(entry: PayrollEntry) -> str:
+        return f"{entry.payroll_entry_id}_{entry.user.username}.html"
+
+    @staticmethod
+    def get_context(payroll: Payroll, entry: PayrollEntry) -> dict:
+        salary = None
+        earnings = []
+        deductions = []
+        for detail in entry.details:
+            if detail.concept and detail.concept.name == "SALARIO":
+                salary = detail
+            elif detail.operator == "+":
+                earnings.append(detail)
+            else:
+                deductions.append(detail)
+
+        return {
+            "payroll": payroll,
+            "payroll_label": str(payroll),
+            "entry": entry,
+            "user": entry.user,
+            "gross_salary": entry.details[0].gross_salary if entry.details else None,
+            "earnings": earnings,
+            "deductions": deductions,
+            "net_salary": salary.concept_amount if salary else None,
+        }
+
+    def get_chunks(self) -> list[list[int]]:
+        entries_id = list(
+            PayrollEntry.objects.filter(
+                Q(payroll_id=self.payroll.payroll_id) & Q(status=True)
+            )
+            .order_by("payroll_entry_id")
+            .values_list("payroll_entry_id", flat=True)
+        )
+        return [
+            entries_id[index : index + self.CHUNK_SIZE]
+            for index in range(0, len(entries_id), self.CHUNK_SIZE)
+        ]
+
+    def render(self, chunks: list[list[int]]):
+        """
+        Yield the rendered chunks as they are completed
+        """
+        if self.workers == 1 or multiprocessing.current_process().daemon:
+            for chunk in chunks:
+                yield render_chunk(self.payroll.payroll_id, chunk)
+            return
+
+        # Los procesos hijos no deben heredar las conexiones abiertas
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_worker
+        ) as executor:
+            yield from executor.map(
+                render_chunk,
+                [self.payroll.payroll_id] * len(chunks),
+                chunks,
+            )
+
+    def write(self, rendered: Iterable[list[tuple[str, str]]]) -> dict:
+        """
+        Write the rendered chunks to `output`.\n
+        The zip archive is written to a temporary file in the same directory and
+        moved into place when complete, so a download never gets a partial one.
+        """
+        count = 0
+
+        if self.output.suffix == ".zip":
+            self.output.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=self.output.parent, suffix=".tmp", delete=False
+            ) as temp:
+                try:
+                    with zipfile.ZipFile(temp, "w", zipfile.ZIP_DEFLATED) as archive:
+                        for payslips in rendered:
+                            for filename, content in payslips:
+                                archive.writestr(filename, content)
+                                count += 1
+                except BaseException:
+                    os.unlink(temp.name)
+                    raise
+            os.replace(temp.name, self.output)
+        else:
+            self.output.mkdir(parents=True, exist_ok=True)
+            for payslips in rendered:
+                for filename, content in payslips:
+                    (self.output / filename).write_text(content, encoding="utf-8")
+                    count += 1
+
+        return {"output": os.fspath(self.output), "payslips": count}
+
+    def generate(self) -> dict:
+        """
+        Render every payslip and write them to `output`
+        """
+        return self.write(self.render(self.get_chunks()))
@@ -0,0 +1,282 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from helpers.sequences import IdAllocator
+from payroll.calculator import DeductionCalculator
+from payroll.models import (
+    Adjustment,
+    Concept,
+    IsrScale,
+    Payroll,
+    PayrollEntry,
+    PayrollPaymentDetail,
+)
+from users.models import User
+
+
+class RetroPayEngine:
+    """
+    Retroactive payroll recalculation after a backdated salary change.\n
+    Every finalized payroll that ends on or after `effective_from` is
+    recalculated in memory for the given users with their current salary,
+    using `DeductionCalculator` over the whole population of each payroll at
+    once. The new net salary is compared with the stored `SALARIO` detail plus
+    the retroactive adjustments already written for that payroll, and only the
+    difference is written into `payroll` (the pending one) as a bonus or a
+    discount, so running it again doesn't pay twice.\n
+    The bonuses and discounts of the past payrolls are taken from their
+    adjustments, the same ones the engine used when the payroll was processed,
+    and the periods per month from the length of each payroll (see
+    `Payroll.get_periods`), since the settings may have changed since then.\n
+    The differences of users without an unpaid entry in `payroll` can't be
+    written; they are left out of the results and kept in `not_applied`.\n
+    The adjustments take the `RETROACTIVO` concept, or `BONO`/`DESCUENTO` when
+    it doesn't exist, since the payment details need a concept.
+    """
+
+    BATCH_SIZE = 1000
+    CONCEPT_NAME = "RETROACTIVO"
+    FALLBACK_CONCEPTS = {"B": "BONO", "D": "DESCUENTO"}
+
+    def __init__(
+        self,
+        payroll: Payroll,
+        usernames: list[str],
+        effective_from: datetime.date,
+        created_by: User,
+    ):
+        self.payroll = payroll
+        self.usernames = set(usernames)
+        self.effective_from = effective_from
+        self.created_by = created_by
+        self.adjustments: list[Adjustment] = []
+        self.not_applied: list[dict] = []
+
+    def get_history(self) -> list[PayrollEntry]:
+        """
+        Paid entries of the users in the finalized payrolls affected by the change
+        """
+        return list(
+            PayrollEntry.objects.filter(
+                Q(user_id__in=self.usernames)
+                & Q(status=True)
+                & Q(payroll__status=Payroll.DONE)
+                & Q(payroll__period_end__gte=self.effective_from)
+            )
+            .exclude(payroll_id=self.payroll.payroll_id)
+            .select_related("user", "payroll")
+            .order_by("payroll__period_end", "payroll_entry_id")
+        )
+
+    @staticmethod
+    def get_adjustment_totals(entries_id: list[int]) -> dict[tuple[int, str], int]:
+        """
+        Bonuses and discounts in cents by entry and type, counted like
+        `PayrollEngine.compute` did when the payroll was processed
+        """
+        totals = (
+            Adjustment.objects.filter(
+                Q(payroll_entry_id__in=entries_id)
+                & ((Q(type="B") & Q(state=Adjustment.COMPLETED)) | Q(type="D"))
+            )
+            .order_by()
+            .values("payroll_entry_id", "type")
+            .annotate(amount=Sum("amount"))
+        )
+        return {
+            (row["payroll_entry_id"], row["type"]): int(
+                DeductionCalculator.to_cents([row["amount"]])[0]
+            )
+            for row in totals
+        }
+
+    @staticmethod
+    def get_stored_net(entries_id: list[int]) -> dict[int, Decimal]:
+        salary_concept = Concept.get_by_name("SALARIO")
+        return dict(
+            PayrollPaymentDetail.objects.filter(
+                Q(payroll_entry_id__in=entries_id)
+                & Q(concept_id=salary_concept.concept_id)
+                & Q(state=PayrollPaymentDetail.ACTIVE)
+            ).values_list("payroll_entry_id", "concept_amount")
+        )
+
+    def get_applied(self) -> dict[tuple[str, int], int]:
+        """
+        Retroactive amounts already written, in cents, by user and source payroll
+        """
+        applied: dict[tuple[str, int], int] = {}
+        adjustments = (
+            Adjustment.objects.filter(
+                Q(source_payroll__isnull=False)
+                & Q(payroll_entry__user_id__in=self.usernames)
+                & ~Q(state=Adjustment.INACTIVE)
+            )
+            .order_by()
+            .values_list("payroll_entry__user_id", "source_payroll_id", "type")
+            .annotate(amount=Sum("amount"))
+        )
+        for username, payroll_id, _type, amount in adjustments:
+            cents = int(DeductionCalculator.to_cents([amount])[0])
+            key = (username, payroll_id)
+            applied[key] = applied.get(key, 0) + (cents if _type == "B" else -cents)
+        return applied
+
+    def compute(self) -> list[dict]:
+        """
+        Recalculate the affected payrolls without writing anything
+        """
+        self.not_applied = []
+        entries = self.get_history()
+        if not entries:
+            return []
+
+        entries_id = [entry.payroll_entry_id for entry in entries]
+        adjustments = self.get_adjustment_totals(entries_id)
+        stored = self.get_stored_net(entries_id)
+        applied = self.get_applied()
+        deductions = DeductionCalculator.get_user_deductions(self.usernames)
+        # Una entrada ya pagada no volvería a procesar el ajuste
+        pending = dict(
+            PayrollEntry.objects.filter(
+                Q(payroll_id=self.payroll.payroll_id)
+                & Q(user_id__in=self.usernames)
+                & Q(status=False)
+            ).values_list("user_id", "payroll_entry_id")
+        )
+
+        by_payroll: dict[int, list[PayrollEntry]] = {}
+        for entry in entries:
+            by_payroll.setdefault(entry.payroll_id, []).append(entry)
+
+        results = []
+        for group in by_payroll.values():
+            payroll = group[0].payroll
+            users = [entry.user for entry in group]
+            rates = DeductionCalculator.get_rates(users, deductions)
+            calculated = DeductionCalculator.calculate(
+                DeductionCalculator.to_cents(user.salary for user in users),
+                rates["AFP"],
+                rates["SFS"],
+                rates["ISR"],
+                periods=payroll.get_periods(),
+                bonuses=np.array(
+                    [
+                        adjustments.get((entry.payroll_entry_id, "B"), 0)
+                        for entry in group
+                    ],
+                    dtype=np.int64,
+                ),
+                discounts=np.array(
+                    [
+                        adjustments.get((entry.payroll_entry_id, "D"), 0)
+                        for entry in group
+                    ],
+                    dtype=np.int64,
+                ),
+                isr_table=DeductionCalculator.get_isr_table(
+                    IsrScale.get_current(payroll.period_end)
+                ),
+            )
+            stored_net = DeductionCalculator.to_cents(
+                stored.get(entry.payroll_entry_id) for entry in group
+            )
+            already_applied = np.array(
+                [
+                    applied.get((entry.user_id, payroll.payroll_id), 0)
+                    for entry in group
+                ],
+                dtype=np.int64,
+            )
+            deltas = calculated["net_salary"] - stored_net - already_applied
+
+            for index, entry in enumerate(group):
+                result = {
+                    "username": entry.user_id,
+                    "payroll": payroll,
+                    "payroll_entry_id": pending.get(entry.user_id),
+                    "stored_net": DeductionCalculator.from_cents(stored_net[index]),
+                    "net_salary": DeductionCalculator.from_cents(
+                        calculated["net_salary"][index]
+                    ),
+                    "applied": DeductionCalculator.from_cents(already_applied[index]),
+                    "delta": DeductionCalculator.from_cents(deltas[index]),
+                }
+                # Sin una entrada por pagar la diferencia no se puede escribir
+                if result["payroll_entry_id"] is None and result["delta"]:
+                    self.not_applied.append(result)
+                else:
+                    results.append(result)
+
+        return results
+
+    def get_concepts(self) -> dict[str, Concept]:
+        """
+        Concept of the retroactive bonuses and discounts by type
+        """
+        concepts = {}
+        for _type, fallback in self.FALLBACK_CONCEPTS.items():
+            for name in (self.CONCEPT_NAME, fallback):
+                try:
+                    concepts[_type] = Concept.get_by_name(name)
+                    break
+                except Concept.DoesNotExist:
+                    continue
+            else:
+                raise APIException(
+                    f"No existe el concepto '{self.CONCEPT_NAME}' ni '{fallback}'"
+                )
+        return concepts
+
+    def build_adjustments(self, results: list[dict]) -> list[Adjustment]:
+        results = [result for result in results if result["delta"]]
+        if not results:
+            return []
+
+        concepts = self.get_concepts()
+        adjustments = []
+        for result in results:
+            delta: Decimal = result["delta"]
+            _type = "B" if delta > 0 else "D"
+            payroll: Payroll = result["payroll"]
+            adjustments.append(
+                Adjustment(
+                    payroll_entry_id=result["payroll_entry_id"],
+                    type=_type,
+                    amount=delta.copy_abs(),
+                    description=(
+                        f"Retroactivo {payroll} ({payroll.period_start} - "
+                        f"{payroll.period_end})"
+                    ),
+                    concept=concepts[_type],
+                    source_payroll=payroll,
+                    state=Adjustment.ACTIVE,
+                    created_by=self.created_by,
+                    created_at=timezone.now(),
+                )
+            )
+        return adjustments
+
+    @transaction.atomic
+    def run(self) -> list[dict]:
+        """
+        Recalculate and write the differences into the pending payroll
+        """
+        results = self.compute()
+        self.adjustments = self.build_adjustments(results)
+        if not self.adjustments:
+            return results
+
+        ids = IdAllocator.allocate(Adjustment, len(self.adjustments))
+        for adjustment_id, adjustment in zip(ids, self.adjustments):
+            adjustment.adjustment_id = adjustment_id
+
+        # `bulk_create` recalcula los totales de las entradas
+        Adjustment.objects.bulk_create(self.adjustments, batch_size=self.BATCH_SIZE)
+        return results
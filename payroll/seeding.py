@@ -0,0 +1,417 @@
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from helpers.cache import ReferenceCache
+from helpers.sequences import IdAllocator
+from payroll.calculator import CONTEXT
+from payroll.models import (
+    Adjustment,
+    Concept,
+    DeductionXuser,
+    Deductions,
+    ExchangeRate,
+    Payroll,
+    PayrollEntry,
+    PayrollSettings,
+)
+from tasks.models import Tags, TagXTasks, Task, TaskXusers
+from users.models import ActivityLog, Department, Roles, RolesUsers, User
+
+
+class DataSeeder:
+    """
+    Synthetic data for load and performance testing.\n
+    Creates employees with departments, roles, deductions, tasks and activity
+    logs, and the adjustments of a payroll. Every table is written with
+    `bulk_create` and the same `seed` always produces the same data.\n
+    Salaries follow a log-normal distribution, departments and roles have
+    different sizes and most employees are active staff, so the data looks like
+    a real company instead of a uniform sample.
+    """
+
+    BATCH_SIZE = 2000
+    PASSWORD = "compupay"
+    USERNAME_PREFIX = "seed"
+
+    CONCEPTS = ("SALARIO", "AFP", "SFS", "ISR", "BONO", "DESCUENTO", "RETROACTIVO")
+    DEDUCTIONS = {
+        "AFP": ("2.87", "Aporte del empleado al fondo de pensiones"),
+        "SFS": ("3.04", "Aporte del empleado al seguro familiar de salud"),
+        "ISR": ("15.00", "Retención del impuesto sobre la renta"),
+    }
+    # Tasas de las monedas de los empleados, vigentes desde `RATES_FROM`
+    EXCHANGE_RATES = {"USD": "60.25", "EUR": "65.50"}
+    RATES_FROM = date(2000, 1, 1)
+    # (nombre, color, peso)
+    DEPARTMENTS = (
+        ("Operaciones", "#1f77b4", 30),
+        ("Ventas", "#ff7f0e", 20),
+        ("Atención al Cliente", "#2ca02c", 15),
+        ("Tecnología", "#d62728", 10),
+        ("Logística", "#9467bd", 8),
+        ("Finanzas", "#8c564b", 6),
+        ("Mercadeo", "#e377c2", 5),
+        ("Recursos Humanos", "#7f7f7f", 3),
+        ("Legal", "#bcbd22", 2),
+        ("Compras", "#17becf", 1),
+    )
+    ROLES = (
+        ("Empleado", "#1f77b4", 85),
+        ("Supervisor", "#ff7f0e", 10),
+        ("Gerente", "#2ca02c", 4),
+        ("Recursos Humanos", "#d62728", 1),
+    )
+    TAGS = (
+        ("Urgente", "#d62728"),
+        ("Reunión", "#1f77b4"),
+        ("Reporte", "#2ca02c"),
+        ("Capacitación", "#ff7f0e"),
+        ("Cliente", "#9467bd"),
+    )
+    NAMES = (
+        "Juan María José Ana Luis Carmen Pedro Rosa "
+        "Carlos Laura Miguel Elena Rafael Sofía Ramón Isabel"
+    ).split()
+    LAST_NAMES = (
+        "Pérez Rodríguez Martínez García Fernández Gómez "
+        "Díaz Santos Reyes Castillo Núñez Jiménez"
+    ).split()
+
+    # Salario mensual: mediana de 35,000 y cola larga hacia los salarios altos
+    SALARY_MEDIAN = 35_000
+    SALARY_SIGMA = 0.6
+    SALARY_RANGE = (15_000, 1_500_000)
+    # Umbral mensual a partir del cual se retiene ISR
+    ISR_THRESHOLD = 34_685
+
+    def __init__(self, created_by: User, seed: int = 1):
+        self.created_by = created_by
+        self.random = random.Random(seed)
+        self.now = timezone.now()
+
+    def create(self, model, objects: list) -> list:
+        """
+        Assign the ids of `objects` and insert them in batches
+        """
+        ids = IdAllocator.allocate(model, len(objects))
+        for pk, instance in zip(ids, objects):
+            instance.pk = pk
+        return model.objects.bulk_create(objects, batch_size=self.BATCH_SIZE)
+
+    def pick(self, choices: tuple) -> tuple:
+        return self.random.choices(choices, weights=[c[-1] for c in choices])[0]
+
+    def get_salary(self) -> Decimal:
+        low, high = self.SALARY_RANGE
+        salary = self.random.lognormvariate(
+            math.log(self.SALARY_MEDIAN), self.SALARY_SIGMA
+        )
+        cents = round(min(max(salary, low), high) * 100)
+        return Decimal(cents).scaleb(-2, context=CONTEXT)
+
+    def seed_reference(self) -> dict:
+        """
+        Create the concepts, deductions, settings, exchange rates, departments,
+        roles and tags that don't exist yet and return them by name
+        """
+        concepts = {
+            concept.name: concept
+            for concept in Concept.objects.filter(name__in=self.CONCEPTS)
+        }
+        self.create(
+            Concept,
+            [
+                Concept(name=name, created_by=self.created_by)
+                for name in self.CONCEPTS
+                if name not in concepts
+            ],
+        )
+        concepts = {
+            concept.name: concept
+            for concept in Concept.objects.filter(name__in=self.CONCEPTS).order_by(
+                "concept_id"
+            )
+        }
+
+        deductions = {
+            deduction.name: deduction
+            for deduction in Deductions.objects.filter(
+                Q(state=Deductions.ACTIVE) & Q(name__in=self.DEDUCTIONS)
+            )
+        }
+        self.create(
+            Deductions,
+            [
+                Deductions(
+                    name=name,
+                    percentage=Decimal(percentage),
+                    description=description,
+                    concept=concepts[name],
+                    created_by=self.created_by,
+                )
+                for name, (percentage, description) in self.DEDUCTIONS.items()
+                if name not in deductions
+            ],
+        )
+        deductions = {
+            deduction.name: deduction
+            for deduction in Deductions.objects.filter(
+                Q(state=Deductions.ACTIVE) & Q(name__in=self.DEDUCTIONS)
+            )
+        }
+
+        if not PayrollSettings.objects.filter(state=PayrollSettings.ACTIVE).exists():
+            self.create(
+                PayrollSettings,
+                [PayrollSettings(periods=1, created_by=self.created_by)],
+            )
+
+        currencies = set(ExchangeRate.objects.values_list("currency", flat=True))
+        self.create(
+            ExchangeRate,
+            [
+                ExchangeRate(
+                    currency=currency,
+                    rate=Decimal(rate),
+                    effective_from=self.RATES_FROM,
+                    created_by=self.created_by,
+                )
+                for currency, rate in self.EXCHANGE_RATES.items()
+                if currency not in currencies
+            ],
+        )
+
+        departments = set(Department.objects.values_list("name", flat=True))
+        self.create(
+            Department,
+            [
+                Department(name=name, color=color, created_by=self.created_by)
+                for name, color, _ in self.DEPARTMENTS
+                if name not in departments
+            ],
+        )
+        roles = set(Roles.objects.values_list("name", flat=True))
+        self.create(
+            Roles,
+            [
+                Roles(
+                    name=name, description=name, color=color, created_by=self.created_by
+                )
+                for name, color, _ in self.ROLES
+                if name not in roles
+            ],
+        )
+        tags = set(Tags.objects.values_list("name", flat=True))
+        self.create(
+            Tags,
+            [
+                Tags(name=name, color=color, created_by=self.created_by)
+                for name, color in self.TAGS
+                if name not in tags
+            ],
+        )
+
+        # `bulk_create` no envía las señales que invalidan la caché
+        ReferenceCache.invalidate_on_commit()
+
+        return {
+            "concepts": concepts,
+            "deductions": deductions,
+            "departments": {
+                department.name: department
+                for department in Department.objects.filter(
+                    name__in=[name for name, _, _ in self.DEPARTMENTS]
+                )
+            },
+            "roles": {
+                role.name: role
+                for role in Roles.objects.filter(
+                    name__in=[name for name, _, _ in self.ROLES]
+                )
+            },
+            "tags": list(Tags.objects.filter(name__in=[name for name, _ in self.TAGS])),
+        }
+
+    def seed_users(self, count: int, reference: dict) -> list[User]:
+        """
+        Create `count` employees with their roles and deductions
+        """
+        password = make_password(self.PASSWORD)
+        today = self.now.date()
+        ids = IdAllocator.allocate(User, count)
+
+        users: list[User] = []
+        roles_users: list[RolesUsers] = []
+        deductions_user: list[DeductionXuser] = []
+        for user_id in ids:
+            department = reference["departments"][self.pick(self.DEPARTMENTS)[0]]
+            role = reference["roles"][self.pick(self.ROLES)[0]]
+            state = self.random.choices(
+                (User.ACTIVE, User.INACTIVE, User.INTERN), weights=(92, 5, 3)
+            )[0]
+            salary = self.get_salary()
+            hired_date = today - timedelta(days=self.random.randint(0, 365 * 15))
+
+            user = User(
+                user_id=user_id,
+                username=f"{self.USERNAME_PREFIX}{user_id}",
+                identity_document=f"{self.random.randint(0, 99_999_999_999):011d}",
+                document_type=self.random.choices(("C", "P"), weights=(97, 3))[0],
+                name=self.random.choice(self.NAMES),
+                last_name=self.random.choice(self.LAST_NAMES),
+                email=f"{self.USERNAME_PREFIX}{user_id}@compupay.test",
+                password=password,
+                phone=f"809{self.random.randint(0, 9_999_999):07d}",
+                hired_date=hired_date,
+                birth_date=hired_date
+                - timedelta(days=self.random.randint(365 * 18, 365 * 45)),
+                currency=self.pick((("RD", 90), ("USD", 8), ("EUR", 2)))[0],
+                salary=salary,
+                gender=self.random.choice(("M", "F")),
+                state=state,
+                is_staff=state != User.INTERN,
+                is_active=state != User.INACTIVE,
+                department=department,
+                created_by=self.created_by,
+            )
+            users.append(user)
+            roles_users.append(
+                RolesUsers(rol_id=role, user_id=user, created_by=self.created_by)
+            )
+
+            names = ["AFP", "SFS"] if self.random.random() < 0.95 else []
+            if salary > self.ISR_THRESHOLD:
+                names.append("ISR")
+            deductions_user.extend(
+                DeductionXuser(
+                    user=user,
+                    deduction=reference["deductions"][name],
+                    created_by=self.created_by,
+                )
+                for name in names
+                if name in reference["deductions"]
+            )
+
+        User.objects.bulk_create(users, batch_size=self.BATCH_SIZE)
+        self.create(RolesUsers, roles_users)
+        self.create(DeductionXuser, deductions_user)
+        return users
+
+    def seed_tasks(self, users: list[User], reference: dict) -> list[Task]:
+        """
+        Create about one task for every two employees, each one assigned to
+        one to three of them
+        """
+        if not users:
+            return []
+
+        tasks = [
+            Task(
+                name=f"Tarea {index + 1}",
+                description="Tarea generada para pruebas de rendimiento",
+                completed=self.random.random() < 0.6,
+                priority=self.random.choices(("H", "M", "L"), weights=(2, 5, 3))[0],
+                start_date=self.now - timedelta(days=self.random.randint(0, 60)),
+                end_date=self.now + timedelta(days=self.random.randint(1, 30)),
+                created_by=self.created_by,
+            )
+            for index in range(max(len(users) // 2, 1))
+        ]
+        self.create(Task, tasks)
+
+        task_users: list[TaskXusers] = []
+        task_tags: list[TagXTasks] = []
+        for task in tasks:
+            assigned = self.random.sample(
+                users, min(self.random.choices((1, 2, 3), (6, 3, 1))[0], len(users))
+            )
+            task_users.extend(
+                TaskXusers(task=task, user=user, created_by=self.created_by)
+                for user in assigned
+            )
+            task_tags.extend(
+                TagXTasks(task=task, tag=tag, created_by=self.created_by)
+                for tag in self.random.sample(
+                    reference["tags"],
+                    min(self.random.randint(0, 2), len(reference["tags"])),
+                )
+            )
+        self.create(TaskXusers, task_users)
+        self.create(TagXTasks, task_tags)
+        return tasks
+
+    def seed_activities(self, users: list[User], per_user: int = 3) -> int:
+        content_type = ContentType.objects.get_for_model(User)
+        activities = []
+        for user in users:
+            for _ in range(self.random.randint(0, per_user * 2)):
+                action = self.random.choices((1, 2, 3), weights=(3, 6, 1))[0]
+                activities.append(
+                    ActivityLog(
+                        username=self.created_by,
+                        content_type=content_type,
+                        object_id=user.pk,
+                        object_repr=str(user)[:200],
+                        action_flag=action,
+                        change_message=f"@{self.created_by.username} "
+                        f"{dict(ActivityLog.ACTION_CHOICES)[action]} @{user.username}",
+                    )
+                )
+        ActivityLog.objects.bulk_create(activities, batch_size=self.BATCH_SIZE)
+        return len(activities)
+
+    def seed_adjustments(self, payroll: Payroll, reference: dict) -> list[Adjustment]:
+        """
+        Give one to three bonuses or discounts to about a third of the entries
+        of `payroll` and refresh their totals
+        """
+        concepts = reference["concepts"]
+        adjustments: list[Adjustment] = []
+        for entry_id in PayrollEntry.objects.filter(
+            payroll_id=payroll.payroll_id
+        ).values_list("payroll_entry_id", flat=True):
+            if self.random.random() >= 0.3:
+                continue
+            for _ in range(self.random.randint(1, 3)):
+                _type = "B" if self.random.random() < 0.6 else "D"
+                amount = Decimal(self.random.randint(500_00, 15_000_00)).scaleb(
+                    -2, context=CONTEXT
+                )
+                adjustments.append(
+                    Adjustment(
+                        payroll_entry_id=entry_id,
+                        type=_type,
+                        amount=amount,
+                        description="Ajuste generado para pruebas de rendimiento",
+                        concept=concepts["BONO" if _type == "B" else "DESCUENTO"],
+                        created_by=self.created_by,
+                    )
+                )
+
+        # `bulk_create` recalcula los totales de las entradas
+        self.create(Adjustment, adjustments)
+        return adjustments
+
+    @transaction.atomic
+    def seed(self, employees: int) -> dict:
+        """
+        Seed `employees` employees with everything that depends on them
+        """
+        reference = self.seed_reference()
+        users = self.seed_users(employees, reference)
+        tasks = self.seed_tasks(users, reference)
+        activities = self.seed_activities(users)
+        return {
+            "reference": reference,
+            "users": users,
+            "tasks": len(tasks),
+            "activities": activities,
+        }
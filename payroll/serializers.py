@@ -1,7 +1,15 @@
 from django.forms import model_to_dict
-from django.db.models import Q
+from django.db import models
+from django.db.models import (
+    Count,
+    Prefetch,
+    Q,
+    QuerySet,
+    prefetch_related_objects,
+)
 from rest_framework import serializers
-from helpers.serializers import BaseModelSerializer
+from helpers.serializers import BaseModelSerializer, BaseSerializer
+from payroll.calculator import DeductionCalculator
 from payroll.models import (
     Adjustment,
     DeductionXuser,
@@ -10,6 +18,7 @@ from payroll.models import (
     PayrollEntry,
     PayrollPaymentDetail,
     PayrollSettings,
+    PayrollSummary,
 )
 
 
@@ -64,6 +73,37 @@ class PayrollSerializer(BaseModelSerializer):
         fields = "__all__"
 
 
+class PayrollEntryListSerializer(serializers.ListSerializer):
+    """
+    Load what the rows of a page need before serializing them: the users of
+    the entries and of the audit fields in one query each, and their AFP, SFS
+    and ISR with
+    `DeductionCalculator.for_entries`. The bonus and discount totals are
+    already stored in every entry. Only what the fields of the child serializer
+    read is loaded.
+    """
+
+    deductions: dict[int, dict] = None
+
+    def to_representation(self, data):
+        entries = list(data.all() if isinstance(data, models.Manager) else data)
+        fields = self.child.fields.keys()
+
+        # Solo se cargan los usuarios que no vienen con `select_related`. Los
+        # campos de auditoría apuntan al `username` y también cargan el usuario
+        lookups = [name for name in ("created_by", "updated_by") if name in fields]
+        if not fields.isdisjoint(self.child.USER_FIELDS):
+            lookups.append("user")
+        prefetch_related_objects(entries, *lookups)
+
+        if "deductions" not in self.context and not fields.isdisjoint(
+            ("isr", "afp", "sfs")
+        ):
+            self.deductions = DeductionCalculator.for_entries(entries)
+
+        return super().to_representation(entries)
+
+
 class PayrollEntrySerializer(BaseModelSerializer):
     full_name = serializers.CharField(source="user.full_name")
     currency = serializers.CharField(source="user.currency")
@@ -76,30 +116,80 @@ class PayrollEntrySerializer(BaseModelSerializer):
     afp = serializers.SerializerMethodField()
     sfs = serializers.SerializerMethodField()
 
+    FIELD_COLUMNS = {
+        "desc_status": ("status",),
+        "avatar": ("user",),
+        "bonus": ("total_bonus",),
+        "discount": ("total_discount",),
+        "isr": ("user", "payroll"),
+        "afp": ("user", "payroll"),
+        "sfs": ("user", "payroll"),
+    }
+    # Campos que leen el usuario de la entrada
+    USER_FIELDS = (
+        "user",
+        "full_name",
+        "currency",
+        "salary",
+        "avatar",
+        "isr",
+        "afp",
+        "sfs",
+    )
+
+    @classmethod
+    def prefetch(
+        cls, entries: QuerySet[PayrollEntry], fields: list[str] = None
+    ) -> QuerySet[PayrollEntry]:
+        if cls.wants(fields, *cls.USER_FIELDS):
+            return entries.select_related("user")
+        return entries
+
     def get_avatar(self, instance: PayrollEntry):
         return instance.user.get_avatar()
 
     def get_desc_status(self, instance: PayrollEntry):
         return instance.get_status()
 
+    def get_deductions(self, instance: PayrollEntry) -> dict | None:
+        """
+        Return the amounts precomputed with `DeductionCalculator.for_entries`,
+        passed in the context under `deductions` or loaded by the list
+        serializer, if any.
+        """
+        deductions = self.context.get("deductions") or getattr(
+            self.parent, "deductions", None
+        )
+        return (deductions or {}).get(instance.payroll_entry_id)
+
     def get_isr(self, instance: PayrollEntry):
-        return DeductionXuser.get_isr(instance.user)
+        deductions = self.get_deductions(instance)
+        if deductions is not None:
+            return deductions["isr"]
+        return DeductionXuser.get_isr(instance.user, instance.payroll.period_end)
 
     def get_afp(self, instance: PayrollEntry):
+        deductions = self.get_deductions(instance)
+        if deductions is not None:
+            return deductions["afp"]
         return DeductionXuser.get_afp(instance.user)
 
     def get_sfs(self, instance: PayrollEntry):
+        deductions = self.get_deductions(instance)
+        if deductions is not None:
+            return deductions["sfs"]
         return DeductionXuser.get_sfs(instance.user)
 
     def get_bonus(self, instance: PayrollEntry):
-        return Adjustment.calc_bonus(instance)
+        return instance.total_bonus
 
     def get_discount(self, instance: PayrollEntry):
-        return Adjustment.calc_deduction(instance)
+        return instance.total_discount
 
     class Meta:
         model = PayrollEntry
         fields = "__all__"
+        list_serializer_class = PayrollEntryListSerializer
 
 
 class AdjustmentSerializer(BaseModelSerializer):
@@ -110,6 +200,27 @@ class AdjustmentSerializer(BaseModelSerializer):
     avatar = serializers.CharField(source="payroll_entry.user.get_avatar")
     desc_state = serializers.SerializerMethodField()
 
+    FIELD_COLUMNS = {"desc_type": ("type",), "desc_state": ("state",)}
+
+    @classmethod
+    def prefetch(
+        cls, adjustments: QuerySet[Adjustment], fields: list[str] = None
+    ) -> QuerySet[Adjustment]:
+        """
+        Join the entry and user of the requested `fields`, all by default
+        """
+        relations = [
+            name for name in ("created_by", "updated_by") if cls.wants(fields, name)
+        ]
+        if cls.wants(fields, "user", "username", "avatar"):
+            relations.append("payroll_entry__user")
+        elif cls.wants(fields, "payroll_id"):
+            relations.append("payroll_entry")
+
+        if relations:
+            return adjustments.select_related(*relations)
+        return adjustments
+
     def get_desc_state(self, instance: Adjustment):
         values = dict(Adjustment.STATE_CHOICES)
         return values.get(instance.state, None)
@@ -135,21 +246,76 @@ class DeductionSerializer(BaseModelSerializer):
 
 
 class PayrollHistorySerializer(BaseModelSerializer):
+    """
+    History of payrolls with their entries and payment details.\n
+    Use `prefetch` to load the entries of a whole page with their users and
+    active details in a fixed number of queries. The entries of every payroll
+    are limited to `limit` rows starting at `offset`, and `ENTRIES_COUNT` has
+    the total.
+    """
+
+    ENTRIES_LIMIT = 100
+    MAX_ENTRIES_LIMIT = 1000
+
     label = serializers.SerializerMethodField()
     period = serializers.SerializerMethodField()
     entries = serializers.SerializerMethodField()
+    entries_count = serializers.SerializerMethodField()
     desc_state = serializers.SerializerMethodField()
 
+    @classmethod
+    def prefetch(
+        cls, payrolls: QuerySet[Payroll], limit: int = None, offset: int = 0
+    ) -> QuerySet[Payroll]:
+        limit = min(limit or cls.ENTRIES_LIMIT, cls.MAX_ENTRIES_LIMIT)
+        details = PayrollPaymentDetail.objects.filter(
+            state=PayrollPaymentDetail.ACTIVE
+        ).select_related("concept", "created_by", "updated_by")
+        entries = (
+            PayrollEntry.objects.select_related("user", "created_by", "updated_by")
+            .prefetch_related(
+                Prefetch(
+                    "payrollpaymentdetail_payroll_entry",
+                    queryset=details.order_by("id"),
+                    to_attr="active_details",
+                )
+            )
+            .order_by("payroll_entry_id")
+        )
+        # `Meta.ordering` no se aplica a las consultas con GROUP BY
+        return (
+            payrolls.annotate(
+                entries_count=Count("payrollentry_payroll", distinct=True)
+            )
+            .order_by("-period_start", "-payroll_id")
+            .prefetch_related(
+                Prefetch(
+                    "payrollentry_payroll",
+                    queryset=entries[offset : offset + limit],
+                    to_attr="history_entries",
+                )
+            )
+        )
+
     def get_desc_state(self, instance: Payroll):
         labels = dict(Payroll.STATUS_CHOICES)
         return labels[instance.status]
 
     def get_entries(self, instance: Payroll):
-        entries = PayrollEntry.objects.filter(payroll=instance)
+        entries = getattr(instance, "history_entries", None)
+        if entries is None:
+            entries = PayrollEntry.objects.filter(payroll=instance)
 
-        serializer = PayrollEntryWithDetailSerializer(entries, many=True)
+        serializer = PayrollEntryWithDetailSerializer(
+            entries, many=True, context=self.context
+        )
         return serializer.data
 
+    def get_entries_count(self, instance: Payroll):
+        if hasattr(instance, "entries_count"):
+            return instance.entries_count
+        return PayrollEntry.objects.filter(payroll=instance).count()
+
     def get_period(self, instance: Payroll):
         return instance.period
 
@@ -161,19 +327,70 @@ class PayrollHistorySerializer(BaseModelSerializer):
         fields = "__all__"
 
 
+class PayrollSummarySerializer(BaseModelSerializer):
+    class Meta:
+        model = PayrollSummary
+        fields = (
+            "headcount",
+            "gross_salary",
+            "total_earnings",
+            "total_deductions",
+            "net_salary",
+            "concept_totals",
+        )
+
+
+class PayrollHistorySummarySerializer(BaseModelSerializer):
+    """
+    History of payrolls read only from `PayrollSummary`
+    """
+
+    label = serializers.SerializerMethodField()
+    period = serializers.SerializerMethodField()
+    desc_state = serializers.SerializerMethodField()
+    summary = PayrollSummarySerializer(source="payrollsummary_payroll", read_only=True)
+
+    def get_period(self, instance: Payroll):
+        return instance.period
+
+    def get_desc_state(self, instance: Payroll):
+        labels = dict(Payroll.STATUS_CHOICES)
+        return labels[instance.status]
+
+    def get_label(self, instance: Payroll):
+        return str(instance)
+
+    class Meta:
+        model = Payroll
+        fields = (
+            "payroll_id",
+            "period_start",
+            "period_end",
+            "period",
+            "status",
+            "state",
+            "label",
+            "desc_state",
+            "summary",
+        )
+
+
 class PayrollEntryWithDetailSerializer(PayrollEntrySerializer):
     payment_details = serializers.SerializerMethodField()
 
     def get_payment_details(self, instance: PayrollEntry):
-        details = PayrollPaymentDetail.objects.filter(
-            Q(payroll_entry=instance) & Q(state=PayrollPaymentDetail.ACTIVE)
-        )
+        details = getattr(instance, "active_details", None)
+        if details is None:
+            details = PayrollPaymentDetail.objects.filter(
+                Q(payroll_entry=instance) & Q(state=PayrollPaymentDetail.ACTIVE)
+            ).select_related("concept")
         serializer = PayrollPaymentDetailSerializer(details, many=True)
         return serializer.data
 
     class Meta:
         model = PayrollEntry
         fields = "__all__"
+        list_serializer_class = PayrollEntryListSerializer
 
 
 class PayrollPaymentDetailSerializer(BaseModelSerializer):
@@ -182,3 +399,63 @@ class PayrollPaymentDetailSerializer(BaseModelSerializer):
     class Meta:
         model = PayrollPaymentDetail
         fields = "__all__"
+
+
+class PayrollPreviewSerializer(BaseSerializer):
+    """
+    Serializer for the rows computed by `PayrollEngine.compute`
+    """
+
+    payroll_entry_id = serializers.IntegerField(source="entry.payroll_entry_id")
+    username = serializers.CharField(source="entry.user.username")
+    full_name = serializers.CharField(source="entry.user.full_name")
+    currency = serializers.CharField(source="entry.user.currency")
+    gross_salary = serializers.DecimalField(max_digits=12, decimal_places=2)
+    salary = serializers.DecimalField(max_digits=12, decimal_places=2)
+    bonus = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    afp = serializers.DecimalField(max_digits=12, decimal_places=2)
+    sfs = serializers.DecimalField(max_digits=12, decimal_places=2)
+    isr = serializers.DecimalField(max_digits=12, decimal_places=2)
+    net_salary = serializers.DecimalField(max_digits=12, decimal_places=2)
+    deductions = serializers.SerializerMethodField()
+    adjustments = serializers.SerializerMethodField()
+
+    def get_deductions(self, instance: dict):
+        return [
+            {"NAME": item["deduction"].name, "AMOUNT": str(item["amount"])}
+            for item in instance["deductions"]
+        ]
+
+    def get_adjustments(self, instance: dict):
+        return [
+            {
+                "TYPE": item["adjustment"].type,
+                "DESCRIPTION": item["adjustment"].description,
+                "AMOUNT": str(item["amount"]),
+            }
+            for item in instance["adjustments"]
+        ]
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        return {k.upper(): v for k, v in ret.items()}
+
+
+class RetroPaySerializer(BaseSerializer):
+    """
+    Serializer for the rows computed by `RetroPayEngine.compute`
+    """
+
+    username = serializers.CharField()
+    payroll_id = serializers.IntegerField(source="payroll.payroll_id")
+    period_start = serializers.DateField(source="payroll.period_start")
+    period_end = serializers.DateField(source="payroll.period_end")
+    stored_net = serializers.DecimalField(max_digits=12, decimal_places=2)
+    net_salary = serializers.DecimalField(max_digits=12, decimal_places=2)
+    applied = serializers.DecimalField(max_digits=12, decimal_places=2)
+    delta = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)
+        return {k.upper(): v for k, v in ret.items()}
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+
+from helpers.cache import ReferenceCache
+from payroll.models import (
+    Concept,
+    Deductions,
+    ExchangeRate,
+    IsrBracket,
+    IsrScale,
+    PayrollSettings,
+)
+
+REFERENCE_MODELS = (
+    Concept,
+    Deductions,
+    ExchangeRate,
+    IsrBracket,
+    IsrScale,
+    PayrollSettings,
+)
+
+for model in REFERENCE_MODELS:
+    post_save.connect(
+        ReferenceCache.invalidate_on_commit,
+        sender=model,
+        dispatch_uid=f"reference_cache_save_{model.__name__}",
+    )
+    post_delete.connect(
+        ReferenceCache.invalidate_on_commit,
+        sender=model,
+        dispatch_uid=f"reference_cache_delete_{model.__name__}",
+    )
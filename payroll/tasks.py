@@ -1,26 +1,232 @@
+import logging
+import time
+
+from django.conf import settings as django_settings
+from django.db import OperationalError, transaction
 from django.db.models import Q
-from celery import shared_task
+from django.utils import timezone
+from celery import chord, shared_task
+from celery.result import AsyncResult
+
+from users.models import User
+from .engine import PayrollEngine
 from .models import Payroll, PayrollEntry, PayrollSettings
+from .payslips import PayslipGenerator, render_chunk
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
-def autopay_payroll():
+def autopay_payroll() -> dict:
+    """
+    Pay the pending payroll once its period has ended and start the next one.\n
+    The pending payroll is locked with `SKIP LOCKED` and its status is read
+    again under the lock, so when two beat workers fire at the same time only
+    one of them pays it and the other returns without doing anything. Without
+    a pending payroll the autopay configuration is locked instead, so only one
+    worker starts the first one. Everything runs in one transaction: the
+    unpaid entries are processed by `PayrollEngine`, the payroll is finalized
+    and the next payroll is created with its entries in bulk.
+    """
+    start = time.perf_counter()
+    metrics = {"payroll_id": None, "paid": 0, "next_payroll_id": None, "entries": 0}
     try:
-        settings = PayrollSettings.objects.filter(
-            Q(autopay=True) & Q(state="A")
-        ).first()
-        if settings:
-            payroll = Payroll.objects.filter(
-                Q(status=Payroll.PENDING) & Q(state="A")
-            ).first()
-            entries = PayrollEntry.objects.filter(
-                Q(state="A") & Q(payroll_id=payroll.payroll_id)
+        with transaction.atomic():
+            settings = (
+                PayrollSettings.objects.filter(
+                    Q(autopay=True) & Q(state=PayrollSettings.ACTIVE)
+                )
+                .order_by("-created_at")
+                .first()
             )
-            for entry in entries:
-                entry.status = True
-                entry.save()
+            if not settings:
+                logger.info("autopay: no active autopay settings")
+                return {**metrics, "skipped": True}
+
+            user = settings.created_by
+            pending = Payroll.objects.filter(
+                Q(status=Payroll.PENDING) & Q(state=Payroll.ACTIVE)
+            ).order_by("period_end")
+            payroll = pending.select_for_update(skip_locked=True).first()
+            if not payroll and pending.exists():
+                logger.info("autopay: the pending payroll is already being paid")
+                return {**metrics, "skipped": True}
+            if (
+                not payroll
+                and not PayrollSettings.objects.select_for_update(skip_locked=True)
+                .filter(pk=settings.pk)
+                .first()
+            ):
+                logger.info("autopay: the first payroll is already being started")
+                return {**metrics, "skipped": True}
+
+            if payroll and payroll.period_end > timezone.now().date():
+                logger.info(
+                    "autopay: payroll %s is not due until %s",
+                    payroll.payroll_id,
+                    payroll.period_end,
+                )
+                return {**metrics, "payroll_id": payroll.payroll_id, "skipped": True}
 
-            Payroll.autostart_payroll(settings.created_by)
-    # pylint: disable=broad-except
+            if payroll:
+                entries_id = list(
+                    PayrollEntry.objects.filter(
+                        Q(payroll_id=payroll.payroll_id)
+                        & Q(state=PayrollEntry.ACTIVE)
+                        & Q(status=False)
+                    ).values_list("payroll_entry_id", flat=True)
+                )
+                results = []
+                if entries_id:
+                    results = PayrollEngine(payroll, entries_id=entries_id).run(user)
+                metrics["payroll_id"] = payroll.payroll_id
+                metrics["paid"] = len(results)
+                # Las entradas bloqueadas por otro proceso no se pagaron
+                if not payroll.finalize_if_complete(user):
+                    logger.info(
+                        "autopay: payroll %s still has entries being processed",
+                        payroll.payroll_id,
+                    )
+                    return {**metrics, "skipped": True}
+
+            next_payroll = Payroll.autostart_payroll(user, settings)
+            metrics["next_payroll_id"] = next_payroll.payroll_id
+            metrics["entries"] = PayrollEntry.objects.filter(
+                payroll_id=next_payroll.payroll_id
+            ).count()
     except Exception:
-        pass
+        logger.exception("autopay: failed after %.3fs", time.perf_counter() - start)
+        raise
+
+    metrics["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(
+        "autopay: paid %s entries of payroll %s and started payroll %s with %s "
+        "entries in %.3fs",
+        metrics["paid"],
+        metrics["payroll_id"],
+        metrics["next_payroll_id"],
+        metrics["entries"],
+        metrics["seconds"],
+    )
+    return metrics
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def process_payroll_shard(self, payroll_id: int, entries_id: list[int], username: str):
+    """
+    Process a shard of payroll entries in its own transaction.\n
+    Entries already paid are skipped and entries locked by autopay or a
+    partial run are left to them, so a retried shard only processes what
+    the failed attempt didn't commit. Only transient database errors are
+    retried.
+    """
+    payroll = Payroll.objects.get(payroll_id=payroll_id)
+    user = User.objects.get(username=username)
+
+    try:
+        with transaction.atomic():
+            pending = list(
+                PayrollEntry.objects.select_for_update(skip_locked=True)
+                .filter(Q(payroll_entry_id__in=entries_id) & Q(status=False))
+                .values_list("payroll_entry_id", flat=True)
+            )
+            if pending:
+                PayrollEngine(payroll, entries_id=pending).run(user)
+    except OperationalError as e:
+        raise self.retry(exc=e)
+
+    return len(pending)
+
+
+@shared_task
+def finalize_payroll(processed: list[int], payroll_id: int, username: str) -> dict:
+    """
+    Chord callback: mark the payroll as `DONE` and write its summary once
+    every shard has finished.\n
+    When some entries are still unpaid (locked by another run or left by a
+    failed shard) the payroll stays pending and the run is reported as
+    incomplete.
+    """
+    payroll = Payroll.objects.get(payroll_id=payroll_id)
+    with transaction.atomic():
+        completed = payroll.finalize_if_complete(User.objects.get(username=username))
+    if not completed:
+        logger.warning(
+            "payroll %s still has unpaid entries after the sharded run",
+            payroll_id,
+        )
+
+    return {
+        "payroll_id": payroll_id,
+        "processed": sum(processed),
+        "completed": completed,
+    }
+
+
+@shared_task
+def render_payslips_chunk(payroll_id: int, entries_id: list[int]) -> list:
+    """
+    Render the payslips of a chunk of entries of a payroll.
+    """
+    return render_chunk(payroll_id, entries_id)
+
+
+@shared_task
+def write_payslips(rendered: list[list], payroll_id: int) -> dict:
+    """
+    Chord callback: write the rendered chunks to the default zip archive of
+    the payroll.
+    """
+    payroll = Payroll.objects.get(payroll_id=payroll_id)
+    return PayslipGenerator(payroll).write(rendered)
+
+
+def start_payroll_job(payroll: Payroll, user: User) -> str:
+    """
+    Split the pending entries of a payroll in shards of `PAYROLL_SHARD_SIZE`
+    and process them in parallel as a chord. Return the job id.
+    """
+    entries_id = list(
+        PayrollEntry.objects.filter(Q(payroll=payroll) & Q(status=False))
+        .order_by("payroll_entry_id")
+        .values_list("payroll_entry_id", flat=True)
+    )
+    size = django_settings.PAYROLL_SHARD_SIZE
+    shards = [
+        process_payroll_shard.s(
+            payroll.payroll_id, entries_id[i : i + size], user.username
+        )
+        for i in range(0, len(entries_id), size)
+    ]
+    callback = finalize_payroll.s(payroll.payroll_id, user.username)
+
+    if not shards:
+        return callback.delay([]).id
+
+    return chord(shards)(callback).id
+
+
+def start_payslips_job(payroll: Payroll) -> str:
+    """
+    Render the payslips of a payroll with a chord of one task per chunk of
+    `PayslipGenerator.CHUNK_SIZE` entries. Return the job id.
+    """
+    chunks = [
+        render_payslips_chunk.s(payroll.payroll_id, chunk)
+        for chunk in PayslipGenerator(payroll).get_chunks()
+    ]
+    callback = write_payslips.s(payroll.payroll_id)
+
+    if not chunks:
+        return callback.delay([]).id
+
+    return chord(chunks)(callback).id
+
+
+def get_payroll_job(job_id: str) -> dict:
+    result = AsyncResult(job_id)
+    return {
+        "job_id": job_id,
+        "status": result.status,
+        "result": result.result if result.successful() else None,
+    }
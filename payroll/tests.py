@@ -1,3 +1,995 @@
-from django.test import TestCase
+import datetime
+import tempfile
+import threading
+import zipfile
+from decimal import ROUND_HALF_UP, Decimal, localcontext
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from celery.exceptions import Retry
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+
+from core.settings import PATH_BASE
+from helpers.cache import ReferenceCache
+from payroll.adjustments import AdjustmentImport
+from payroll.benchmark import PayrollBenchmark
+from payroll.calculator import DeductionCalculator
+from payroll.engine import PayrollEngine
+from payroll.models import (
+    Adjustment,
+    Concept,
+    Deductions,
+    DeductionXuser,
+    EmployeeYearToDate,
+    IsrBracket,
+    IsrScale,
+    Payroll,
+    PayrollEntry,
+    PayrollPaymentDetail,
+    PayrollSettings,
+    PayrollSummary,
+)
+from payroll.payslips import PayslipGenerator
+from payroll.retro import RetroPayEngine
+from payroll.tasks import (
+    finalize_payroll,
+    process_payroll_shard,
+    render_payslips_chunk,
+    write_payslips,
+)
+from payroll.seeding import DataSeeder
+from users.models import User
+
+CENT = Decimal("0.01")
+
+
+def seed_payroll(employees: int, seed: int = 1) -> dict:
+    """
+    Seed `employees` employees with `DataSeeder` and start a payroll with
+    bonuses and discounts
+    """
+    ReferenceCache.clear()
+    admin = User.objects.create(
+        user_id=1,
+        name="Admin",
+        last_name="CompuPay",
+        email="admin@compupay.test",
+        username="admin",
+        is_staff=True,
+        salary=Decimal("75000.00"),
+    )
+    seeder = DataSeeder(admin, seed)
+    seeded = seeder.seed(employees)
+    payroll = Payroll.autostart_payroll(
+        admin, PayrollSettings.objects.get(state=PayrollSettings.ACTIVE)
+    )
+    seeder.seed_adjustments(payroll, seeded["reference"])
+    return {"admin": admin, "payroll": payroll, **seeded}
+
+
+def per_user_deductions(user: User, date: datetime.date = None) -> tuple[Decimal, ...]:
+    """
+    AFP, SFS and ISR of the per-user methods, rounded to cents
+    """
+    with localcontext(prec=28):
+        return tuple(
+            amount.quantize(CENT, rounding=ROUND_HALF_UP)
+            for amount in (
+                DeductionXuser.get_afp(user),
+                DeductionXuser.get_sfs(user),
+                DeductionXuser.get_isr(user, date),
+            )
+        )
+
+
+def raise_salaries(usernames: list[str], amount: Decimal):
+    for user in User.objects.filter(username__in=usernames):
+        with localcontext(prec=28):
+            user.salary += amount
+        user.save()
+
+
+class PayrollTestCase(TestCase):
+    """
+    Employees seeded with `DataSeeder` and a pending payroll with adjustments
+    """
+
+    EMPLOYEES = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        seeded = seed_payroll(cls.EMPLOYEES)
+        cls.admin = seeded["admin"]
+        cls.payroll = seeded["payroll"]
+
+    def setUp(self):
+        # Lo que quedó en memoria puede venir de datos de otra prueba
+        ReferenceCache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, path: str, data: dict):
+        return self.client.post(f"/{PATH_BASE}{path}", data, format="json")
+
+    def get_entries(self) -> list[PayrollEntry]:
+        return list(
+            PayrollEntry.objects.filter(payroll_id=self.payroll.payroll_id)
+            .select_related("user")
+            .order_by("payroll_entry_id")
+        )
+
+
+class PayrollEngineTest(PayrollTestCase):
+    def test_net_salary_matches_per_entry_math(self):
+        results = PayrollEngine(self.payroll).compute()
+        self.assertEqual(len(results), len(self.get_entries()))
+
+        for result in results:
+            entry: PayrollEntry = result["entry"]
+            with self.subTest(username=entry.user_id):
+                afp, sfs, isr = per_user_deductions(entry.user, self.payroll.period_end)
+                self.assertEqual(
+                    (result["afp"], result["sfs"], result["isr"]), (afp, sfs, isr)
+                )
+
+                with localcontext(prec=28):
+                    net_salary = (
+                        entry.user.salary
+                        + Adjustment.calc_bonus(entry)
+                        - Adjustment.calc_deduction(entry)
+                        - DeductionXuser.get_afp(entry.user)
+                        - DeductionXuser.get_sfs(entry.user)
+                        - DeductionXuser.get_isr(entry.user, self.payroll.period_end)
+                    ).quantize(CENT, rounding=ROUND_HALF_UP)
+                self.assertEqual(result["net_salary"], net_salary)
+
+    def test_run_pays_every_entry(self):
+        results = PayrollEngine(self.payroll).run(self.admin)
+
+        self.assertEqual(len(results), len(self.get_entries()))
+        self.assertEqual(
+            dict(
+                PayrollPaymentDetail.objects.filter(
+                    payroll_id=self.payroll.payroll_id, concept__name="SALARIO"
+                ).values_list("payroll_entry_id", "concept_amount")
+            ),
+            {
+                result["entry"].payroll_entry_id: result["net_salary"]
+                for result in results
+            },
+        )
+        self.assertFalse(
+            PayrollEntry.objects.filter(
+                payroll_id=self.payroll.payroll_id, status=False
+            ).exists()
+        )
+        self.assertFalse(
+            Adjustment.objects.filter(
+                payroll_entry__payroll_id=self.payroll.payroll_id,
+                state=Adjustment.ACTIVE,
+            ).exists()
+        )
+
+
+class DeductionCalculatorTest(PayrollTestCase):
+    # Salario en centavos con el que el AFP (2.87 %) cae en medio centavo
+    HALF_CENT_SALARY = 5000 * pow(287, -1, 10_000) % 10_000
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        users = User.get_employees().exclude(pk=cls.admin.pk).order_by("user_id")
+        for index, user in enumerate(users[:5]):
+            cents = cls.HALF_CENT_SALARY + (index + 2) * 1_000_000
+            user.salary = Decimal(f"{cents}e-2")
+            user.save()
+
+    def assert_matches_per_user(self, date: datetime.date = None):
+        users = list(User.get_employees().order_by("user_id"))
+        amounts = DeductionCalculator.for_users(users, date)
+        for user in users:
+            with self.subTest(username=user.username, salary=user.salary):
+                calculated = amounts[user.username]
+                self.assertEqual(
+                    (calculated["afp"], calculated["sfs"], calculated["isr"]),
+                    per_user_deductions(user, date),
+                )
+
+    def test_half_cents_are_rounded_away_from_zero(self):
+        user = User.get_employees().exclude(pk=self.admin.pk).order_by("user_id")[0]
+        with localcontext(prec=28):
+            afp = DeductionXuser.get_afp(user)
+            self.assertEqual(afp % CENT, Decimal("0.005"))
+
+        amounts = DeductionCalculator.for_users([user])[user.username]
+        self.assertEqual(amounts["afp"], per_user_deductions(user)[0])
+        self.assertGreater(amounts["afp"], afp)
+
+    def test_flat_percentages_match_per_user_math(self):
+        self.assert_matches_per_user()
+
+    def test_isr_scale_matches_per_user_math(self):
+        scale = IsrScale.objects.create(
+            name="DGII 2024",
+            effective_from=datetime.date(2024, 1, 1),
+            created_by=self.admin,
+        )
+        for lower_limit, percentage in (
+            ("0.00", "0"),
+            ("416220.01", "15"),
+            ("624329.01", "20"),
+            ("867123.01", "25"),
+        ):
+            IsrBracket.objects.create(
+                scale=scale,
+                lower_limit=Decimal(lower_limit),
+                percentage=Decimal(percentage),
+                created_by=self.admin,
+            )
+
+        # Con la escala vigente y con el porcentaje fijo de antes de la escala
+        self.assert_matches_per_user(datetime.date(2024, 6, 30))
+        self.assert_matches_per_user(datetime.date(2023, 12, 31))
+
+    def test_isr_is_computed_over_the_annual_salary(self):
+        scale = IsrScale.objects.create(
+            name="DGII 2024",
+            effective_from=datetime.date(2024, 1, 1),
+            created_by=self.admin,
+        )
+        for lower_limit, percentage in (("0.00", "0"), ("416220.01", "15")):
+            IsrBracket.objects.create(
+                scale=scale,
+                lower_limit=Decimal(lower_limit),
+                percentage=Decimal(percentage),
+                created_by=self.admin,
+            )
+        user = DeductionXuser.objects.filter(deduction__name="ISR").first().user
+        user.salary = Decimal("50000.00")
+
+        amounts = DeductionCalculator.for_users([user], datetime.date(2024, 6, 30))
+        # ((50,000 - 1,435 AFP - 1,520 SFS) * 12 - 416,220) * 15 % / 12
+        self.assertEqual(amounts[user.username]["isr"], Decimal("1854.00"))
+
+
+class PayrollPreviewTest(PayrollTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_net_salaries(self, preview: dict) -> dict[str, str]:
+        return {row["USERNAME"]: row["NET_SALARY"] for row in preview["entries"]}
+
+    def test_preview_matches_the_computation(self):
+        preview = PayrollEngine(self.payroll).preview()
+        results = PayrollEngine(self.payroll).compute()
+
+        self.assertEqual(preview["totals"]["EMPLOYEES"], len(results))
+        self.assertEqual(
+            self.get_net_salaries(preview),
+            {result["entry"].user_id: str(result["net_salary"]) for result in results},
+        )
+        self.assertFalse(PayrollPaymentDetail.objects.exists())
+
+    def test_cache_key_does_not_read_the_rows(self):
+        engine = PayrollEngine(self.payroll)
+        # Los datos de referencia quedan en memoria
+        engine.get_fingerprint()
+
+        with self.assertNumQueries(3):
+            engine.get_fingerprint()
+
+    def test_cached_preview_is_reused(self):
+        first = PayrollEngine(self.payroll).preview()
+
+        with self.assertNumQueries(3):
+            second = PayrollEngine(self.payroll).preview()
+        self.assertEqual(second, first)
+
+    def test_adjustment_change_refreshes_the_preview(self):
+        entry = self.get_entries()[0]
+        before = PayrollEngine(self.payroll).preview()
+        Adjustment.objects.create(
+            payroll_entry=entry,
+            type="B",
+            amount=Decimal("1234.56"),
+            description="Bono de prueba",
+            created_by=self.admin,
+        )
+
+        after = PayrollEngine(self.payroll).preview()
+        self.assertNotEqual(
+            self.get_net_salaries(after)[entry.user_id],
+            self.get_net_salaries(before)[entry.user_id],
+        )
+
+    def test_salary_change_refreshes_the_preview(self):
+        entry = self.get_entries()[0]
+        before = PayrollEngine(self.payroll).preview()
+        with localcontext(prec=28):
+            entry.user.salary += Decimal("1000.00")
+        entry.user.save()
+
+        after = PayrollEngine(self.payroll).preview()
+        self.assertNotEqual(
+            self.get_net_salaries(after)[entry.user_id],
+            self.get_net_salaries(before)[entry.user_id],
+        )
+
+
+class ReferenceDataCacheTest(PayrollTestCase):
+    def test_reference_data_is_read_once(self):
+        Payroll.get_config()
+        Deductions.get_all()
+
+        with self.assertNumQueries(0):
+            Payroll.get_config()
+            Deductions.get_all()
+
+    def test_change_is_seen_by_every_process(self):
+        deduction = Deductions.objects.get(name="AFP")
+        self.assertEqual(
+            Deductions.get_by_id(deduction.pk).percentage, deduction.percentage
+        )
+        version = ReferenceCache.get_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deduction.percentage = Decimal("3.00")
+            deduction.save()
+
+        self.assertNotEqual(ReferenceCache.get_version(), version)
+        self.assertEqual(Deductions.get_by_id(deduction.pk).percentage, Decimal("3.00"))
+
+
+class AdjustmentTotalsTest(PayrollTestCase):
+    def assert_totals_match_adjustments(self):
+        for entry in self.get_entries():
+            with self.subTest(payroll_entry_id=entry.payroll_entry_id):
+                with localcontext(prec=28):
+                    self.assertEqual(entry.total_bonus, Adjustment.calc_bonus(entry))
+                    self.assertEqual(
+                        entry.total_discount, Adjustment.calc_deduction(entry)
+                    )
+
+    def get_adjustments(self):
+        return Adjustment.objects.filter(
+            payroll_entry__payroll_id=self.payroll.payroll_id
+        ).order_by("adjustment_id")
+
+    def test_seeded_totals_match_adjustments(self):
+        self.assertTrue(self.get_adjustments().exists())
+        self.assert_totals_match_adjustments()
+
+    def test_save_and_delete_move_the_totals(self):
+        entries = self.get_entries()
+        adjustment = Adjustment.objects.create(
+            payroll_entry=entries[0],
+            type="B",
+            amount=Decimal("500.25"),
+            description="Bono",
+            created_by=self.admin,
+        )
+        self.assert_totals_match_adjustments()
+
+        adjustment.type = "D"
+        adjustment.amount = Decimal("75.10")
+        adjustment.payroll_entry = entries[1]
+        adjustment.save()
+        self.assert_totals_match_adjustments()
+
+        adjustment.state = Adjustment.INACTIVE
+        adjustment.save()
+        self.assert_totals_match_adjustments()
+
+        adjustment.delete()
+        self.assert_totals_match_adjustments()
+
+    def test_bulk_writes_refresh_the_totals(self):
+        entries = self.get_entries()
+        adjustments = self.get_adjustments()
+
+        bonuses = list(
+            adjustments.filter(type="B").values_list("adjustment_id", flat=True)[:3]
+        )
+        adjustments.filter(adjustment_id__in=bonuses).update(amount=Decimal("10.00"))
+        self.assert_totals_match_adjustments()
+
+        adjustments.filter(type="D").update(payroll_entry=entries[0])
+        self.assert_totals_match_adjustments()
+
+        changed = list(adjustments[:4])
+        for adjustment in changed:
+            adjustment.type = "D" if adjustment.type == "B" else "B"
+        Adjustment.objects.bulk_update(changed, ["type"])
+        self.assert_totals_match_adjustments()
+
+        Adjustment.objects.bulk_create(
+            [
+                Adjustment(
+                    payroll_entry=entry,
+                    type="B",
+                    amount=Decimal("99.99"),
+                    description="Bono",
+                    created_by=self.admin,
+                )
+                for entry in entries[:5]
+            ]
+        )
+        self.assert_totals_match_adjustments()
+
+        adjustments.filter(payroll_entry=entries[0]).delete()
+        self.assert_totals_match_adjustments()
+
+
+class AdjustmentImportTest(PayrollTestCase):
+    def get_row(self, **kwargs) -> dict:
+        entry = self.get_entries()[0]
+        return {
+            "USERNAME": entry.user_id,
+            "TYPE": "B",
+            "AMOUNT": "1500.00",
+            "DESCRIPTION": "Bono de desempeño",
+            **kwargs,
+        }
+
+    def test_invalid_rows_are_reported_by_row(self):
+        rows = [
+            self.get_row(),
+            self.get_row(USERNAME="nadie"),
+            self.get_row(TYPE="X"),
+            self.get_row(AMOUNT="0"),
+            self.get_row(AMOUNT="10.005"),
+            self.get_row(AMOUNT="abc"),
+            self.get_row(DESCRIPTION="x" * 251),
+            self.get_row(CONCEPT="NO EXISTE"),
+            {"USERNAME": self.get_row()["USERNAME"]},
+        ]
+        errors = AdjustmentImport(self.payroll, self.admin).validate(rows)
+
+        self.assertEqual([error["ROW"] for error in errors], list(range(2, 10)))
+        self.assertEqual(len(errors[-1]["ERRORS"]), 3)
+
+    def test_paid_entries_are_rejected(self):
+        paid = self.get_entries()[1]
+        PayrollEngine(self.payroll, entries_id=[paid.payroll_entry_id]).run(self.admin)
+
+        errors = AdjustmentImport(self.payroll, self.admin).validate(
+            [self.get_row(), self.get_row(USERNAME=paid.user_id)]
+        )
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]["ROW"], 2)
+        self.assertIn("ya fue pagada", errors[0]["ERRORS"][0])
+
+    def test_nothing_is_imported_when_a_row_has_errors(self):
+        adjustments = Adjustment.objects.count()
+        response = self.post(
+            "payroll/import_adjustments/",
+            {
+                "PAYROLL_ID": self.payroll.payroll_id,
+                "ADJUSTMENTS": [self.get_row(), self.get_row(TYPE="X")],
+            },
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["ROW"], 2)
+        self.assertEqual(Adjustment.objects.count(), adjustments)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_import_refreshes_the_entry_totals(self):
+        entry = self.get_entries()[0]
+        response = self.post(
+            "payroll/import_adjustments/",
+            {
+                "PAYROLL_ID": self.payroll.payroll_id,
+                "ADJUSTMENTS": [
+                    self.get_row(AMOUNT="1500.00"),
+                    self.get_row(AMOUNT="250.50"),
+                    self.get_row(TYPE="D", AMOUNT="99.99", CONCEPT="DESCUENTO"),
+                ],
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        refreshed = PayrollEntry.objects.get(pk=entry.pk)
+        with localcontext(prec=28):
+            self.assertEqual(
+                refreshed.total_bonus - entry.total_bonus, Decimal("1750.50")
+            )
+            self.assertEqual(
+                refreshed.total_discount - entry.total_discount, Decimal("99.99")
+            )
+
+
+class PartialPayrollTest(PayrollTestCase):
+    def test_second_run_pays_nothing(self):
+        entries = self.get_entries()
+        first = PayrollEngine(self.payroll).run(self.admin)
+        details = PayrollPaymentDetail.objects.filter(
+            payroll_id=self.payroll.payroll_id
+        ).count()
+
+        second = PayrollEngine(self.payroll).run(self.admin)
+
+        self.assertEqual(len(first), len(entries))
+        self.assertEqual(second, [])
+        self.assertEqual(
+            PayrollPaymentDetail.objects.filter(
+                payroll_id=self.payroll.payroll_id
+            ).count(),
+            details,
+        )
+
+    def test_payroll_is_finalized_once_every_entry_is_paid(self):
+        entries_id = [entry.payroll_entry_id for entry in self.get_entries()]
+        half = len(entries_id) // 2
+
+        PayrollEngine(self.payroll, entries_id=entries_id[:half]).run(self.admin)
+        self.assertFalse(self.payroll.finalize_if_complete(self.admin))
+        self.assertEqual(
+            Payroll.objects.get(pk=self.payroll.pk).status, Payroll.PENDING
+        )
+
+        PayrollEngine(self.payroll, entries_id=entries_id[half:]).run(self.admin)
+        self.assertTrue(self.payroll.finalize_if_complete(self.admin))
+        self.assertFalse(self.payroll.finalize_if_complete(self.admin))
+        self.assertEqual(Payroll.objects.get(pk=self.payroll.pk).status, Payroll.DONE)
+        self.assertEqual(
+            PayrollSummary.objects.filter(payroll_id=self.payroll.payroll_id).count(),
+            1,
+        )
+
+
+class PayrollShardTasksTest(PayrollTestCase):
+    def test_callback_keeps_an_incomplete_payroll_pending(self):
+        entries_id = [entry.payroll_entry_id for entry in self.get_entries()]
+        half = len(entries_id) // 2
+
+        processed = process_payroll_shard(
+            self.payroll.payroll_id, entries_id[:half], self.admin.username
+        )
+        with self.assertLogs("payroll.tasks", level="WARNING"):
+            result = finalize_payroll(
+                [processed], self.payroll.payroll_id, self.admin.username
+            )
+
+        self.assertFalse(result["completed"])
+        self.assertEqual(
+            Payroll.objects.get(pk=self.payroll.pk).status, Payroll.PENDING
+        )
+        self.assertFalse(
+            PayrollSummary.objects.filter(payroll_id=self.payroll.payroll_id).exists()
+        )
+
+    def test_callback_finalizes_a_complete_payroll(self):
+        entries_id = [entry.payroll_entry_id for entry in self.get_entries()]
+
+        processed = process_payroll_shard(
+            self.payroll.payroll_id, entries_id, self.admin.username
+        )
+        result = finalize_payroll(
+            [processed], self.payroll.payroll_id, self.admin.username
+        )
+
+        self.assertEqual(result["processed"], len(entries_id))
+        self.assertTrue(result["completed"])
+        self.assertEqual(Payroll.objects.get(pk=self.payroll.pk).status, Payroll.DONE)
+
+    def test_missing_rows_are_not_retried(self):
+        with mock.patch.object(process_payroll_shard, "retry") as retry:
+            with self.assertRaises(User.DoesNotExist):
+                process_payroll_shard(self.payroll.payroll_id, [], "no_existe")
+
+        retry.assert_not_called()
+
+    def test_transient_errors_are_retried(self):
+        entries_id = [entry.payroll_entry_id for entry in self.get_entries()]
+        error = OperationalError("database is locked")
+
+        with mock.patch.object(PayrollEngine, "run", side_effect=error):
+            with mock.patch.object(
+                process_payroll_shard, "retry", side_effect=Retry()
+            ) as retry:
+                with self.assertRaises(Retry):
+                    process_payroll_shard(
+                        self.payroll.payroll_id, entries_id, self.admin.username
+                    )
+
+        retry.assert_called_once_with(exc=error)
+
+
+class PayslipTest(PayrollTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.enterContext(override_settings(PAYSLIP_ROOT=directory.name))
+
+    def pay(self):
+        PayrollEngine(self.payroll).run(self.admin)
+        self.payroll.finalize(self.admin)
+
+    def test_pending_payroll_is_rejected(self):
+        response = self.post(
+            "payroll/generate_payslips/", {"payroll_id": self.payroll.payroll_id}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunks_are_written_to_the_archive(self):
+        self.pay()
+        rendered = [
+            render_payslips_chunk(self.payroll.payroll_id, chunk)
+            for chunk in PayslipGenerator(self.payroll).get_chunks()
+        ]
+
+        result = write_payslips(rendered, self.payroll.payroll_id)
+
+        with zipfile.ZipFile(result["output"]) as archive:
+            self.assertEqual(len(archive.namelist()), len(self.get_entries()))
+        self.assertEqual(result["payslips"], len(self.get_entries()))
+        self.assertEqual(list(self.root.iterdir()), [Path(result["output"])])
+
+    def test_failed_write_keeps_the_previous_archive(self):
+        self.pay()
+        generator = PayslipGenerator(self.payroll)
+        generator.write([[("previo.html", "previo")]])
+
+        def rendered():
+            yield [("nuevo.html", "nuevo")]
+            raise RuntimeError("error al generar")
+
+        with self.assertRaisesMessage(RuntimeError, "error al generar"):
+            generator.write(rendered())
+
+        with zipfile.ZipFile(generator.output) as archive:
+            self.assertEqual(archive.namelist(), ["previo.html"])
+        self.assertEqual(list(self.root.iterdir()), [generator.output])
+
+
+class YearToDateTest(PayrollTestCase):
+    def setUp(self):
+        super().setUp()
+        # Nómina quincenal: el salario del período es la mitad del mensual
+        PayrollSettings.objects.update(periods=2)
+        Payroll.objects.filter(pk=self.payroll.pk).update(
+            period_end=self.payroll.period_start + datetime.timedelta(days=14)
+        )
+        self.payroll.refresh_from_db()
+        ReferenceCache.clear()
+
+    def get_gross_salaries(self) -> dict[str, Decimal]:
+        return dict(
+            EmployeeYearToDate.objects.filter(
+                year=self.payroll.period_end.year
+            ).values_list("user_id", "gross_salary")
+        )
+
+    def test_details_keep_the_monthly_gross_salary(self):
+        results = PayrollEngine(self.payroll).run(self.admin)
+        details = PayrollPaymentDetail.objects.filter(
+            payroll_id=self.payroll.payroll_id
+        ).select_related("payroll_entry__user")
+
+        self.assertTrue(details)
+        for detail in details:
+            self.assertEqual(detail.gross_salary, detail.payroll_entry.user.salary)
+        with localcontext(prec=28):
+            self.assertEqual(
+                self.get_gross_salaries(),
+                {
+                    result["entry"]
+                    .user.username: (result["entry"].user.salary / 2)
+                    .quantize(CENT, ROUND_HALF_UP)
+                    for result in results
+                },
+            )
+
+    def test_rebuild_fills_the_period_salary_of_old_details(self):
+        PayrollEngine(self.payroll).run(self.admin)
+        accumulated = self.get_gross_salaries()
+
+        PayrollPaymentDetail.objects.update(period_salary=None)
+        EmployeeYearToDate.objects.all().delete()
+        EmployeeYearToDate.rebuild(self.admin)
+
+        self.assertEqual(self.get_gross_salaries(), accumulated)
+        self.assertFalse(
+            PayrollPaymentDetail.objects.filter(period_salary__isnull=True).exists()
+        )
+
+
+class PayrollBenchmarkTest(PayrollTestCase):
+    def test_run_fails_when_the_payroll_is_not_created(self):
+        # El período del mes ya fue usado, la nómina del benchmark no se crea
+        Payroll.objects.update(status=Payroll.DONE)
+        users = User.objects.count()
+
+        with self.assertRaisesMessage(ValueError, "No se pudo crear la nómina"):
+            PayrollBenchmark(self.admin).run([5])
+
+        self.assertEqual(User.objects.count(), users)
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class PayrollEngineSkipLockedTest(TransactionTestCase):
+    """
+    Entries locked by another transaction are skipped instead of paid twice
+    """
+
+    def setUp(self):
+        seeded = seed_payroll(20)
+        self.admin = seeded["admin"]
+        self.payroll = seeded["payroll"]
+
+    def tearDown(self):
+        ReferenceCache.clear()
+
+    def test_locked_entries_are_left_for_their_owner(self):
+        entries_id = list(
+            PayrollEntry.objects.filter(payroll_id=self.payroll.payroll_id)
+            .order_by("payroll_entry_id")
+            .values_list("payroll_entry_id", flat=True)
+        )
+        locked = entries_id[:5]
+        claimed = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    list(
+                        PayrollEntry.objects.filter(
+                            payroll_entry_id__in=locked
+                        ).select_for_update()
+                    )
+                    claimed.set()
+                    release.wait(30)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(claimed.wait(30))
+            results = PayrollEngine(self.payroll).run(self.admin)
+            self.assertEqual(
+                sorted(result["entry"].payroll_entry_id for result in results),
+                entries_id[5:],
+            )
+            self.assertFalse(self.payroll.finalize_if_complete(self.admin))
+        finally:
+            release.set()
+            thread.join()
+
+        results = PayrollEngine(self.payroll).run(self.admin)
+        self.assertEqual(
+            sorted(result["entry"].payroll_entry_id for result in results), locked
+        )
+        self.assertTrue(self.payroll.finalize_if_complete(self.admin))
+
+
+class RetroPayTest(PayrollTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        PayrollEngine(cls.payroll).run(cls.admin)
+        cls.payroll.finalize_if_complete(cls.admin)
+        cls.pending = Payroll.autostart_payroll(
+            cls.admin, PayrollSettings.objects.get(state=PayrollSettings.ACTIVE)
+        )
+        cls.usernames = list(
+            PayrollEntry.objects.filter(payroll_id=cls.pending.payroll_id)
+            .order_by("payroll_entry_id")
+            .values_list("user_id", flat=True)[:5]
+        )
+        raise_salaries(cls.usernames, Decimal("1000.00"))
+
+    def get_engine(self) -> RetroPayEngine:
+        return RetroPayEngine(
+            self.pending, self.usernames, self.payroll.period_start, self.admin
+        )
+
+    def get_totals(self) -> dict[int, Decimal]:
+        return dict(
+            PayrollEntry.objects.filter(user_id__in=self.usernames).values_list(
+                "payroll_entry_id", "total_bonus"
+            )
+        )
+
+    def test_second_run_writes_nothing(self):
+        first = self.get_engine()
+        first.run()
+        totals = self.get_totals()
+
+        second = self.get_engine()
+        results = second.run()
+
+        self.assertEqual(len(first.adjustments), len(self.usernames))
+        self.assertEqual(second.adjustments, [])
+        self.assertTrue(all(result["delta"] == 0 for result in results))
+        self.assertEqual(
+            Adjustment.objects.filter(source_payroll=self.payroll).count(),
+            len(self.usernames),
+        )
+        self.assertEqual(self.get_totals(), totals)
+
+    def test_dry_run_writes_nothing(self):
+        results = self.get_engine().compute()
+
+        self.assertTrue(all(result["delta"] > 0 for result in results))
+        self.assertFalse(
+            Adjustment.objects.filter(source_payroll=self.payroll).exists()
+        )
+
+    def test_users_without_pending_entry_are_not_applied(self):
+        username = self.usernames[0]
+        PayrollEntry.objects.filter(
+            payroll_id=self.pending.payroll_id, user_id=username
+        ).delete()
+
+        engine = self.get_engine()
+        results = engine.run()
+
+        self.assertNotIn(username, [result["username"] for result in results])
+        self.assertEqual(
+            [result["username"] for result in engine.not_applied], [username]
+        )
+        self.assertEqual(len(engine.adjustments), len(self.usernames) - 1)
+
+    def test_paid_pending_entries_are_not_applied(self):
+        paid = PayrollEntry.objects.get(
+            payroll_id=self.pending.payroll_id, user_id=self.usernames[0]
+        )
+        PayrollEngine(self.pending, entries_id=[paid.payroll_entry_id]).run(self.admin)
+
+        engine = self.get_engine()
+        engine.run()
+
+        self.assertEqual(
+            [result["username"] for result in engine.not_applied], [paid.user_id]
+        )
+        self.assertFalse(Adjustment.objects.filter(payroll_entry=paid).exists())
+
+    def test_processed_retro_pay_has_a_concept(self):
+        self.get_engine().run()
+        PayrollEngine(self.pending).run(self.admin)
+        self.pending.finalize_if_complete(self.admin)
+
+        retro = PayrollPaymentDetail.objects.filter(
+            payroll_id=self.pending.payroll_id,
+            payroll_entry__user_id__in=self.usernames,
+            comment__startswith="Retroactivo",
+        )
+        self.assertEqual(retro.count(), len(self.usernames))
+        self.assertEqual(
+            set(retro.values_list("concept__name", flat=True)), {"RETROACTIVO"}
+        )
+
+        response = self.post(
+            "payroll/get_payroll_history?page=1&page_size=5",
+            {
+                "condition": [
+                    {
+                        "field": "payroll_id",
+                        "operator": "=",
+                        "condition": self.pending.payroll_id,
+                        "dataType": "int",
+                    }
+                ]
+            },
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_bonus_and_discount_concepts_are_the_fallback(self):
+        Concept.objects.filter(name=RetroPayEngine.CONCEPT_NAME).delete()
+        ReferenceCache.clear()
+
+        engine = self.get_engine()
+        engine.run()
+
+        self.assertEqual(
+            {adjustment.concept.name for adjustment in engine.adjustments}, {"BONO"}
+        )
+
+    def test_missing_concepts_write_nothing(self):
+        Concept.objects.filter(
+            name__in=[RetroPayEngine.CONCEPT_NAME, "BONO", "DESCUENTO"]
+        ).delete()
+        ReferenceCache.clear()
+
+        with self.assertRaises(APIException):
+            self.get_engine().run()
+        self.assertFalse(
+            Adjustment.objects.filter(source_payroll=self.payroll).exists()
+        )
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class PayrollListQueriesTest(PayrollTestCase):
+    """
+    The list endpoints run the same queries whatever the size of the page
+    """
+
+    EMPLOYEES = 40
+
+    def count_queries(self, path: str, data: dict, page_size: int) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(f"{path}?page=1&page_size={page_size}", data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()["data"]), page_size)
+        return len(queries)
+
+    def assert_constant(self, path: str, data: dict):
+        # La primera llamada carga los datos de referencia en memoria
+        self.count_queries(path, data, 5)
+        self.assertEqual(
+            self.count_queries(path, data, 5), self.count_queries(path, data, 30)
+        )
+
+    @staticmethod
+    def condition(field: str, value, data_type: str = "int") -> list[dict]:
+        return [
+            {"field": field, "operator": "=", "condition": value, "dataType": data_type}
+        ]
+
+    def test_payroll_entries(self):
+        self.assert_constant(
+            "payroll/get_payroll_entries/",
+            {"condition": self.condition("payroll_id", self.payroll.payroll_id)},
+        )
+
+    def test_adjustments(self):
+        self.assert_constant(
+            "payroll/get_adjustments/",
+            {
+                "condition": self.condition(
+                    "payroll_entry__payroll_id", self.payroll.payroll_id
+                )
+            },
+        )
+
+    def test_adjustments_with_sparse_fields(self):
+        self.assert_constant(
+            "payroll/get_adjustments/",
+            {
+                "condition": self.condition(
+                    "payroll_entry__payroll_id", self.payroll.payroll_id
+                ),
+                "fields": ["adjustment_id", "amount", "username"],
+            },
+        )
+
+    def test_payroll_history(self):
+        PayrollEngine(self.payroll).run(self.admin)
+        self.payroll.finalize_if_complete(self.admin)
+
+        def count_queries(entries_limit: int) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post(
+                    "payroll/get_payroll_history?page=1&page_size=5",
+                    {
+                        "condition": self.condition(
+                            "payroll_id", self.payroll.payroll_id
+                        ),
+                        "entries_limit": entries_limit,
+                    },
+                )
+            self.assertEqual(response.status_code, 200, response.content)
+            payroll = response.json()["data"][0]
+            self.assertEqual(len(payroll["ENTRIES"]), entries_limit)
+            return len(queries)
+
+        count_queries(5)
+        self.assertEqual(count_queries(5), count_queries(30))
@@ -15,10 +15,17 @@ create_payroll_entry = views.PayrollViewSet.as_view({"post": "create_payroll_ent
 update_payroll_entry = views.PayrollViewSet.as_view({"put": "update_payroll_entry"})
 get_payroll_entry = views.PayrollViewSet.as_view({"get": "get_payroll_entry"})
 create_adjustment = views.PayrollViewSet.as_view({"post": "create_adjustment"})
+import_adjustments = views.PayrollViewSet.as_view({"post": "import_adjustments"})
+retro_pay = views.PayrollViewSet.as_view({"post": "retro_pay"})
 update_adjustment = views.PayrollViewSet.as_view({"put": "update_adjustment"})
 get_adjustments = views.PayrollViewSet.as_view({"post": "get_adjustments"})
 get_deduction_list = views.PayrollViewSet.as_view({"post": "get_deduction_list"})
 process_payroll = views.PayrollViewSet.as_view({"post": "process_payroll"})
+preview_payroll = views.PayrollViewSet.as_view({"post": "preview_payroll"})
+export_disbursement = views.PayrollViewSet.as_view({"get": "export_disbursement"})
+generate_payslips = views.PayrollViewSet.as_view({"post": "generate_payslips"})
+download_payslips = views.PayrollViewSet.as_view({"get": "download_payslips"})
+get_payroll_job = views.PayrollViewSet.as_view({"get": "get_payroll_job"})
 get_payroll_info = views.PayrollViewSet.as_view({"get": "get_payroll_info"})
 get_payroll_history = views.PayrollViewSet.as_view({"post": "get_payroll_history"})
 process_partial_payroll = views.PayrollViewSet.as_view(
@@ -36,11 +43,21 @@ urlpatterns = [
     path(f"{BASE_PAYROLL_PATH}update_payroll_entry/", update_payroll_entry),
     path(f"{BASE_PAYROLL_PATH}get_payroll_entry/<int:entry_id>/", get_payroll_entry),
     path(f"{BASE_PAYROLL_PATH}create_adjustment/", create_adjustment),
+    path(f"{BASE_PAYROLL_PATH}import_adjustments/", import_adjustments),
+    path(f"{BASE_PAYROLL_PATH}retro_pay/", retro_pay),
     path(f"{BASE_PAYROLL_PATH}update_adjustment/", update_adjustment),
     path(f"{BASE_PAYROLL_PATH}get_adjustments/", get_adjustments),
     path(f"{BASE_PAYROLL_PATH}get_deduction_list/", get_deduction_list),
     path(f"{BASE_PAYROLL_PATH}get_payroll/", get_payroll),
     path(f"{BASE_PAYROLL_PATH}process_payroll/", process_payroll),
+    path(f"{BASE_PAYROLL_PATH}preview_payroll/", preview_payroll),
+    path(
+        f"{BASE_PAYROLL_PATH}export_disbursement/<int:payroll_id>/",
+        export_disbursement,
+    ),
+    path(f"{BASE_PAYROLL_PATH}generate_payslips/", generate_payslips),
+    path(f"{BASE_PAYROLL_PATH}download_payslips/<int:payroll_id>/", download_payslips),
+    path(f"{BASE_PAYROLL_PATH}get_payroll_job/<str:job_id>/", get_payroll_job),
     path(f"{BASE_PAYROLL_PATH}get_payroll_info/", get_payroll_info),
     path(f"{BASE_PAYROLL_PATH}process_partial_payroll/", process_partial_payroll),
     path(f"{BASE_PAYROLL_PATH}get_payroll_history", get_payroll_history),
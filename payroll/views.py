@@ -1,5 +1,6 @@
 import datetime
 from django.forms import model_to_dict
+from django.http import FileResponse, StreamingHttpResponse
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 
@@ -10,24 +11,33 @@ from rest_framework.response import Response
 from helpers.common import BaseProtectedViewSet
 from helpers.constants import PAYLOAD_VALIDATION_ERROR
 from helpers.exceptions import PayloadValidationError, viewException
+from helpers.query_budget import query_budget
 from helpers.serializers import PaginationSerializer
 from helpers.utils import (
     advanced_query_filter,
     dict_key_to_lower,
     simple_query_filter,
 )
+from payroll.adjustments import AdjustmentImport
+from payroll.calculator import DeductionCalculator
+from payroll.disbursement import DisbursementFile
+from payroll.engine import PayrollEngine
+from payroll.payslips import PayslipGenerator
+from payroll.retro import RetroPayEngine
 from payroll.models import Adjustment, Deductions, Payroll, PayrollEntry
 from payroll.serializers import (
     AdjustmentSerializer,
     DeductionSerializer,
     PayrollEntrySerializer,
     PayrollHistorySerializer,
+    PayrollHistorySummarySerializer,
     PayrollInfoSerializer,
     PayrollSerializer,
+    RetroPaySerializer,
 )
+from payroll.tasks import get_payroll_job, start_payroll_job, start_payslips_job
 from users.models import ActivityLog
 
-
 User = get_user_model()
 
 
@@ -123,7 +133,9 @@ class PayrollViewSet(BaseProtectedViewSet):
     @viewException
     def process_payroll(self, request: Request):
         """
-        This endpoint is used to process de payroll payment
+        This endpoint is used to process de payroll payment\n
+        When `ASYNC` is `true` the payroll is processed in background shards
+        and the response contains the `JOB_ID` to follow its progress.
         """
         condition = dict_key_to_lower(request.data.get("condition"))
         if not condition:
@@ -135,11 +147,136 @@ class PayrollViewSet(BaseProtectedViewSet):
                 "No se encontro ningun resultado con la condition"
             )
 
+        if request.data.get("async", False):
+            job_id = start_payroll_job(payroll, request.user)
+            return Response(
+                {
+                    "data": {"job_id": job_id},
+                    "message": "El procesamiento de la nómina ha iniciado",
+                }
+            )
+
         payroll.process_payroll(request)
-        Payroll.update(request, payroll, status=Payroll.DONE)
+        # Las entradas que otro proceso tiene bloqueadas quedan pendientes
+        if not payroll.finalize_if_complete(request.user):
+            return Response(
+                {
+                    "message": "Nómina procesada, pero quedan entradas pendientes "
+                    "que se están procesando en otro proceso"
+                }
+            )
 
         return Response({"message": "Nómina procesada exitosamente"})
 
+    @query_budget(12)
+    @viewException
+    def preview_payroll(self, request: Request):
+        """
+        Return the result of processing the payroll without writing anything.
+        The result is cached until salaries, deductions or adjustments change\n
+        `METHOD` POST
+        """
+        condition = dict_key_to_lower(request.data.get("condition"))
+        if not condition:
+            raise PayloadValidationError("condition es requerido")
+
+        payroll = Payroll.objects.filter(simple_query_filter(condition)).first()
+        if not payroll:
+            raise PayloadValidationError(
+                "No se encontro ningun resultado con la condition"
+            )
+
+        return Response({"data": PayrollEngine(payroll).preview()})
+
+    @viewException
+    def export_disbursement(self, request: Request, payroll_id: int):
+        """
+        Stream the bank disbursement file of a processed payroll.
+        `FILE_FORMAT` query param can be `csv` (default) or `txt` (fixed width).
+        It has no query budget: the rows are read while the response is
+        streamed, after the view returns\n
+        `METHOD` GET
+        """
+        file_format = request.query_params.get("file_format", "csv").lower()
+        if file_format not in DisbursementFile.FORMATS:
+            raise PayloadValidationError(
+                f"FILE_FORMAT debe ser uno de: {', '.join(DisbursementFile.FORMATS)}"
+            )
+
+        payroll = Payroll.objects.filter(payroll_id=payroll_id).first()
+        if not payroll:
+            raise NotFound(f"Nomina con id '{payroll_id}' no encontrada")
+
+        if payroll.status != Payroll.DONE:
+            raise PayloadValidationError("La nómina aún no ha sido procesada")
+
+        disbursement = DisbursementFile(payroll, file_format)
+        negative = disbursement.get_negative()
+        if negative:
+            raise PayloadValidationError(
+                f"Las siguientes entradas tienen un salario neto negativo: "
+                f"{', '.join(negative)}"
+            )
+
+        response = StreamingHttpResponse(
+            disbursement.stream(), content_type=disbursement.content_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{disbursement.filename}"'
+        )
+        return response
+
+    @query_budget(3)
+    @viewException
+    def generate_payslips(self, request: Request):
+        """
+        Start the generation of the payslips of a processed payroll in background.
+        The progress is followed with `get_payroll_job`\n
+        `METHOD` POST
+        """
+        payroll_id = dict_key_to_lower(request.data).get("payroll_id", None)
+        if not payroll_id:
+            raise PayloadValidationError("PAYROLL_ID es requerido")
+
+        payroll = Payroll.objects.filter(payroll_id=payroll_id).first()
+        if not payroll:
+            raise NotFound(f"Nomina con id '{payroll_id}' no encontrada")
+
+        if payroll.status != Payroll.DONE:
+            raise PayloadValidationError("La nómina aún no ha sido procesada")
+
+        return Response(
+            {
+                "data": {"job_id": start_payslips_job(payroll)},
+                "message": "La generación de los volantes de pago ha iniciado",
+            }
+        )
+
+    @query_budget(2)
+    @viewException
+    def download_payslips(self, _request: Request, payroll_id: int):
+        """
+        Download the zip archive with the payslips of a payroll\n
+        `METHOD` GET
+        """
+        payroll = Payroll.objects.filter(payroll_id=payroll_id).first()
+        if not payroll:
+            raise NotFound(f"Nomina con id '{payroll_id}' no encontrada")
+
+        path = PayslipGenerator.get_default_output(payroll)
+        if not path.exists():
+            raise NotFound("Los volantes de pago de esta nómina no han sido generados")
+
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name)
+
+    @viewException
+    def get_payroll_job(self, _request: Request, job_id: str):
+        """
+        Return the status of a payroll processing job\n
+        `METHOD` GET
+        """
+        return Response({"data": get_payroll_job(job_id)})
+
     @viewException
     def process_partial_payroll(self, request: Request):
         """
@@ -166,21 +303,28 @@ class PayrollViewSet(BaseProtectedViewSet):
         entries = PayrollEntry.objects.filter(
             Q(user__username__in=users) & Q(payroll=payroll)
         )
-        if not all(entry.status is False for entry in entries):
+        if entries.filter(status=True).exists():
             raise PayloadValidationError(
                 "La nómina de uno o más empleados de los seleccionados ya ha sido procesada."
             )
 
-        users = entries.values_list("user__user_id", flat=True)
-
-        payroll.process_payroll(request, users)
+        users = list(entries.values_list("user__user_id", flat=True))
+        if not users:
+            raise NotFound("No se encontraron entradas de nómina para los usuarios")
 
-        if not PayrollEntry.objects.filter(
-            Q(state=PayrollEntry.ACTIVE) & Q(status=False)
-        ).exists():
-            Payroll.update(request, payroll, status=Payroll.DONE)
+        # Las entradas que otro usuario está procesando en este momento se omiten
+        results = PayrollEngine(payroll, users).run(request.user)
+        payroll.finalize_if_complete(request.user)
 
-        return Response({"message": "Entradas de nomina procesadas exitosamente"})
+        return Response(
+            {
+                "data": {
+                    "PROCESSED": len(results),
+                    "SKIPPED": len(users) - len(results),
+                },
+                "message": "Entradas de nomina procesadas exitosamente",
+            }
+        )
 
     @viewException
     def get_payrolls(self, request: Request):
@@ -208,10 +352,14 @@ class PayrollViewSet(BaseProtectedViewSet):
 
         return Response({"data": serializer.data})
 
+    @query_budget(15)
     @viewException
     def get_payroll_history(self, request: Request):
         """
-        Get a history of payrolls with their payment details\n
+        Get a history of payrolls with their payment details.
+        With `SUMMARY` in the body only the totals of `PayrollSummary` are returned.
+        The entries of every payroll are limited by `ENTRIES_LIMIT` (100 by
+        default, 1000 at most) and `ENTRIES_OFFSET`\n
         `METHOD`: POST
         """
         conditions = request.data.get("condition")
@@ -229,9 +377,31 @@ class PayrollViewSet(BaseProtectedViewSet):
             payrolls = payrolls.exclude(**ex)
 
         paginator = PaginationSerializer(request=request)
-        page = paginator.paginate_queryset(payrolls.distinct(), request)
 
-        serializer = PayrollHistorySerializer(page, many=True)
+        if request.data.get("summary", False):
+            payrolls = payrolls.select_related("payrollsummary_payroll")
+            page = paginator.paginate_queryset(payrolls.distinct(), request)
+            serializer = PayrollHistorySummarySerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        try:
+            limit = int(request.data.get("entries_limit") or 0)
+            offset = max(int(request.data.get("entries_offset") or 0), 0)
+        except (TypeError, ValueError) as e:
+            raise PayloadValidationError(
+                "ENTRIES_LIMIT y ENTRIES_OFFSET deben ser números"
+            ) from e
+
+        payrolls = PayrollHistorySerializer.prefetch(payrolls.distinct(), limit, offset)
+        page = paginator.paginate_queryset(payrolls, request)
+
+        # Los descuentos de ley de todos los empleados de la página en una consulta
+        deductions = DeductionCalculator.for_entries(
+            entry for payroll in page for entry in payroll.history_entries
+        )
+        serializer = PayrollHistorySerializer(
+            page, many=True, context={"deductions": deductions}
+        )
 
         return paginator.get_paginated_response(serializer.data)
 
@@ -275,13 +445,16 @@ class PayrollViewSet(BaseProtectedViewSet):
 
         return Response({"data": serializer.data})
 
+    @query_budget(8)
     @viewException
     def get_payroll_entries(self, request: Request):
         """
         Get a list of payroll entries\n
+        `FIELDS` is an optional list with the fields to return.\n
         `METHOD` POST
         """
         conditions = request.data.get("condition")
+        fields = request.data.get("fields", None)
 
         if not conditions:
             raise APIException("The condition are required")
@@ -296,9 +469,14 @@ class PayrollViewSet(BaseProtectedViewSet):
             entries = entries.exclude(**ex)
 
         paginator = PaginationSerializer(request=request)
-        page = paginator.paginate_queryset(entries.distinct(), request)
+        entries = PayrollEntrySerializer.prefetch(entries.distinct(), fields)
+        page = paginator.paginate_queryset(
+            PayrollEntrySerializer.only(entries, fields), request
+        )
 
-        seriazer = PayrollEntrySerializer(page, many=True, context={"request": request})
+        seriazer = PayrollEntrySerializer(
+            page, many=True, fields=fields, context={"request": request}
+        )
 
         return paginator.get_paginated_response(seriazer.data)
 
@@ -357,10 +535,8 @@ class PayrollViewSet(BaseProtectedViewSet):
                 f"Any payroll entry with id '{entry_id}' was found"
             )
         if entry.status:
-            raise APIException(
-                "No puede Inhabolidar esta entrada de nómina por que ya\
-                    se le ha realizado el pago correspondiente al periodo actual"
-            )
+            raise APIException("No puede Inhabolidar esta entrada de nómina por que ya\
+                    se le ha realizado el pago correspondiente al periodo actual")
 
         state_str = "Inhabilito" if state == "I" else "Habilito"
 
@@ -424,6 +600,131 @@ class PayrollViewSet(BaseProtectedViewSet):
 
         return Response({"message": "Registro completado con exito."})
 
+    @query_budget(25)
+    @viewException
+    def import_adjustments(self, request: Request):
+        """
+        Import bonuses and discounts in bulk. The rows come in a CSV `FILE` or in
+        the `ADJUSTMENTS` array, each with `USERNAME`, `TYPE`, `AMOUNT`,
+        `DESCRIPTION` and optionally `CONCEPT`. Nothing is imported if any row
+        has errors\n
+        `METHOD` POST
+        """
+        data = dict_key_to_lower(request.data)
+
+        payroll_id = data.get("payroll_id", None)
+        if not payroll_id:
+            raise PayloadValidationError("PAYROLL_ID es requerido")
+
+        payroll = Payroll.objects.filter(payroll_id=payroll_id).first()
+        if not payroll:
+            raise NotFound(f"Nomina con id '{payroll_id}' no encontrada")
+
+        if payroll.status == Payroll.DONE:
+            raise PayloadValidationError("La nómina ya fue procesada")
+
+        file = dict_key_to_lower(request.FILES).get("file", None)
+        rows = AdjustmentImport.read_csv(file) if file else data.get("adjustments")
+        if not rows or not isinstance(rows, list):
+            raise PayloadValidationError("FILE o ADJUSTMENTS es requerido")
+        if not all(isinstance(row, dict) for row in rows):
+            raise PayloadValidationError("ADJUSTMENTS debe ser una lista de objetos")
+
+        importer = AdjustmentImport(payroll, request.user)
+        errors = importer.validate(rows)
+        if errors:
+            return Response(
+                {
+                    "error": "Hay filas con errores, no se importó ningún registro.",
+                    "code": PAYLOAD_VALIDATION_ERROR,
+                    "errors": errors,
+                },
+                status=400,
+            )
+
+        adjustments = importer.save()
+
+        ActivityLog.register_activity(
+            instance=payroll,
+            user=request.user,
+            action=1,
+            message=f"@{request.user.username} importó {len(adjustments)} ajustes a la {payroll}",
+        )
+
+        return Response(
+            {"message": f"{len(adjustments)} registros importados con exito."}
+        )
+
+    @query_budget(25)
+    @viewException
+    def retro_pay(self, request: Request):
+        """
+        Recalculate the finalized payrolls affected by a backdated salary change
+        and write the differences into the pending payroll `PAYROLL_ID`. The
+        employees come in `USERS` or `DEPARTMENT_ID`; with `DRY_RUN` nothing is
+        written\n
+        `METHOD` POST
+        """
+        condition = dict_key_to_lower(request.data.get("condition"))
+        if not condition:
+            raise PayloadValidationError("condition es requerido")
+
+        payroll_id = condition.get("payroll_id", None)
+        if not payroll_id:
+            raise PayloadValidationError("PAYROLL_ID es requerido")
+
+        payroll = Payroll.objects.filter(payroll_id=payroll_id).first()
+        if not payroll:
+            raise NotFound(f"Nomina con id '{payroll_id}' no encontrada")
+
+        if payroll.status == Payroll.DONE:
+            raise PayloadValidationError("La nómina ya fue procesada")
+
+        try:
+            effective_from = datetime.date.fromisoformat(
+                str(condition.get("effective_from"))
+            )
+        except ValueError as e:
+            raise PayloadValidationError(
+                "EFFECTIVE_FROM es requerido con el formato 'YYYY-MM-DD'"
+            ) from e
+
+        users = condition.get("users", None)
+        department_id = condition.get("department_id", None)
+        if users and isinstance(users, list):
+            usernames = users
+        elif department_id:
+            usernames = list(
+                User.objects.filter(department_id=department_id).values_list(
+                    "username", flat=True
+                )
+            )
+        else:
+            raise PayloadValidationError("USERS o DEPARTMENT_ID es requerido")
+
+        engine = RetroPayEngine(payroll, usernames, effective_from, request.user)
+        if condition.get("dry_run", False):
+            results = engine.compute()
+        else:
+            results = engine.run()
+            if engine.adjustments:
+                ActivityLog.register_activity(
+                    instance=payroll,
+                    user=request.user,
+                    action=1,
+                    message=f"@{request.user.username} agregó {len(engine.adjustments)} ajustes retroactivos a la {payroll}",
+                )
+
+        results = [result for result in results if result["delta"]]
+        return Response(
+            {
+                "data": RetroPaySerializer(results, many=True).data,
+                # Diferencias de empleados sin entrada en la nómina pendiente
+                "not_applied": RetroPaySerializer(engine.not_applied, many=True).data,
+                "message": f"{len(engine.adjustments)} ajustes retroactivos registrados.",
+            }
+        )
+
     @viewException
     def update_adjustment(self, request: Request):
         """
@@ -472,13 +773,16 @@ class PayrollViewSet(BaseProtectedViewSet):
 
         return Response({"message": f"{adjustemt_type} acualizado exitosamente."})
 
+    @query_budget(5)
     @viewException
     def get_adjustments(self, request: Request):
         """ "
         Get a list of ajustmets filtered by a condition\n
+        `FIELDS` is an optional list with the fields to return.\n
         `METHOD` POST
         """
         conditions = request.data.get("condition", None)
+        fields = request.data.get("fields", None)
 
         if not conditions:
             raise PayloadValidationError("The condition is required")
@@ -493,9 +797,14 @@ class PayrollViewSet(BaseProtectedViewSet):
             adjustments = adjustments.exclude(**exclude)
 
         paginator = PaginationSerializer(request=request)
-        page = paginator.paginate_queryset(adjustments, request)
+        adjustments = AdjustmentSerializer.prefetch(adjustments, fields)
+        page = paginator.paginate_queryset(
+            AdjustmentSerializer.only(adjustments, fields), request
+        )
 
-        serializer = AdjustmentSerializer(page, many=True, context={"request": request})
+        serializer = AdjustmentSerializer(
+            page, many=True, fields=fields, context={"request": request}
+        )
 
         return paginator.get_paginated_response(serializer.data)
 
@@ -5,6 +5,7 @@ from django.utils.safestring import SafeText
 from rest_framework.exceptions import APIException
 
 from helpers.models import STATE_CHOICES, BaseModels
+from helpers.sequences import IdAllocator
 from users.models import User
 
 
@@ -47,12 +48,11 @@ class Task(BaseModels):
 
     def add_task_to_user(self, users: list[User]) -> None:
         task_users = []
-        count = TaskXusers.objects.all().count()
-        for user in users:
-            count += 1
+        ids = IdAllocator.allocate(TaskXusers, len(users))
+        for task_user_id, user in zip(ids, users):
             task_users.append(
                 TaskXusers(
-                    id=count,
+                    id=task_user_id,
                     task=self,
                     user=user,
                     created_by=self.created_by,
@@ -71,11 +71,12 @@ class Task(BaseModels):
 
     def add_tag_to_task(self, tags: list["Tags"]) -> None:
         task_tags = []
-        count = TagXTasks.objects.all().count()
-        for tag in tags:
-            count += 1
+        ids = IdAllocator.allocate(TagXTasks, len(tags))
+        for tag_task_id, tag in zip(ids, tags):
             task_tags.append(
-                TagXTasks(id=count, task=self, tag=tag, created_by=self.created_by)
+                TagXTasks(
+                    id=tag_task_id, task=self, tag=tag, created_by=self.created_by
+                )
             )
         return TagXTasks.objects.bulk_create(task_tags)
 
@@ -152,6 +153,9 @@ class TaskXusers(BaseModels):
 
         # Crear las nuevas relaciones en lote (bulk_create)
         if task_users:
+            ids = IdAllocator.allocate(TaskXusers, len(task_users))
+            for task_user_id, task_user in zip(ids, task_users):
+                task_user.id = task_user_id
             TaskXusers.objects.bulk_create(task_users)
 
         # Actualizar las relaciones existentes a ACTIVE
@@ -191,8 +195,7 @@ class Tags(BaseModels):
         return f"{self.__class__.__name__}({self.name!r})"
 
     def mormalize_color(self) -> SafeText:
-        return format_html(
-            f"""<div
+        return format_html(f"""<div
                     style="background-color: {self.color};
                         width: 50px;
                         height: 15px;
@@ -204,8 +207,7 @@ class Tags(BaseModels):
                     "
                 >
                     {self.color}
-                </div>"""
-        )
+                </div>""")
 
     mormalize_color.short_description = "Color"
 
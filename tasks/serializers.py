@@ -1,18 +1,79 @@
 from rest_framework import serializers
-from django.db.models import Q
+from django.db.models import Prefetch, Q, QuerySet
 from django.contrib.auth import get_user_model
 
-from tasks.models import Tags, Task, TaskXusers
-from helpers.serializers import BaseModelSerializer, DynamicSerializer
+from tasks.models import Tags, TagXTasks, Task, TaskXusers
+from helpers.serializers import BaseModelSerializer
 
 User = get_user_model()
 
 
+class TaskUserSerializer(BaseModelSerializer):
+    """
+    Users assigned to a task
+    """
+
+    class Meta:
+        model = User
+        fields = ("username", "avatar", "full_name")
+
+
 class TaskSeriaizer(BaseModelSerializer):
+    """
+    Serializer for the tasks.\n
+    Use `prefetch` on lists so the tags and users of a whole page are loaded
+    in a fixed number of queries.
+    """
+
     tags = serializers.SerializerMethodField()
     assigned_users = serializers.SerializerMethodField()
 
+    FIELD_COLUMNS = {"tags": (), "assigned_users": ()}
+
+    @classmethod
+    def prefetch(
+        cls, tasks: QuerySet[Task], fields: list[str] = None
+    ) -> QuerySet[Task]:
+        """
+        Load the relations of the requested `fields`, all by default
+        """
+        relations = [
+            name for name in ("created_by", "updated_by") if cls.wants(fields, name)
+        ]
+        lookups = []
+        if cls.wants(fields, "users"):
+            lookups.append(Prefetch("users", queryset=User.objects.only("user_id")))
+        if cls.wants(fields, "tags"):
+            lookups.append(
+                Prefetch(
+                    "tagxtasks_task",
+                    queryset=TagXTasks.objects.filter(state=TagXTasks.ACTIVE)
+                    .select_related("tag")
+                    .order_by("tag_id"),
+                    to_attr="active_tags",
+                )
+            )
+        if cls.wants(fields, "assigned_users"):
+            lookups.append(
+                Prefetch(
+                    "taskxusers_task",
+                    queryset=TaskXusers.objects.filter(state=TaskXusers.ACTIVE)
+                    .select_related("user")
+                    .order_by("user_id"),
+                    to_attr="active_users",
+                )
+            )
+        if relations:
+            tasks = tasks.select_related(*relations)
+        return tasks.prefetch_related(*lookups)
+
     def get_assigned_users(self, instance: Task):
+        if hasattr(instance, "active_users"):
+            users = {
+                task_user.user_id: task_user.user for task_user in instance.active_users
+            }
+            return TaskUserSerializer(list(users.values()), many=True).data
+
         task_users = TaskXusers.objects.filter(
             Q(task=instance) & Q(state=TaskXusers.ACTIVE)
         )
@@ -20,27 +81,33 @@ class TaskSeriaizer(BaseModelSerializer):
             username__in=task_users.values_list("user__username", flat=True)
         )
 
-        return DynamicSerializer(
-            model=User,
-            fields=["username", "avatar", "full_name"],
-            instance=users,
-            many=True,
-        ).data
+        return TaskUserSerializer(users, many=True).data
 
     def get_tags(self, instance: Task | dict):
+        if hasattr(instance, "active_tags"):
+            tags = [tag_task.tag for tag_task in instance.active_tags]
+            return TagSerializer(tags, many=True).data
         if isinstance(instance, Task):
-            return TagSerializer(instance.tags.all(), many=True).data
+            tags = Tags.objects.filter(
+                Q(tagxtasks_tag__task=instance)
+                & Q(tagxtasks_tag__state=TagXTasks.ACTIVE)
+            ).order_by("tag_id")
+            return TagSerializer(tags, many=True).data
         return TagSerializer(data=instance.get("tags", []), many=True).data
 
-    def __init__(
-        self, instance=None, data=None, fields="__all__", exclude=None, **kwargs
-    ):
-        self.Meta.exclude = exclude
-        self.Meta.fields = fields if exclude is None else None
-        super().__init__(instance, data, **kwargs)
+    def __init__(self, instance=None, data=None, fields=None, exclude=None, **kwargs):
+        self.exclude = set(exclude or ())
+        super().__init__(instance, data, fields=fields, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        return {
+            name: field for name, field in fields.items() if name not in self.exclude
+        }
 
     class Meta:
         model = Task
+        fields = "__all__"
 
 
 class TagSerializer(BaseModelSerializer):
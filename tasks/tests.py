@@ -1,3 +1,81 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.settings import PATH_BASE
+from helpers.cache import ReferenceCache
+from payroll.seeding import DataSeeder
+from tasks.models import Task
+from tasks.serializers import TaskSeriaizer
+from users.models import User
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class TasksListTest(TestCase):
+    CONDITION = [
+        {"field": "task_id", "operator": ">", "condition": 0, "dataType": "int"}
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        ReferenceCache.clear()
+        cls.admin = User.objects.create(
+            user_id=1,
+            name="Admin",
+            last_name="CompuPay",
+            email="admin@compupay.test",
+            username="admin",
+            is_staff=True,
+            salary=Decimal("75000.00"),
+        )
+        DataSeeder(cls.admin, seed=14).seed(30)
+
+    def setUp(self):
+        ReferenceCache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def count_queries(self, page_size: int, **data) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                f"/{PATH_BASE}tasks/get_tasks_list?page=1&page_size={page_size}",
+                {"condition": self.CONDITION, **data},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()["data"]), page_size)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_page(self):
+        self.assertGreaterEqual(Task.objects.count(), 15)
+
+        self.count_queries(5)
+        self.assertEqual(self.count_queries(5), self.count_queries(15))
+
+    def test_prefetched_tags_and_assignees_match_the_rows(self):
+        response = self.client.post(
+            f"/{PATH_BASE}tasks/get_tasks_list?page=1&page_size=15",
+            {"condition": self.CONDITION},
+            format="json",
+        )
+        listed = {task["TASK_ID"]: task for task in response.json()["data"]}
+        self.assertTrue(any(task["TAGS"] for task in listed.values()))
+        self.assertTrue(any(task["ASSIGNED_USERS"] for task in listed.values()))
+
+        for task in Task.objects.filter(task_id__in=listed):
+            with self.subTest(task_id=task.task_id):
+                data = TaskSeriaizer([task], many=True).data[0]
+                self.assertEqual(listed[task.task_id]["TAGS"], data["TAGS"])
+                self.assertEqual(
+                    listed[task.task_id]["ASSIGNED_USERS"], data["ASSIGNED_USERS"]
+                )
+
+    def test_sparse_fields_do_not_grow_with_the_page(self):
+        fields = ["task_id", "tags", "assigned_users"]
+        self.count_queries(5, fields=fields)
+        self.assertEqual(
+            self.count_queries(5, fields=fields), self.count_queries(15, fields=fields)
+        )
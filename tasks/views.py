@@ -10,13 +10,14 @@ from rest_framework.permissions import IsAuthenticated
 
 from helpers.common import BaseProtectedViewSet
 from helpers.exceptions import PayloadValidationError, viewException
+from helpers.query_budget import query_budget
+from helpers.sequences import IdAllocator
 from helpers.serializers import PaginationSerializer
 from helpers.utils import advanced_query_filter, dict_key_to_lower, simple_query_filter
 from tasks.models import TagXTasks, Tags, Task, TaskXusers
 from tasks.serializers import TagSerializer, TaskSeriaizer
 from users.models import ActivityLog
 
-
 UserModel = get_user_model()
 
 
@@ -225,12 +226,15 @@ class TaskViewSet(BaseProtectedViewSet):
 
         return Response({"message": "Users have been updated successfully."})
 
+    @query_budget(8)
     @viewException
     def get_tasks_list(self, request):
         """
-        Get a list of tasks
+        Get a list of tasks.\n
+        `FIELDS` is an optional list with the fields to return.
         """
         condition: list[dict] = request.data.get("condition", None)
+        fields: list[str] = request.data.get("fields", None)
 
         if not condition:
             raise APIException("The condition is required")
@@ -242,9 +246,12 @@ class TaskViewSet(BaseProtectedViewSet):
             tasks = tasks.exclude(exclude)
 
         paginator = PaginationSerializer(request=request)
-        page = paginator.paginate_queryset(tasks.distinct(), request)
+        tasks = TaskSeriaizer.prefetch(tasks.distinct(), fields)
+        page = paginator.paginate_queryset(TaskSeriaizer.only(tasks, fields), request)
 
-        serializer = TaskSeriaizer(page, many=True, context={"request": request})
+        serializer = TaskSeriaizer(
+            page, many=True, fields=fields, context={"request": request}
+        )
 
         return paginator.get_paginated_response(serializer.data)
 
@@ -307,8 +314,7 @@ class TaskViewSet(BaseProtectedViewSet):
 
         TagSerializer(data=data).is_valid(raise_exception=True)
 
-        tag_count = Tags.objects.all().count() or 0
-        data["tag_id"] = tag_count + 1
+        data["tag_id"] = IdAllocator.next_id(Tags)
         tag = Tags.create(request, **data)
 
         serializer = TagSerializer(
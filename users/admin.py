@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.admin.sites import AdminSite
 from helpers.admin import BaseModelAdmin, BaseModelInline
+from helpers.sequences import IdAllocator
 from users.forms import (
     CustomCreationForm,
     CustomUserChangeForm,
@@ -149,7 +150,7 @@ class RolesAdmin(BaseModelAdmin):
         # Aquí puedes agregar tu lógica personalizada antes de guardar
         if not change:  # Si es una nueva instancia
             obj.created_by = request.user
-            obj.rol_id = Roles.objects.count() + 1
+            obj.rol_id = IdAllocator.next_id(Roles)
         else:  # Si es una instancia existente
             obj.updated_by = request.user
         super().save_model(request, obj, form, change)
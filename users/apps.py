@@ -2,5 +2,10 @@ from django.apps import AppConfig
 
 
 class AuthConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'users'
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "users"
+
+    def ready(self):
+        # Registra las señales del modelo
+        # pylint: disable=import-outside-toplevel
+        import users.signals  # noqa: F401
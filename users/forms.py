@@ -12,6 +12,7 @@ from django.contrib.auth.forms import (
 )
 
 
+from helpers.sequences import IdAllocator
 from users.models import MenuOptions, OperationsMeneOptions, UserPermission
 
 
@@ -94,10 +95,5 @@ class OperationsMeneOptionsForm(forms.ModelForm):
 
     # rewritte the create method
     def create(self, validated_data):
-        # count the number of operations
-        operations_count = self.Meta.model.objects.all().values_list(
-            "operation_id", flat=True
-        )
-        max_operation_id = max(operations_count) if operations_count else 0
-        validated_data["operation_id"] = max_operation_id + 1
+        validated_data["operation_id"] = IdAllocator.next_id(self.Meta.model)
         return self.Meta.model.objects.create(**validated_data)
@@ -0,0 +1,131 @@
+import hashlib
+
+from django.db.models import Q
+
+from helpers.cache import MenuCache
+from users.models import (
+    MenuOptions,
+    OperationsMeneOptions,
+    RolesUsers,
+    User,
+    UserPermission,
+)
+from users.serializers import MenuOptionsSerializer
+
+
+class MenuTree:
+    """
+    Sidebar menu of a user.\n
+    The options under a top level option are the same for every user, only the
+    top level options a user can see depend on their roles and permissions. So
+    the whole tree is built once, from one flat query of the options and one
+    bulk query for their parameters and another for their operations, and put
+    together in memory by `MenuOptionsSerializer`. The visible options are
+    keyed by a hash of the roles and permissions that grant them, so users
+    with the same grants share them. The tree, the visible options and the
+    grants of every user are kept in `MenuCache` until a menu, role or
+    permission changes (see `users.signals`), so a sidebar load costs no
+    queries and at most one read of the shared cache version.
+    """
+
+    TREE_KEY = "menu_tree"
+    GRANTS_KEY = "menu_grants:{user_id}"
+    VISIBLE_KEY = "menu_visible:{grants}"
+
+    @staticmethod
+    def get_context() -> dict:
+        """
+        Children, parameters and operations of every option by `menu_option_id`
+        """
+        children: dict[str, list[MenuOptions]] = {}
+        for option in MenuOptions.objects.all():
+            children.setdefault(option.parent_id_id, []).append(option)
+
+        parameters: dict[str, dict] = {}
+        through = MenuOptions.parameters.through
+        for option_id, name, value in through.objects.order_by(
+            "parameters_id"
+        ).values_list("menuoptions_id", "parameters__name", "parameters__value"):
+            parameters.setdefault(option_id, {})[name] = value
+
+        operations: dict[str, list[int]] = {}
+        for option_id, operation_id in OperationsMeneOptions.objects.order_by(
+            "id"
+        ).values_list("menu_option_id", "user_permission_id__operation_id"):
+            operations.setdefault(option_id, []).append(operation_id)
+
+        return {
+            "children": children,
+            "parameters": parameters,
+            "operations": operations,
+        }
+
+    @classmethod
+    def build(cls) -> list[dict]:
+        """
+        Serialize the tree of every active top level option
+        """
+        context = cls.get_context()
+        roots = [
+            option
+            for option in context["children"].get(None, [])
+            if option.state == MenuOptions.ACTIVE
+        ]
+        return list(MenuOptionsSerializer(roots, many=True, context=context).data)
+
+    @staticmethod
+    def get_grants(user: User) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        """
+        Sorted ids of the roles and the permissions of the user
+        """
+        roles = RolesUsers.objects.filter(user_id=user.user_id).values_list(
+            "rol_id", flat=True
+        )
+        permissions = UserPermission.objects.filter(user_id=user.user_id).values_list(
+            "id", flat=True
+        )
+        return tuple(sorted(set(roles))), tuple(sorted(permissions))
+
+    @staticmethod
+    def get_visible(
+        roles: tuple[int, ...], permissions: tuple[int, ...]
+    ) -> frozenset[str]:
+        """
+        Top level options visible through the `roles`, the `permissions` or
+        the menu options of the active ones
+        """
+        active_permissions = UserPermission.objects.filter(
+            Q(id__in=permissions) & Q(state=UserPermission.ACTIVE)
+        ).values("id")
+        operation_menu_options = OperationsMeneOptions.objects.filter(
+            Q(user_permission_id__in=active_permissions)
+            & Q(state=OperationsMeneOptions.ACTIVE)
+        ).values("menu_option_id")
+
+        return frozenset(
+            MenuOptions.objects.filter(
+                Q(
+                    Q(menu_option_id__in=operation_menu_options)
+                    | Q(menuoptonxroles__rol_id__in=roles)
+                    | Q(userpermission__id__in=permissions)
+                )
+                & Q(parent_id__isnull=True)
+            )
+            .order_by()
+            .values_list("menu_option_id", flat=True)
+            .distinct()
+        )
+
+    @classmethod
+    def for_user(cls, user: User) -> list[dict]:
+        tree = MenuCache.get(cls.TREE_KEY, cls.build)
+        roles, permissions = MenuCache.get(
+            cls.GRANTS_KEY.format(user_id=user.user_id),
+            lambda: cls.get_grants(user),
+        )
+        grants = hashlib.sha1(repr((roles, permissions)).encode()).hexdigest()
+        visible = MenuCache.get(
+            cls.VISIBLE_KEY.format(grants=grants),
+            lambda: cls.get_visible(roles, permissions),
+        )
+        return [option for option in tree if option["key"] in visible]
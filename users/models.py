@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from django.db import models
-from django.db.models import Max, Q, Manager
+from django.db.models import Q, Manager
 from django.forms import ValidationError
 from django.utils import timezone
 from django.utils.html import format_html
@@ -13,6 +13,7 @@ from rest_framework.exceptions import APIException
 from rest_framework.request import Request
 
 from helpers.exceptions import UserDoesNotExist
+from helpers.sequences import IdAllocator
 
 STATE_CHOICES = (
     ("A", "Activo"),
@@ -42,10 +43,8 @@ class UserManager(BaseUserManager):
 
             roles = extra_fields.pop("roles", None)
 
-            max_user_id = self.all().aggregate(Max("user_id"))["user_id__max"]
-
             user = self.model(
-                user_id=max_user_id + 1,
+                user_id=IdAllocator.next_id(self.model),
                 name=name,
                 last_name=last_name,
                 email=email,
@@ -58,19 +57,19 @@ class UserManager(BaseUserManager):
             user.set_password(password)
             user.save(using=self._db)
 
-            max_user_role_id = RolesUsers.objects.all().aggregate(Max("id"))["id__max"]
             try:
                 if roles is not None:
                     roles_users = []
-                    roles = Roles.objects.filter(rol_id__in=roles)
+                    roles = list(Roles.objects.filter(rol_id__in=roles))
+                    ids = IdAllocator.allocate(RolesUsers, len(roles))
 
-                    for role in roles:
+                    for role_user_id, role in zip(ids, roles):
                         roles_users.append(
                             RolesUsers(
                                 rol_id=role,
                                 user_id=user,
                                 created_by=created_by,
-                                pk=max_user_role_id + 1,
+                                pk=role_user_id,
                                 state="A",
                             )
                         )
@@ -435,8 +434,7 @@ class Roles(BaseUsersModels):
         return f"{self.__class__.__name__}({self.name!r})"
 
     def render_color(self):
-        return format_html(
-            f"""<span
+        return format_html(f"""<span
                 style="
                     padding: 5px; 
                     border-radius: 5px; 
@@ -445,8 +443,7 @@ class Roles(BaseUsersModels):
                     height: 50px;
                     width: 100px;
                     min-width: 180px"
-                >{self.color}</span>"""
-        )
+                >{self.color}</span>""")
 
     render_color.short_description = "Color"
 
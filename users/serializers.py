@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from django.db.models import Q
+from django.db.models import Prefetch, Q, QuerySet
 
 from helpers.serializers import BaseModelSerializer
 from payroll.models import DeductionXuser
@@ -16,13 +16,9 @@ from users.models import (
 
 
 class RolesSerializer(BaseModelSerializer):
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop("fields", "__all__")
-        self.Meta.fields = fields
-        super().__init__(*args, fields=fields, **kwargs)
-
     class Meta:
         model = Roles
+        fields = "__all__"
 
 
 class AuthenticateUserSerializer(BaseModelSerializer):
@@ -75,7 +71,9 @@ class AuthenticateUserSerializer(BaseModelSerializer):
 
 class UserSerializer(BaseModelSerializer):
     """
-    Serializer for the user model.
+    Serializer for the user model.\n
+    Use `prefetch` on lists so the relations, roles and deductions of a whole
+    page are loaded in a fixed number of queries.
     """
 
     roles = serializers.SerializerMethodField()
@@ -87,6 +85,63 @@ class UserSerializer(BaseModelSerializer):
     name_supervisor = serializers.SerializerMethodField()
     deductions = serializers.SerializerMethodField(source="get_deductions")
     desc_department = serializers.SerializerMethodField()
+    full_name = serializers.CharField(read_only=True)
+
+    FIELD_COLUMNS = {
+        "roles": (),
+        "tax": ("salary",),
+        "gross_salary": ("salary",),
+        "net_salary": ("salary",),
+        "avatar": ("avatar", "username"),
+        "desc_gender": ("gender",),
+        "name_supervisor": ("supervisor",),
+        "deductions": ("username",),
+        "desc_department": ("department",),
+        "full_name": ("name", "last_name"),
+    }
+    EXPLICIT_FIELDS = ("salary",)
+
+    @classmethod
+    def prefetch(
+        cls, users: QuerySet[User], fields: list[str] = None
+    ) -> QuerySet[User]:
+        """
+        Load the relations of the requested `fields`, all by default
+        """
+        relations = [
+            name
+            for name, wanted in (
+                ("supervisor", ("supervisor", "name_supervisor")),
+                ("department", ("desc_department",)),
+                ("created_by", ("created_by",)),
+                ("updated_by", ("updated_by",)),
+            )
+            if cls.wants(fields, *wanted)
+        ]
+        lookups = []
+        if cls.wants(fields, "roles"):
+            lookups.append(
+                Prefetch(
+                    "rolesusers_set",
+                    queryset=RolesUsers.objects.filter(state=RolesUsers.ACTIVE)
+                    .select_related("rol_id__created_by", "rol_id__updated_by")
+                    .prefetch_related("rol_id__operations")
+                    .order_by("rol_id"),
+                    to_attr="active_roles",
+                )
+            )
+        if cls.wants(fields, "deductions"):
+            lookups.append(
+                Prefetch(
+                    "deductionxuser_user",
+                    queryset=DeductionXuser.objects.order_by("id"),
+                    to_attr="deduction_list",
+                )
+            )
+
+        if relations:
+            users = users.select_related(*relations)
+        return users.prefetch_related(*lookups)
 
     def get_desc_department(self, obj: User):
         if obj.department:
@@ -94,6 +149,8 @@ class UserSerializer(BaseModelSerializer):
         return None
 
     def get_deductions(self, obj: User):
+        if hasattr(obj, "deduction_list"):
+            return [deduction.deduction_id for deduction in obj.deduction_list]
         deductions = DeductionXuser.objects.filter(user=obj.username)
         return deductions.values_list("deduction_id", flat=True)
 
@@ -141,6 +198,9 @@ class UserSerializer(BaseModelSerializer):
     def get_roles(self, instance: User):
         if isinstance(instance, dict):
             return instance.get("roles", [])
+        if hasattr(instance, "active_roles"):
+            roles = {role.rol_id_id: role.rol_id for role in instance.active_roles}
+            return RolesSerializer(list(roles.values()), many=True).data
         roles_user = RolesUsers.objects.filter(
             Q(user_id=instance.user_id) & Q(state=RolesUsers.ACTIVE)
         )
@@ -156,7 +216,7 @@ class UserSerializer(BaseModelSerializer):
 
     class Meta:
         model = User
-        exclude = ("password", "salary")
+        exclude = ("password",)
 
 
 class UserPermissionSerializer(BaseModelSerializer):
@@ -171,7 +231,10 @@ class UserPermissionSerializer(BaseModelSerializer):
 
 class MenuOptionsSerializer(BaseModelSerializer):
     """
-    Serializer for the menu options.
+    Serializer for the menu options.\n
+    The `children`, `parameters` and `operations` of every option can be given
+    in the context, indexed by `menu_option_id`, to serialize a whole tree
+    without a query per option (see `users.menu.MenuTree`).
     """
 
     label = serializers.CharField(source="name")
@@ -182,6 +245,8 @@ class MenuOptionsSerializer(BaseModelSerializer):
     parameters = serializers.SerializerMethodField()
 
     def get_parameters(self, instance: MenuOptions):
+        if "parameters" in self.context:
+            return self.context["parameters"].get(instance.menu_option_id, {})
         parameters = instance.parameters.all()
         serializer = ParametersSerializer(parameters, many=True)
         output = {}
@@ -190,10 +255,19 @@ class MenuOptionsSerializer(BaseModelSerializer):
         return output
 
     def get_children(self, instance: MenuOptions):
-        options = MenuOptions.objects.filter(parent_id=instance.menu_option_id).all()
-        return MenuOptionsSerializer(options, many=True).data or None
+        if "children" in self.context:
+            options = self.context["children"].get(instance.menu_option_id, [])
+        else:
+            options = MenuOptions.objects.filter(
+                parent_id=instance.menu_option_id
+            ).all()
+        return (
+            MenuOptionsSerializer(options, many=True, context=self.context).data or None
+        )
 
     def get_operations(self, instance: MenuOptions):
+        if "operations" in self.context:
+            return self.context["operations"].get(instance.menu_option_id, [])
         operations_mene_options = OperationsMeneOptions.objects.filter(
             menu_option_id=instance.menu_option_id
         )
@@ -0,0 +1,63 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from helpers.cache import MenuCache
+from users.models import (
+    MenuOptions,
+    MenuOptonXroles,
+    Operations,
+    OperationsMeneOptions,
+    Parameters,
+    ParametesXmenuOptions,
+    Roles,
+    RolesUsers,
+    User,
+    UserPermission,
+)
+
+# Modelos de los que depende el menú de `users.menu.MenuTree`
+MENU_MODELS = (
+    MenuOptions,
+    MenuOptonXroles,
+    Operations,
+    OperationsMeneOptions,
+    Parameters,
+    ParametesXmenuOptions,
+    Roles,
+    RolesUsers,
+    UserPermission,
+)
+
+MENU_RELATIONS = (
+    MenuOptions.parameters.through,
+    MenuOptions.roles.through,
+    User.roles.through,
+    UserPermission.menu_options.through,
+)
+
+
+def invalidate_relation(action: str, **kwargs):
+    """
+    `m2m_changed` receiver: `add`, `remove` and `clear` don't send `post_save`
+    """
+    if action.startswith("post_"):
+        MenuCache.invalidate_on_commit(**kwargs)
+
+
+for model in MENU_MODELS:
+    post_save.connect(
+        MenuCache.invalidate_on_commit,
+        sender=model,
+        dispatch_uid=f"menu_cache_save_{model.__name__}",
+    )
+    post_delete.connect(
+        MenuCache.invalidate_on_commit,
+        sender=model,
+        dispatch_uid=f"menu_cache_delete_{model.__name__}",
+    )
+
+for through in MENU_RELATIONS:
+    m2m_changed.connect(
+        invalidate_relation,
+        sender=through,
+        dispatch_uid=f"menu_cache_m2m_{through.__name__}",
+    )
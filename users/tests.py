@@ -1,3 +1,174 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.settings import PATH_BASE
+from helpers.cache import MenuCache, ReferenceCache
+from payroll.models import DeductionXuser
+from payroll.seeding import DataSeeder
+from users.menu import MenuTree
+from users.models import MenuOptions, MenuOptonXroles, RolesUsers, User
+
+
+class UsersTestCase(TestCase):
+    EMPLOYEES = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        ReferenceCache.clear()
+        cls.admin = User.objects.create(
+            user_id=1,
+            name="Admin",
+            last_name="CompuPay",
+            email="admin@compupay.test",
+            username="admin",
+            is_staff=True,
+            salary=Decimal("75000.00"),
+        )
+        DataSeeder(cls.admin, seed=14).seed(cls.EMPLOYEES)
+
+    def setUp(self):
+        ReferenceCache.clear()
+        MenuCache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class ListUsersTest(UsersTestCase):
+    CONDITION = [
+        {"field": "state", "operator": "=", "condition": "A", "dataType": "str"}
+    ]
+
+    def list_users(self, page_size: int, **data):
+        return self.client.post(
+            f"/{PATH_BASE}users/list_users?page=1&page_size={page_size}",
+            {"condition": self.CONDITION, **data},
+            format="json",
+        )
+
+    def count_queries(self, page_size: int, **data) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.list_users(page_size, **data)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_the_page(self):
+        self.count_queries(5)
+        self.assertEqual(self.count_queries(5), self.count_queries(40))
+
+    def test_prefetched_relations_match_the_rows(self):
+        response = self.list_users(40)
+        users = {user["USERNAME"]: user for user in response.json()["data"]}
+
+        for role_user in RolesUsers.objects.select_related("user_id")[:5]:
+            with self.subTest(username=role_user.user_id.username):
+                listed = users[role_user.user_id.username]
+                self.assertIn(
+                    role_user.rol_id_id, [role["ROL_ID"] for role in listed["ROLES"]]
+                )
+                self.assertEqual(
+                    sorted(listed["DEDUCTIONS"]),
+                    sorted(
+                        DeductionXuser.objects.filter(
+                            user=role_user.user_id.username
+                        ).values_list("deduction_id", flat=True)
+                    ),
+                )
+
+    def get_fields(self, response) -> set[str]:
+        return {field.lower() for field in response.json()["data"][0]}
+
+    def test_sparse_fields_do_not_grow_with_the_page(self):
+        fields = ["username", "roles", "department"]
+        self.count_queries(5, fields=fields)
+        self.assertEqual(
+            self.count_queries(5, fields=fields), self.count_queries(40, fields=fields)
+        )
+
+    def test_salary_is_only_returned_when_requested(self):
+        fields = self.get_fields(self.list_users(5))
+        self.assertNotIn("salary", fields)
+        self.assertNotIn("password", fields)
+
+        fields = self.get_fields(self.list_users(5, fields=["USERNAME", "SALARY"]))
+        self.assertEqual(fields, {"username", "salary"})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.list_users(5, fields=["username", "password"])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", response.json()["error"])
+
+    def test_sparse_fields_narrow_the_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.list_users(5, fields=["username"])
+
+        selected = " ".join(
+            query["sql"] for query in queries if '"USERS"' in query["sql"].upper()
+        ).upper()
+        self.assertNotIn('"SALARY"', selected)
+
+
+class MenuTreeTest(UsersTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        role_user = RolesUsers.objects.select_related("rol_id", "user_id").first()
+        cls.role = role_user.rol_id
+        cls.employee = role_user.user_id
+
+        cls.options = []
+        for order, name in enumerate(("Nómina", "Usuarios"), start=1):
+            option = MenuOptions.objects.create(
+                name=name,
+                description=name,
+                type="group",
+                order=order,
+                created_by=cls.admin,
+            )
+            MenuOptions.objects.create(
+                name=f"Lista de {name.lower()}",
+                description=name,
+                type="link",
+                order=1,
+                parent_id=option,
+                created_by=cls.admin,
+            )
+            cls.options.append(option)
+        MenuOptonXroles.objects.create(
+            option_id=cls.options[0], rol_id=cls.role, created_by=cls.admin
+        )
+
+    def get_menu(self, user: User) -> list[dict]:
+        self.client.force_authenticate(user)
+        response = self.client.get(f"/{PATH_BASE}users/menu_options/")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def test_options_are_visible_through_the_roles(self):
+        menu = self.get_menu(self.employee)
+
+        self.assertEqual(
+            [option["key"] for option in menu], [self.options[0].menu_option_id]
+        )
+        self.assertEqual(len(menu[0]["children"]), 1)
+        self.assertEqual(self.get_menu(self.admin), [])
+
+    def test_warm_load_runs_no_queries(self):
+        MenuTree.for_user(self.employee)
+
+        with self.assertNumQueries(0):
+            menu = MenuTree.for_user(self.employee)
+        self.assertEqual(len(menu), 1)
+
+    def test_role_change_refreshes_the_menu(self):
+        MenuTree.for_user(self.employee)
+        MenuOptonXroles.objects.create(
+            option_id=self.options[1], rol_id=self.role, created_by=self.admin
+        )
+
+        self.assertEqual(len(MenuTree.for_user(self.employee)), 2)
@@ -17,6 +17,7 @@ from helpers.exceptions import (
     UserException,
     viewException,
 )
+from helpers.query_budget import query_budget
 from helpers.serializers import DynamicSerializer, PaginationSerializer
 from helpers.utils import (
     advanced_query_filter,
@@ -25,22 +26,19 @@ from helpers.utils import (
     simple_query_filter,
 )
 from payroll.models import DeductionXuser
+from users.menu import MenuTree
 from users.models import (
     STATE_CHOICES,
     ActivityLog,
     Department,
-    MenuOptions,
-    OperationsMeneOptions,
     Parameters,
     PermissionsRoles,
     Roles,
     RolesUsers,
     User,
-    UserPermission,
 )
 from users.serializers import (
     AuthenticateUserSerializer,
-    MenuOptionsSerializer,
     RolesSerializer,
     UserSerializer,
 )
@@ -190,14 +188,16 @@ class UserViewSet(ViewSet):
 
         return Response({"message": "Password changed successfully"})
 
+    @query_budget(8)
     @viewException
     def get_list_users(self, request):
         """
         Return a list of users.\n
+        `FIELDS` is an optional list with the fields to return.\n
         `METHOD`: POST
         """
         conditions: list[dict] = request.data.get("condition", None)
-        fields = list_values_to_lower(request.data.get("fields", None))
+        fields: list[str] = request.data.get("fields", None)
 
         if not conditions:
             raise PayloadValidationError("The condition are required")
@@ -212,17 +212,13 @@ class UserViewSet(ViewSet):
             users = users.exclude(**exclude)
 
         paginator = PaginationSerializer(request=request)
-        page = paginator.paginate_queryset(users.distinct(), request)
-
-        serializer = []
-        if fields:
-            if not isinstance(fields, list):
-                raise PayloadValidationError("Invalid format for field 'FIELDS'")
-            serializer = DynamicSerializer(
-                model=User, fields=fields, instance=page, many=True
-            )
-        else:
-            serializer = UserSerializer(page, many=True, context={"request": request})
+
+        users = UserSerializer.prefetch(users.distinct(), fields)
+        page = paginator.paginate_queryset(UserSerializer.only(users, fields), request)
+
+        serializer = UserSerializer(
+            page, many=True, fields=fields, context={"request": request}
+        )
 
         return paginator.get_paginated_response(serializer.data)
 
@@ -613,33 +609,4 @@ class MenuOptionsViewSet(ViewSet):
         Return a list of menu options.\n
         `METHOD`: GET
         """
-        user_id = request.user.user_id
-        user = User.objects.get(user_id=user_id)
-        if not user:
-            raise UserDoesNotExist(f"User with id: '{user_id}' was not found.")
-
-        roles = user.roles.all().values_list("rol_id", flat=True)
-
-        user = User.objects.get(user_id=user_id)
-
-        user_permissions = UserPermission.objects.filter(
-            Q(user_id=user_id) & Q(state=UserPermission.ACTIVE)
-        ).values_list("id", flat=True)
-
-        opration_menu_options = OperationsMeneOptions.objects.filter(
-            Q(user_permission_id__in=user_permissions)
-            & Q(state=OperationsMeneOptions.ACTIVE)
-        ).values_list("menu_option_id", flat=True)
-
-        menu_options = MenuOptions.objects.filter(
-            Q(
-                Q(menu_option_id__in=opration_menu_options)
-                | Q(menuoptonxroles__rol_id__in=roles)
-                | Q(userpermission__user_id=user)
-            )
-            & Q(state=MenuOptions.ACTIVE)
-            & Q(parent_id__isnull=True)
-        ).distinct()
-
-        serializer = MenuOptionsSerializer(menu_options, many=True)
-        return Response({"data": serializer.data})
+        return Response({"data": MenuTree.for_user(request.user)})